@@ -0,0 +1,117 @@
+"""
+Бенчмарк списка истории и обновления статуса до и после выноса больших полей
+
+Использование:
+    python benchmarks/analysis_payloads.py --user-id <uuid> --analysis-id <uuid> --output before.json
+    (выполнить supabase_migration_analysis_payloads.sql)
+    python benchmarks/analysis_payloads.py --user-id <uuid> --analysis-id <uuid> --compare before.json
+
+Замеряются три запроса к рабочей базе: список истории через select("*") -
+как его делал /history до разделения, проекционный список с пагинацией по
+ключу и обновление статуса анализа (статус записывается тот же, данные не
+меняются). Для списка учитывается и размер ответа.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from uuid import UUID
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from src.database import AnalysisRepository, get_async_supabase_client
+from src.models import AnalysisUpdate
+
+
+async def measure(func, rounds: int) -> dict:
+    """Время выполнения func в миллисекундах (p50, p95) после прогрева"""
+    await func()
+
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await func()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings), 2),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 2)
+    }
+
+
+async def bench(user_id: UUID, analysis_id: UUID, rounds: int) -> dict:
+    """Замерить список истории и обновление статуса"""
+    repo = AnalysisRepository()
+
+    analysis = await repo.get_analysis(analysis_id)
+    if analysis is None:
+        raise SystemExit(f"Analysis {analysis_id} not found")
+
+    listing_query = lambda: repo._execute(repo.client.get_table(repo.table_name).select("*").eq(
+        "user_id", str(user_id)
+    ).order("uploaded_at", desc=True).limit(10))
+
+    listing = await listing_query()
+    projected, _ = await repo.list_user_analyses(user_id, limit=10)
+
+    return {
+        "list_select_all": {
+            **await measure(listing_query, rounds),
+            "response_bytes": len(json.dumps(listing.data, ensure_ascii=False).encode("utf-8"))
+        },
+        "list_projected": {
+            **await measure(lambda: repo.list_user_analyses(user_id, limit=10), rounds),
+            "response_bytes": len(json.dumps(
+                [item.model_dump(mode="json") for item in projected], ensure_ascii=False
+            ).encode("utf-8"))
+        },
+        "status_update": await measure(
+            lambda: repo.update_analysis(analysis_id, AnalysisUpdate(status=analysis.status)),
+            rounds
+        )
+    }
+
+
+def print_results(results: dict, baseline: dict = None):
+    """Вывести результаты (и изменение относительно baseline)"""
+    for name, values in results.items():
+        line = f"  {name:18} p50 {values['p50_ms']:8.2f} ms   p95 {values['p95_ms']:8.2f} ms"
+        if "response_bytes" in values:
+            line += f"   {values['response_bytes']:>9} bytes"
+
+        if baseline and name in baseline:
+            before = baseline[name]["p50_ms"]
+            line += f"   ({(1 - values['p50_ms'] / before) * 100:+.1f}% p50 saved)" if before else ""
+
+        print(line)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--user-id', type=UUID, required=True, help="Пользователь с историей анализов")
+    parser.add_argument('--analysis-id', type=UUID, required=True, help="Анализ для обновления статуса")
+    parser.add_argument('--rounds', type=int, default=30, help="Повторов каждого запроса")
+    parser.add_argument('--output', help="Сохранить результаты в JSON")
+    parser.add_argument('--compare', help="JSON с результатами предыдущего прогона")
+    args = parser.parse_args()
+
+    try:
+        results = await bench(args.user_id, args.analysis_id, args.rounds)
+    finally:
+        await get_async_supabase_client().aclose()
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+
+    print(f"Analysis history and status update ({args.rounds} rounds)")
+    print_results(results, baseline)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""
+Бенчмарк автовыбора языка OCR против постоянного rus+eng
+
+Использование:
+    python benchmarks/ocr_language.py --ru ./samples/ru --en ./samples/en
+
+Для каждой папки распознаются все изображения трижды: с фиксированным
+rus+eng, с автовыбором языка на холодном кэше шаблонов и на прогретом.
+Русские бланки и при автовыборе распознаются rus+eng (см. SCRIPT_LANGUAGES) -
+для них замеряется только цена определения письменности.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from src.file_processing import ocr
+from src.file_processing.ocr import OCRProcessor
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff'}
+
+
+async def run_set(images: list, auto_language: bool) -> float:
+    """Распознать набор изображений и вернуть затраченное время"""
+    processor = OCRProcessor()
+    processor.auto_language = auto_language and '+' in processor.language
+    
+    started = time.perf_counter()
+    for image_path in images:
+        await processor.extract_text_from_image(str(image_path))
+    return time.perf_counter() - started
+
+
+async def bench(label: str, folder: str):
+    """Сравнить режимы на одной папке с изображениями"""
+    images = sorted(p for p in Path(folder).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if not images:
+        print(f"{label}: no images in {folder}")
+        return
+    
+    fixed = await run_set(images, auto_language=False)
+    
+    ocr._template_languages.clear()
+    cold = await run_set(images, auto_language=True)
+    warm = await run_set(images, auto_language=True)
+    
+    print(f"{label} ({len(images)} images)")
+    print(f"  rus+eng fixed:     {fixed:8.2f}s  ({fixed / len(images):.2f}s/image)")
+    print(f"  auto, cold cache:  {cold:8.2f}s  ({(1 - cold / fixed) * 100:+.1f}% saved)")
+    print(f"  auto, warm cache:  {warm:8.2f}s  ({(1 - warm / fixed) * 100:+.1f}% saved)")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ru', help="Папка с русскоязычными бланками")
+    parser.add_argument('--en', help="Папка с англоязычными бланками")
+    args = parser.parse_args()
+    
+    if args.ru:
+        await bench("Russian-only", args.ru)
+    if args.en:
+        await bench("English-only", args.en)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
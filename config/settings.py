@@ -29,6 +29,14 @@ class Settings(BaseSettings):
     supabase_url: str = Field("https://demo.supabase.co", env="SUPABASE_URL")
     supabase_anon_key: str = Field("demo_anon_key", env="SUPABASE_ANON_KEY")
     supabase_service_role_key: str = Field("demo_service_key", env="SUPABASE_SERVICE_ROLE_KEY")
+    database_max_connections: int = Field(20, env="DATABASE_MAX_CONNECTIONS")
+    database_max_concurrency: int = Field(10, env="DATABASE_MAX_CONCURRENCY")  # Одновременных запросов
+    database_timeout: float = Field(10.0, env="DATABASE_TIMEOUT")  # Секунды на запрос
+    user_cache_size: int = Field(100000, env="USER_CACHE_SIZE")  # Пользователей в памяти, 0 - отключить
+    user_cache_ttl: int = Field(300, env="USER_CACHE_TTL")  # Секунды
+    medical_norms_refresh_interval: int = Field(3600, env="MEDICAL_NORMS_REFRESH_INTERVAL")  # Секунды, 0 - только при старте
+    analysis_payload_compression: bool = Field(False, env="ANALYSIS_PAYLOAD_COMPRESSION")  # zlib для текста OCR
+    analysis_payload_compress_min_bytes: int = Field(2048, env="ANALYSIS_PAYLOAD_COMPRESS_MIN_BYTES")
     
     # Application Configuration
     app_env: str = Field("development", env="APP_ENV")
@@ -44,6 +52,25 @@ class Settings(BaseSettings):
     max_file_size_mb: int = Field(20, env="MAX_FILE_SIZE_MB")
     supported_file_types: List[str] = Field(default=["pdf", "jpg", "jpeg", "png"])
     ocr_language: str = Field("rus+eng", env="OCR_LANGUAGE")
+    ocr_auto_language: bool = Field(True, env="OCR_AUTO_LANGUAGE")  # eng для латинских бланков, иначе полный набор
+    duplicate_policy: str = Field("off", env="DUPLICATE_POLICY")  # Похожие фото: off (обработать заново) / prompt
+    processing_memory_budget_mb: int = Field(512, env="PROCESSING_MEMORY_BUDGET_MB")
+    processing_max_concurrency: int = Field(2, env="PROCESSING_MAX_CONCURRENCY")
+    storage_archival_enabled: bool = Field(False, env="STORAGE_ARCHIVAL_ENABLED")  # Пережимать файлы перед сохранением
+    storage_archival_max_dimension: int = Field(3000, env="STORAGE_ARCHIVAL_MAX_DIMENSION")  # Пиксели
+    storage_archival_jpeg_quality: int = Field(90, env="STORAGE_ARCHIVAL_JPEG_QUALITY")
+    storage_content_addressed: bool = Field(False, env="STORAGE_CONTENT_ADDRESSED")  # Одинаковые файлы хранятся один раз (нужен supabase_functions.sql)
+    storage_backend: str = Field("supabase", env="STORAGE_BACKEND")  # supabase / local
+    local_storage_path: str = Field("./storage", env="LOCAL_STORAGE_PATH")
+    local_storage_signing_key: str = Field("", env="LOCAL_STORAGE_SIGNING_KEY")  # Обязателен для local
+    local_storage_base_url: str = Field("http://localhost:8000/storage/v1", env="LOCAL_STORAGE_BASE_URL")  # Адрес веб-приложения + /storage/v1
+    storage_bucket_check_interval: int = Field(3600, env="STORAGE_BUCKET_CHECK_INTERVAL")  # Секунды
+    storage_max_connections: int = Field(20, env="STORAGE_MAX_CONNECTIONS")
+    storage_max_concurrency: int = Field(8, env="STORAGE_MAX_CONCURRENCY")  # Одновременных передач
+    storage_timeout: float = Field(60.0, env="STORAGE_TIMEOUT")  # Секунды
+    storage_retention_batch_size: int = Field(100, env="STORAGE_RETENTION_BATCH_SIZE")
+    storage_retention_batch_delay: float = Field(0.5, env="STORAGE_RETENTION_BATCH_DELAY")  # Секунды
+    storage_usage_reconcile_interval: int = Field(86400, env="STORAGE_USAGE_RECONCILE_INTERVAL")  # Секунды, 0 - отключить
     
     # Monitoring
     sentry_dsn: str = Field("", env="SENTRY_DSN")
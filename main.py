@@ -131,6 +131,9 @@ async def main():
         else:
             # Запускаем в режиме polling (для разработки)
             logger.info("🔄 Starting bot in polling mode")
+            if settings.storage_backend == "local" or not settings.supabase_url.startswith("https://demo"):
+                from src.file_processing.storage import get_storage_manager
+                await get_storage_manager().verify_bucket()
             await bot.start_polling()
             
         # Если дошли сюда, всё прошло успешно
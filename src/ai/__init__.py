@@ -4,8 +4,12 @@ AI модуль для анализа медицинских данных
 
 from .analyzer import MedicalAnalyzer
 from .prompts import PromptManager
+from .trends import BiomarkerTrend, compute_trends, get_user_trends
 
 __all__ = [
     "MedicalAnalyzer",
     "PromptManager",
+    "BiomarkerTrend",
+    "compute_trends",
+    "get_user_trends",
 ] 
\ No newline at end of file
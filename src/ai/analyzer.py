@@ -3,15 +3,21 @@ AI анализатор медицинских данных
 """
 import json
 import logging
+from datetime import datetime, timezone
 from typing import List, Dict, Any, Optional
 from openai import OpenAI
+from pydantic import ValidationError
 from config.settings import settings
 from src.models import (
-    BiomarkerResult, BiomarkerStatus, 
-    Recommendation, RecommendationType, RecommendationPriority,
-    User
+    BiomarkerResult, BiomarkerStatus, BiomarkerCreate, BiomarkerPoint,
+    Recommendation, RecommendationType, RecommendationPriority, RecommendationCreate,
+    AnalysisUpdate, AnalysisStatus,
+    MedicalNorm, User
 )
+from src.database import AnalysisRepository, BiomarkerRepository, UserRepository, get_medical_norm_index
+from src.utils.medical_data import canonical_biomarker_name
 from .prompts import PromptManager
+from .trends import get_user_trends
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +30,7 @@ class MedicalAnalyzer:
         self.prompt_manager = PromptManager()
         self.model = settings.openai_model
         self.max_tokens = settings.openai_max_tokens
+        self.analysis_repository = AnalysisRepository()
     
     async def extract_biomarkers(self, extracted_text: str) -> List[Dict[str, Any]]:
         """Извлечь биомаркеры из текста анализа"""
@@ -62,18 +69,22 @@ class MedicalAnalyzer:
     ) -> List[BiomarkerResult]:
         """Интерпретировать биомаркеры"""
         interpreted_biomarkers = []
+        norms = await self._lookup_norms(biomarkers, user)
         
         for biomarker_data in biomarkers:
             try:
+                norm = norms.get(biomarker_data.get("name", ""))
+                
                 # Определяем статус относительно нормы
-                status = await self._determine_biomarker_status(biomarker_data, user)
+                status = await self._determine_biomarker_status(biomarker_data, user, norm)
                 
                 # Создаем интерпретацию
                 interpretation = await self._generate_biomarker_interpretation(
                     biomarker_data, status, user
                 )
                 
-                biomarker = BiomarkerResult(
+                # Без валидации: id и даты еще нет, они появятся при сохранении
+                biomarker = BiomarkerResult.model_construct(
                     id=None,  # Будет установлен при сохранении в БД
                     analysis_id=None,  # Будет установлен позже
                     name=biomarker_data.get("name", ""),
@@ -83,6 +94,8 @@ class MedicalAnalyzer:
                     status=status,
                     interpretation=interpretation,
                     numeric_value=self._extract_numeric_value(biomarker_data.get("value", "")),
+                    normal_min=norm.min_value if norm else None,
+                    normal_max=norm.max_value if norm else None,
                     created_at=None  # Будет установлено при сохранении
                 )
                 
@@ -97,11 +110,13 @@ class MedicalAnalyzer:
     async def generate_recommendations(
         self, 
         biomarkers: List[BiomarkerResult], 
-        user: Optional[User] = None
+        user: Optional[User] = None,
+        analysis=None
     ) -> List[Recommendation]:
-        """Генерировать персонализированные рекомендации"""
+        """Генерировать персонализированные рекомендации (analysis - текущий, еще не сохраненный анализ)"""
         try:
-            prompt = self.prompt_manager.get_recommendations_prompt(biomarkers, user)
+            trends = await self._describe_trends(biomarkers, user, analysis)
+            prompt = self.prompt_manager.get_recommendations_prompt(biomarkers, user, trends)
             
             response = self.client.chat.completions.create(
                 model=self.model,
@@ -128,6 +143,78 @@ class MedicalAnalyzer:
             logger.error(f"Error generating recommendations: {e}")
             return []
     
+    async def _describe_trends(
+        self, 
+        biomarkers: List[BiomarkerResult], 
+        user: Optional[User],
+        analysis=None
+    ) -> Optional[str]:
+        """Динамика показателей анализа по истории пользователя - строки для промпта"""
+        if not user or not biomarkers:
+            return None
+        
+        try:
+            # Анализ сохраняется после рекомендаций: его значения добавляются к истории,
+            # чтобы последним значением в динамике было текущее
+            trends = await get_user_trends(
+                user, 
+                [biomarker.name for biomarker in biomarkers], 
+                current=self._current_points(biomarkers, analysis)
+            )
+            # Одна точка (первое измерение) - это еще не динамика
+            lines = [f"- {trend.describe()}" for trend in trends.values() if trend.points > 1]
+            
+        except Exception as e:
+            logger.error(f"Error computing biomarker trends: {e}")
+            lines = []
+        
+        lines += await self._describe_other_latest(biomarkers, user)
+        return "\n".join(lines) if lines else None
+    
+    def _current_points(self, biomarkers: List[BiomarkerResult], analysis) -> List[BiomarkerPoint]:
+        """Точки динамики из показателей текущего анализа"""
+        if analysis is None or getattr(analysis, "id", None) is None:
+            return []
+        
+        measured_at = getattr(analysis, "uploaded_at", None) or datetime.now(timezone.utc)
+        return [
+            BiomarkerPoint(
+                biomarker_key=canonical_biomarker_name(biomarker.name),
+                name=biomarker.name,
+                measured_at=measured_at,
+                value=str(biomarker.value),
+                numeric_value=biomarker.numeric_value,
+                unit=biomarker.unit,
+                status=biomarker.status,
+                analysis_id=analysis.id
+            )
+            for biomarker in biomarkers
+            if biomarker.name
+        ]
+    
+    async def _describe_other_latest(
+        self, 
+        biomarkers: List[BiomarkerResult], 
+        user: User, 
+        limit: int = 10
+    ) -> List[str]:
+        """Показатели вне нормы из прошлых анализов, которых нет в текущем (по снимку последних значений)"""
+        try:
+            current = {canonical_biomarker_name(biomarker.name) for biomarker in biomarkers}
+            latest = await BiomarkerRepository().get_latest(user.id)
+            
+            return [
+                f"- {item.name}: {item.value} {item.unit or ''} "
+                f"(статус: {item.status.value}, {item.measured_at.strftime('%d.%m.%Y')})"
+                for item in latest
+                if item.biomarker_key not in current
+                and item.status not in (BiomarkerStatus.NORMAL, BiomarkerStatus.UNKNOWN)
+            ][:limit]
+            
+        except Exception as e:
+            logger.error(f"Error getting latest biomarkers: {e}")
+            return []
+    
     async def analyze_results(self, analysis) -> List[Recommendation]:
         """Полный анализ результатов"""
         try:
@@ -139,17 +226,22 @@ class MedicalAnalyzer:
                 return []
             
             # 2. Интерпретируем биомаркеры
-            user = await self._get_user_by_analysis_id(analysis.id)
+            user = await self._get_user(analysis.user_id)
             biomarkers = await self.interpret_biomarkers(biomarkers_data, user)
             
-            # 3. Сохраняем биомаркеры в БД
-            await self._save_biomarkers(analysis.id, biomarkers)
-            
-            # 4. Генерируем рекомендации
-            recommendations = await self.generate_recommendations(biomarkers, user)
+            # 3. Генерируем рекомендации
+            recommendations = await self.generate_recommendations(biomarkers, user, analysis)
             
-            # 5. Сохраняем рекомендации в БД
-            await self._save_recommendations(analysis.id, recommendations)
+            # 4. Сохраняем анализ, биомаркеры и рекомендации одной транзакцией.
+            # Без сохранения рекомендации не отдаем: анализ помечается FAILED
+            try:
+                await self._save_results(
+                    analysis.id, biomarkers, recommendations, extracted_text=analysis.extracted_text
+                )
+            except Exception as e:
+                logger.error(f"Error saving analysis results: {e}")
+                await self._mark_failed(analysis.id, "Не удалось сохранить результаты анализа")
+                return []
             
             return recommendations
             
@@ -157,20 +249,39 @@ class MedicalAnalyzer:
             logger.error(f"Error in analyze_results: {e}")
             return []
     
+    async def _lookup_norms(
+        self, 
+        biomarkers: List[Dict[str, Any]], 
+        user: Optional[User]
+    ) -> Dict[str, Optional[MedicalNorm]]:
+        """Нормы для всей панели одним обращением к индексу в памяти"""
+        try:
+            index = get_medical_norm_index()
+            await index.ensure_loaded()
+            
+            return index.lookup_panel(
+                (biomarker.get("name", "") for biomarker in biomarkers),
+                gender=user.gender if user else None,
+                age=user.age if user else None
+            )
+            
+        except Exception as e:
+            logger.error(f"Error looking up medical norms: {e}")
+            return {}
+    
     async def _determine_biomarker_status(
         self, 
         biomarker_data: Dict[str, Any], 
-        user: Optional[User]
+        user: Optional[User],
+        norm: Optional[MedicalNorm] = None
     ) -> BiomarkerStatus:
         """Определить статус биомаркера относительно нормы"""
         try:
-            # Здесь можно добавить логику сравнения с медицинскими нормами из БД
-            # Пока используем простую ИИ-интерпретацию
-            
+            # Приоритет у референсного диапазона лаборатории, иначе - норма из БД
             value = biomarker_data.get("value", "")
             reference_range = biomarker_data.get("reference_range", "")
             
-            if not value or not reference_range:
+            if not value:
                 return BiomarkerStatus.UNKNOWN
             
             # Простая логика определения статуса
@@ -179,20 +290,30 @@ class MedicalAnalyzer:
                 return BiomarkerStatus.UNKNOWN
             
             # Парсим референсный диапазон
-            normal_range = self._parse_reference_range(reference_range)
+            normal_range = self._parse_reference_range(reference_range) if reference_range else None
+            critical_low = critical_high = None
+            
+            if not normal_range and norm and norm.min_value is not None and norm.max_value is not None:
+                normal_range = (norm.min_value, norm.max_value)
+                critical_low, critical_high = norm.critical_low, norm.critical_high
+            
             if not normal_range:
                 return BiomarkerStatus.UNKNOWN
             
             min_val, max_val = normal_range
             
+            # Без критических значений в норме - < 70% от минимума и > 130% от максимума
+            if critical_low is None:
+                critical_low = min_val * 0.7
+            if critical_high is None:
+                critical_high = max_val * 1.3
+            
             if numeric_value < min_val:
-                # Проверяем критически низкий уровень (< 70% от минимума)
-                if numeric_value < min_val * 0.7:
+                if numeric_value < critical_low:
                     return BiomarkerStatus.CRITICAL_LOW
                 return BiomarkerStatus.LOW
             elif numeric_value > max_val:
-                # Проверяем критически высокий уровень (> 130% от максимума)
-                if numeric_value > max_val * 1.3:
+                if numeric_value > critical_high:
                     return BiomarkerStatus.CRITICAL_HIGH
                 return BiomarkerStatus.HIGH
             else:
@@ -261,7 +382,7 @@ class MedicalAnalyzer:
         
         for rec_data in recommendations_data:
             try:
-                recommendation = Recommendation(
+                recommendation = Recommendation.model_construct(
                     id=None,  # Будет установлен при сохранении
                     analysis_id=None,  # Будет установлен позже
                     recommendation_text=rec_data.get("text", ""),
@@ -281,17 +402,99 @@ class MedicalAnalyzer:
         
         return recommendations
     
-    async def _get_user_by_analysis_id(self, analysis_id) -> Optional[User]:
-        """Получить пользователя по ID анализа"""
-        # TODO: Реализовать получение пользователя из БД
-        return None
+    async def _get_user(self, user_id) -> Optional[User]:
+        """Получить владельца анализа (через кэш пользователей)"""
+        if not user_id:
+            return None
+        
+        try:
+            return await UserRepository().get_user_by_id(user_id)
+            
+        except Exception as e:
+            logger.error(f"Error getting user {user_id}: {e}")
+            return None
     
-    async def _save_biomarkers(self, analysis_id, biomarkers: List[BiomarkerResult]):
-        """Сохранить биомаркеры в БД"""
-        # TODO: Реализовать сохранение в БД
-        pass
+    async def _save_results(
+        self, 
+        analysis_id, 
+        biomarkers: List[BiomarkerResult], 
+        recommendations: List[Recommendation],
+        extracted_text: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Сохранить итог анализа одним вызовом (всё или ничего, ошибка пробрасывается)"""
+        saved = await self.analysis_repository.save_analysis_results(
+            analysis_id,
+            AnalysisUpdate(status=AnalysisStatus.COMPLETED, extracted_text=extracted_text),
+            self._biomarker_creates(analysis_id, biomarkers),
+            self._recommendation_creates(analysis_id, recommendations)
+        )
+        logger.info(
+            f"Saved analysis {analysis_id}: {saved['results']} biomarkers, "
+            f"{saved['recommendations']} recommendations"
+        )
+        return saved
     
-    async def _save_recommendations(self, analysis_id, recommendations: List[Recommendation]):
-        """Сохранить рекомендации в БД"""
-        # TODO: Реализовать сохранение в БД
-        pass 
\ No newline at end of file
+    async def _mark_failed(self, analysis_id, error_message: str):
+        """Пометить анализ как FAILED (результаты не сохранены)"""
+        try:
+            await self.analysis_repository.update_analysis(
+                analysis_id,
+                AnalysisUpdate(status=AnalysisStatus.FAILED, error_message=error_message)
+            )
+        except Exception as e:
+            logger.error(f"Error marking analysis {analysis_id} as failed: {e}")
+    
+    def _biomarker_creates(self, analysis_id, biomarkers: List[BiomarkerResult]) -> List[BiomarkerCreate]:
+        """
+        Биомаркеры для записи в БД
+        
+        Поля приходят из ответа LLM без валидации: показатель, который не
+        проходит модель, пропускается, чтобы не отклонить всё сохранение.
+        """
+        fields = set(BiomarkerCreate.model_fields) - {"analysis_id"}
+        creates = []
+        
+        for biomarker in biomarkers:
+            data = {field: getattr(biomarker, field, None) for field in fields}
+            if isinstance(data["value"], (int, float)):
+                data["value"] = str(data["value"])
+            
+            try:
+                creates.append(BiomarkerCreate(analysis_id=analysis_id, **data))
+            except ValidationError as e:
+                logger.warning(f"Skipping invalid biomarker {data.get('name')!r}: {e}")
+        
+        return creates
+    
+    def _recommendation_creates(
+        self, 
+        analysis_id, 
+        recommendations: List[Recommendation]
+    ) -> List[RecommendationCreate]:
+        """
+        Рекомендации для записи в БД
+        
+        Уверенность приводится к диапазону 0..1, рекомендация с другими
+        некорректными полями пропускается.
+        """
+        fields = set(RecommendationCreate.model_fields) - {"analysis_id"}
+        creates = []
+        
+        for recommendation in recommendations:
+            data = {field: getattr(recommendation, field, None) for field in fields}
+            data["confidence_score"] = self._clamp_confidence(data["confidence_score"])
+            
+            try:
+                creates.append(RecommendationCreate(analysis_id=analysis_id, **data))
+            except ValidationError as e:
+                logger.warning(f"Skipping invalid recommendation {data.get('recommendation_text')!r}: {e}")
+        
+        return creates
+    
+    @staticmethod
+    def _clamp_confidence(value) -> Optional[float]:
+        """Уверенность LLM в диапазоне 0..1 (None, если это не число)"""
+        try:
+            return min(max(float(value), 0.0), 1.0)
+        except (TypeError, ValueError):
+            return None
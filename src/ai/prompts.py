@@ -85,9 +85,10 @@ class PromptManager:
     def get_recommendations_prompt(
         self, 
         biomarkers: List[BiomarkerResult], 
-        user: Optional[User] = None
+        user: Optional[User] = None,
+        trends: Optional[str] = None
     ) -> str:
-        """Промпт для генерации рекомендаций"""
+        """Промпт для генерации рекомендаций (trends - динамика по прошлым анализам)"""
         
         # Формируем информацию о пользователе
         user_info = "Пол и возраст не указаны"
@@ -103,13 +104,20 @@ class PromptManager:
             for b in biomarkers
         ])
         
+        trends_text = ""
+        if trends:
+            trends_text = f"""
+ДИНАМИКА ПО ПРЕДЫДУЩИМ АНАЛИЗАМ:
+{trends}
+"""
+        
         return f"""
 ДАННЫЕ ПАЦИЕНТА:
 {user_info}
 
 РЕЗУЛЬТАТЫ АНАЛИЗОВ:
 {biomarkers_text}
-
+{trends_text}
 ЗАДАЧА:
 Проанализируй результаты и дай персонализированные рекомендации по улучшению здоровья.
 
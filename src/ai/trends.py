@@ -0,0 +1,234 @@
+"""
+Динамика показателей пользователя: наклон, изменение, z-оценка, серии вне нормы
+"""
+import logging
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
+
+from src.models import BiomarkerPoint, BiomarkerStatus, User
+
+logger = logging.getLogger(__name__)
+
+DAYS_PER_MONTH = 30.0
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_NORMAL_STATUSES = {BiomarkerStatus.NORMAL, BiomarkerStatus.UNKNOWN}
+
+
+@dataclass
+class BiomarkerTrend:
+    """Динамика одного показателя"""
+    biomarker_key: str
+    name: str
+    unit: Optional[str]
+    points: int
+    first_at: datetime
+    last_at: datetime
+    first_value: float
+    latest_value: float
+    previous_value: Optional[float]
+    slope_per_month: Optional[float]  # Наклон линейной регрессии, единиц за 30 дней
+    percent_change: Optional[float]  # От первого значения к последнему
+    z_score: Optional[float]  # Последнее значение относительно собственной истории
+    range_distance: Optional[float]  # Выход за норму в долях ширины нормы, 0 - в норме
+    out_of_range_streak: int  # Сколько последних измерений подряд вне нормы
+    direction: str  # rising, falling, stable
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Динамика в виде словаря"""
+        data = asdict(self)
+        data["first_at"] = self.first_at.isoformat()
+        data["last_at"] = self.last_at.isoformat()
+        return data
+
+    def describe(self) -> str:
+        """Одна строка для промпта, отчета или напоминания"""
+        unit = f" {self.unit}" if self.unit else ""
+        text = f"{self.name}: {_format_number(self.first_value)} → {_format_number(self.latest_value)}{unit}"
+
+        if self.percent_change is not None:
+            text += f" ({self.percent_change:+.1f}% за {self.points} изм.)"
+
+        text += {"rising": ", растет", "falling": ", снижается"}.get(self.direction, ", стабильно")
+
+        if self.out_of_range_streak:
+            text += f", вне нормы {self.out_of_range_streak} раз(а) подряд"
+        return text
+
+
+def compute_trends(
+    series: Dict[str, List[BiomarkerPoint]],
+    ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+    stable_threshold: float = 0.05
+) -> Dict[str, BiomarkerTrend]:
+    """
+    Рассчитать динамику всех показателей одним проходом по массивам NumPy
+
+    Ряды выравниваются по правому краю в матрицу (показатели x измерения),
+    пропуски - NaN, поэтому последнее измерение каждого ряда находится в
+    последнем столбце. Учитываются только точки с числовым значением.
+
+    Args:
+        series: {ключ показателя: точки по возрастанию даты} (BiomarkerRepository.get_series)
+        ranges: {ключ показателя: (min, max)} - нормы; без нормы выход за нее
+            определяется по статусу точки
+        stable_threshold: изменение по линии тренда (в долях среднего),
+            ниже которого показатель считается стабильным
+    """
+    rows = []
+    for key, points in series.items():
+        numeric = [point for point in points if point.numeric_value is not None]
+        if numeric:
+            rows.append((key, numeric))
+
+    if not rows:
+        return {}
+
+    count = len(rows)
+    width = max(len(points) for _, points in rows)
+
+    days = np.full((count, width), np.nan)
+    values = np.full((count, width), np.nan)
+    out_by_status = np.zeros((count, width), dtype=bool)
+    low = np.full(count, np.nan)
+    high = np.full(count, np.nan)
+
+    for i, (key, points) in enumerate(rows):
+        start = width - len(points)
+        days[i, start:] = [(point.measured_at - _EPOCH).total_seconds() / 86400 for point in points]
+        values[i, start:] = [point.numeric_value for point in points]
+        out_by_status[i, start:] = [point.status not in _NORMAL_STATUSES for point in points]
+
+        if ranges and key in ranges:
+            range_min, range_max = ranges[key]
+            low[i] = np.nan if range_min is None else range_min
+            high[i] = np.nan if range_max is None else range_max
+
+    valid = ~np.isnan(values)
+    counts = valid.sum(axis=1)
+    row_index = np.arange(count)
+
+    latest = values[:, -1]
+    first = values[row_index, width - counts]
+    previous = np.where(counts > 1, values[:, -2] if width > 1 else np.nan, np.nan)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Линейная регрессия значения по времени (дни)
+        mean_x = np.nanmean(days, axis=1)
+        mean_y = np.nanmean(values, axis=1)
+        dx = np.where(valid, days - mean_x[:, None], 0.0)
+        dy = np.where(valid, values - mean_y[:, None], 0.0)
+        sxx = (dx * dx).sum(axis=1)
+        slope = np.where(sxx > 0, (dx * dy).sum(axis=1) / sxx, np.nan)
+
+        percent = np.where((counts > 1) & (first != 0), (latest - first) / np.abs(first) * 100, np.nan)
+
+        std = np.sqrt((dy * dy).sum(axis=1) / counts)
+        z_score = np.where((counts > 1) & (std > 0), (latest - mean_y) / std, np.nan)
+
+        # Выход за норму: по числовой норме, если она известна, иначе по статусу
+        has_range = ~np.isnan(low) | ~np.isnan(high)
+        out_by_range = valid & ((values < low[:, None]) | (values > high[:, None]))
+        out_of_range = np.where(has_range[:, None], out_by_range, out_by_status & valid)
+        streak = np.cumprod(out_of_range[:, ::-1], axis=1).sum(axis=1)
+
+        span = np.where(np.isnan(high - low), np.nan, high - low)
+        below = np.where(latest < low, (low - latest) / span, 0.0)
+        above = np.where(latest > high, (latest - high) / span, 0.0)
+        distance = np.where(has_range & (span > 0), below + above, np.nan)
+
+        # Изменение по линии тренда за весь период относительно среднего уровня
+        period = np.nanmax(days, axis=1) - np.nanmin(days, axis=1)
+        relative = np.where(mean_y != 0, slope * period / np.abs(mean_y), np.nan)
+
+    trends = {}
+    for i, (key, points) in enumerate(rows):
+        direction = "stable"
+        if not np.isnan(relative[i]) and abs(relative[i]) >= stable_threshold:
+            direction = "rising" if relative[i] > 0 else "falling"
+
+        trends[key] = BiomarkerTrend(
+            biomarker_key=key,
+            name=points[-1].name,
+            unit=points[-1].unit,
+            points=int(counts[i]),
+            first_at=points[0].measured_at,
+            last_at=points[-1].measured_at,
+            first_value=float(first[i]),
+            latest_value=float(latest[i]),
+            previous_value=_optional(previous[i]),
+            slope_per_month=_optional(slope[i] * DAYS_PER_MONTH),
+            percent_change=_optional(percent[i]),
+            z_score=_optional(z_score[i]),
+            range_distance=_optional(distance[i]),
+            out_of_range_streak=int(streak[i]),
+            direction=direction
+        )
+
+    return trends
+
+
+async def get_user_trends(
+    user: User,
+    biomarkers: Optional[List[str]] = None,
+    since: Optional[datetime] = None,
+    current: Optional[List[BiomarkerPoint]] = None
+) -> Dict[str, BiomarkerTrend]:
+    """
+    Динамика показателей пользователя с нормами по его полу и возрасту
+
+    current - точки еще не сохраненного анализа: добавляются к истории
+    (вместо точек того же анализа, если он обрабатывается повторно)
+    """
+    from src.database import BiomarkerRepository, get_medical_norm_index
+
+    series = await BiomarkerRepository().get_series(user.id, biomarkers, since)
+    if current:
+        series = merge_points(series, current)
+    if not series:
+        return {}
+
+    ranges = {}
+    try:
+        index = get_medical_norm_index()
+        await index.ensure_loaded()
+
+        for key, points in series.items():
+            norm = index.lookup(points[-1].name, user.gender, user.age)
+            if norm:
+                ranges[key] = (norm.min_value, norm.max_value)
+    except Exception as e:
+        logger.warning(f"Medical norms unavailable for trends, using statuses: {e}")
+
+    return compute_trends(series, ranges)
+
+
+def merge_points(
+    series: Dict[str, List[BiomarkerPoint]],
+    points: List[BiomarkerPoint]
+) -> Dict[str, List[BiomarkerPoint]]:
+    """Добавить точки анализа к рядам (точки того же анализа заменяются), порядок - по дате"""
+    merged = {key: list(values) for key, values in series.items()}
+    analysis_ids = {point.analysis_id for point in points}
+
+    for key in {point.biomarker_key for point in points}:
+        merged[key] = [point for point in merged.get(key, []) if point.analysis_id not in analysis_ids]
+
+    for point in points:
+        merged[point.biomarker_key].append(point)
+
+    for key in merged:
+        merged[key].sort(key=lambda point: point.measured_at)
+    return merged
+
+
+def _optional(value) -> Optional[float]:
+    """NaN -> None, округление для вывода"""
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+def _format_number(value: float) -> str:
+    """Число без лишних нулей"""
+    return f"{value:.2f}".rstrip("0").rstrip(".")
@@ -4,7 +4,7 @@ FastAPI веб-приложение для webhook режима Telegram бот
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
@@ -13,6 +13,10 @@ from telegram.ext import Application
 
 from config.settings import settings
 from src.bot.bot import MedicalBot
+from src.database import get_async_supabase_client, get_user_cache, get_medical_norm_index
+from src.file_processing.storage import get_storage_manager
+from src.file_processing.storage_backends import LocalStorageBackend, StorageError
+from src.utils.background import PeriodicTask
 from src.utils.logging_config import setup_logging, structured_logger
 
 logger = logging.getLogger(__name__)
@@ -21,6 +25,9 @@ logger = logging.getLogger(__name__)
 # Глобальная переменная для бота
 bot_application: Application = None
 
+# Периодические фоновые задачи
+periodic_tasks: list = []
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -31,6 +38,36 @@ async def lifespan(app: FastAPI):
         # Инициализация при старте
         logger.info("Starting FastAPI application...")
         
+        # Общий менеджер хранилища: bucket проверяется один раз при старте
+        if settings.storage_backend == "local" or not settings.supabase_url.startswith("https://demo"):
+            await get_storage_manager().verify_bucket()
+            
+            # Индекс медицинских норм: загрузка при старте и периодическое обновление
+            try:
+                await get_medical_norm_index().refresh()
+            except Exception as e:
+                logger.error(f"Failed to load medical norm index: {e}")
+            
+            if settings.medical_norms_refresh_interval > 0:
+                periodic_tasks.append(PeriodicTask(
+                    "medical_norms_refresh",
+                    get_medical_norm_index().refresh,
+                    interval=settings.medical_norms_refresh_interval,
+                    initial_delay=settings.medical_norms_refresh_interval
+                ))
+            
+            # Сверка счетчиков хранилища с фактическим содержимым bucket
+            if settings.storage_usage_reconcile_interval > 0:
+                periodic_tasks.append(PeriodicTask(
+                    "storage_usage_reconcile",
+                    get_storage_manager().reconcile_usage,
+                    interval=settings.storage_usage_reconcile_interval,
+                    initial_delay=60
+                ))
+            
+            for task in periodic_tasks:
+                task.start()
+        
         # Создаем и инициализируем бота
         medical_bot = MedicalBot()
         bot_application = medical_bot.create_application()
@@ -120,6 +157,20 @@ async def lifespan(app: FastAPI):
         # Очистка при остановке
         logger.info("Shutting down FastAPI application...")
         
+        for task in periodic_tasks:
+            await task.stop()
+        periodic_tasks.clear()
+        
+        try:
+            await get_storage_manager().close()
+        except Exception as e:
+            logger.error(f"Error closing storage connections: {e}")
+        
+        try:
+            await get_async_supabase_client().aclose()
+        except Exception as e:
+            logger.error(f"Error closing database connections: {e}")
+        
         if bot_application:
             try:
                 # Удаляем webhook
@@ -380,6 +431,26 @@ async def process_update(update: Update):
         logger.error(f"Error adding update to queue: {e}")
 
 
+@app.get("/storage/v1/object/sign/{object_key:path}")
+async def local_signed_object(object_key: str, request: Request):
+    """Файл по подписанной ссылке локального хранилища (STORAGE_BACKEND=local)"""
+    backend = get_storage_manager().backend
+    if not isinstance(backend, LocalStorageBackend):
+        raise HTTPException(status_code=404, detail="Not found")
+    
+    verified_key = backend.verify_signed_url(str(request.url))
+    if verified_key is None:
+        raise HTTPException(status_code=403, detail="Invalid or expired signature")
+    
+    bucket, _, path = verified_key.partition("/")
+    try:
+        file_path = backend.object_file(bucket, path)
+    except StorageError as e:
+        raise HTTPException(status_code=e.status_code or 404, detail=str(e))
+    
+    return FileResponse(file_path)
+
+
 @app.get("/stats")
 async def get_stats():
     """Получить статистику бота"""
@@ -392,6 +463,8 @@ async def get_stats():
         stats = {
             "bot_running": bot_application.running if bot_application else False,
             "webhook_url": webhook_url,
+            "user_cache": get_user_cache().get_stats(),
+            "medical_norms": get_medical_norm_index().get_stats(),
         }
         
         # Можно добавить дополнительную статистику из базы данных
@@ -1,20 +1,30 @@
 """
 Обработчики команд и сообщений Telegram бота
 """
+import base64
 import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+from uuid import UUID
+
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, 
     CallbackQueryHandler, filters, ContextTypes
 )
 
-from src.database import UserRepository, AnalysisRepository
-from src.models import UserCreate
+from src.database import UserRepository, AnalysisRepository, BiomarkerRepository
+from src.models import UserCreate, BiomarkerTrendSummary
 from src.ai.analyzer import MedicalAnalyzer
-from src.file_processing.processor import FileProcessor
+from src.file_processing.processor import get_file_processor
 
 logger = logging.getLogger(__name__)
 
+# История анализов: размер страницы и префикс callback_data кнопки "Дальше"
+HISTORY_PAGE_SIZE = 10
+HISTORY_CALLBACK_PREFIX = "h:"
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
@@ -25,17 +35,15 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_repo = UserRepository()
     
     try:
-        existing_user = await user_repo.get_user_by_telegram_id(user.id)
-        if not existing_user:
-            # Создаем нового пользователя
-            user_data = UserCreate(
-                telegram_id=user.id,
-                username=user.username,
-                first_name=user.first_name,
-                last_name=user.last_name
-            )
-            await user_repo.create_user(user_data)
-            logger.info(f"New user registered: {user.id}")
+        # Создаем пользователя или обновляем имя из Telegram одним запросом
+        user_data = UserCreate(
+            telegram_id=user.id,
+            username=user.username,
+            first_name=user.first_name,
+            last_name=user.last_name
+        )
+        db_user = await user_repo.upsert_user(user_data)
+        logger.info(f"User registered: {user.id} ({db_user.id})")
     
     except Exception as e:
         logger.error(f"Error registering user: {e}")
@@ -134,7 +142,7 @@ async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 **Статистика:**
 • Дата регистрации: {user.created_at.strftime('%d.%m.%Y')}
 • Статус: {'Активен' if user.is_active else 'Неактивен'}
-
+{await _latest_biomarkers_text(user.id)}
 Для более точных рекомендаций заполните данные о возрасте, поле и физических параметрах.
 """
         
@@ -154,11 +162,62 @@ async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Ошибка получения профиля.")
 
 
+async def _latest_biomarkers_text(user_id: UUID, limit: int = 5) -> str:
+    """Блок профиля с последними значениями показателей (сначала вне нормы)"""
+    try:
+        latest = await BiomarkerRepository().get_latest(user_id)
+    except Exception as e:
+        logger.error(f"Error getting latest biomarkers: {e}")
+        return ""
+    
+    if not latest:
+        return ""
+    
+    status_emoji = {
+        "normal": "✅",
+        "low": "🔽",
+        "high": "🔼",
+        "critical_low": "⚠️",
+        "critical_high": "⚠️"
+    }
+    abnormal = [b for b in latest if b.status.value not in ("normal", "unknown")]
+    shown = (abnormal + [b for b in latest if b not in abnormal])[:limit]
+    
+    # Изменение с прошлого измерения считается в БД только для показанных показателей
+    try:
+        summaries = await BiomarkerRepository().get_trend_summary(
+            user_id, [biomarker.biomarker_key for biomarker in shown]
+        )
+        changes = {summary.biomarker_key: summary for summary in summaries}
+    except Exception as e:
+        logger.error(f"Error getting biomarker trend summary: {e}")
+        changes = {}
+    
+    text = f"\n**Последние показатели:** {len(latest)} (вне нормы: {len(abnormal)})\n"
+    for biomarker in shown:
+        unit = f" {biomarker.unit}" if biomarker.unit else ""
+        text += (
+            f"{status_emoji.get(biomarker.status.value, '❓')} {biomarker.name}: "
+            f"{biomarker.value}{unit} ({biomarker.measured_at.strftime('%d.%m.%Y')})"
+            f"{_change_text(changes.get(biomarker.biomarker_key))}\n"
+        )
+    return text
+
+
+def _change_text(summary: Optional[BiomarkerTrendSummary]) -> str:
+    """Изменение показателя с прошлого измерения"""
+    if not summary or summary.delta is None or summary.previous_at is None:
+        return ""
+    
+    arrow = "↑" if summary.delta > 0 else "↓" if summary.delta < 0 else "→"
+    delta = f"{summary.delta:+.2f}".rstrip("0").rstrip(".")
+    return f", {arrow} {delta} с {summary.previous_at.strftime('%d.%m.%Y')}"
+
+
 async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /history"""
     user_id = update.effective_user.id
     user_repo = UserRepository()
-    analysis_repo = AnalysisRepository()
     
     try:
         user = await user_repo.get_user_by_telegram_id(user_id)
@@ -166,33 +225,104 @@ async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Пользователь не найден.")
             return
         
-        analyses = await analysis_repo.get_user_analyses(user.id, limit=10)
+        history_text, reply_markup = await _render_history_page(user.id)
         
-        if not analyses:
+        if not history_text:
             await update.message.reply_text("📋 У вас пока нет загруженных анализов.")
             return
         
-        history_text = "📊 **История ваших анализов:**\n\n"
-        
-        for i, analysis in enumerate(analyses, 1):
-            status_emoji = {
-                "completed": "✅",
-                "processing": "⏳",
-                "failed": "❌",
-                "pending": "🕐"
-            }.get(analysis.status, "❓")
-            
-            history_text += f"{i}. {status_emoji} **{analysis.original_filename}**\n"
-            history_text += f"   📅 {analysis.uploaded_at.strftime('%d.%m.%Y %H:%M')}\n"
-            history_text += f"   📋 Статус: {analysis.status}\n\n"
-        
-        await update.message.reply_text(history_text, parse_mode='Markdown')
+        await update.message.reply_text(history_text, parse_mode='Markdown', reply_markup=reply_markup)
         
     except Exception as e:
         logger.error(f"Error getting user history: {e}")
         await update.message.reply_text("❌ Ошибка получения истории.")
 
 
+async def history_page_callback(query):
+    """Следующая страница истории по кнопке "Дальше" """
+    try:
+        page, after = _decode_history_cursor(query.data)
+    except ValueError:
+        logger.warning(f"Invalid history callback data: {query.data}")
+        return
+    
+    try:
+        user = await UserRepository().get_user_by_telegram_id(query.from_user.id)
+        if not user:
+            return
+        
+        # Ключ страницы проверяется запросом только среди анализов этого пользователя
+        history_text, reply_markup = await _render_history_page(user.id, page, after)
+        if history_text:
+            await query.edit_message_text(history_text, parse_mode='Markdown', reply_markup=reply_markup)
+        
+    except Exception as e:
+        logger.error(f"Error getting user history page: {e}")
+
+
+async def _render_history_page(
+    user_id: UUID, 
+    page: int = 0, 
+    after: Optional[Tuple[datetime, UUID]] = None
+) -> Tuple[Optional[str], Optional[InlineKeyboardMarkup]]:
+    """Текст страницы истории и кнопка следующей страницы"""
+    analyses, next_key = await AnalysisRepository().list_user_analyses(
+        user_id, limit=HISTORY_PAGE_SIZE, after=after
+    )
+    
+    if not analyses:
+        return None, None
+    
+    history_text = "📊 **История ваших анализов:**\n\n"
+    
+    for i, analysis in enumerate(analyses, page * HISTORY_PAGE_SIZE + 1):
+        status_emoji = {
+            "completed": "✅",
+            "processing": "⏳",
+            "failed": "❌",
+            "pending": "🕐"
+        }.get(analysis.status, "❓")
+        
+        history_text += f"{i}. {status_emoji} **{analysis.original_filename}**\n"
+        history_text += f"   📅 {analysis.uploaded_at.strftime('%d.%m.%Y %H:%M')}\n"
+        history_text += f"   📋 Статус: {analysis.status.value}\n\n"
+    
+    reply_markup = None
+    if next_key is not None:
+        reply_markup = InlineKeyboardMarkup([[
+            InlineKeyboardButton("➡️ Дальше", callback_data=_encode_history_cursor(page + 1, next_key))
+        ]])
+    
+    return history_text, reply_markup
+
+
+def _encode_history_cursor(page: int, key: Tuple[datetime, UUID]) -> str:
+    """
+    callback_data страницы: h:<номер>:<uploaded_at в мкс, hex>:<id в base64url>
+    
+    Укладывается примерно в 45 байт при лимите Telegram в 64.
+    """
+    uploaded_at, analysis_id = key
+    if uploaded_at.tzinfo is None:
+        uploaded_at = uploaded_at.replace(tzinfo=timezone.utc)
+    
+    micros = (uploaded_at - _EPOCH) // timedelta(microseconds=1)
+    compact_id = base64.urlsafe_b64encode(analysis_id.bytes).rstrip(b"=").decode()
+    
+    return f"{HISTORY_CALLBACK_PREFIX}{page}:{micros:x}:{compact_id}"
+
+
+def _decode_history_cursor(data: str) -> Tuple[int, Tuple[datetime, UUID]]:
+    """Разобрать callback_data страницы (ValueError при неверном формате)"""
+    try:
+        page, micros, compact_id = data[len(HISTORY_CALLBACK_PREFIX):].split(":")
+        uploaded_at = _EPOCH + timedelta(microseconds=int(micros, 16))
+        analysis_id = UUID(bytes=base64.urlsafe_b64decode(compact_id + "=="))
+        return int(page), (uploaded_at, analysis_id)
+    except Exception as e:
+        raise ValueError(f"Invalid history cursor: {data}") from e
+
+
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик загруженных файлов"""
     user_id = update.effective_user.id
@@ -225,7 +355,7 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         # Загружаем файл
-        file_processor = FileProcessor()
+        file_processor = get_file_processor()
         analysis_result = await file_processor.process_file(
             document, user_id, update.effective_chat.id
         )
@@ -261,7 +391,7 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     try:
-        file_processor = FileProcessor()
+        file_processor = get_file_processor()
         analysis_result = await file_processor.process_photo(
             photo, user_id, update.effective_chat.id
         )
@@ -361,6 +491,9 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif query.data == "profile":
         await profile_command(update, context)
+    
+    elif query.data.startswith(HISTORY_CALLBACK_PREFIX):
+        await history_page_callback(query)
 
 
 def setup_handlers(application: Application):
@@ -2,21 +2,33 @@
 Модуль работы с базой данных (Supabase)
 """
 
-from .client import get_supabase_client, SupabaseClient
+from .client import get_supabase_client, SupabaseClient, get_async_supabase_client, AsyncSupabaseClient
+from .cache import get_user_cache, UserCache
+from .norm_index import get_medical_norm_index, MedicalNormIndex
 from .repositories import (
     UserRepository,
     AnalysisRepository,
     BiomarkerRepository, 
     RecommendationRepository,
-    MedicalNormRepository
+    MedicalNormRepository,
+    StorageUsageRepository,
+    FileBlobRepository
 )
 
 __all__ = [
     "get_supabase_client",
     "SupabaseClient",
+    "get_async_supabase_client",
+    "AsyncSupabaseClient",
+    "get_user_cache",
+    "UserCache",
+    "get_medical_norm_index",
+    "MedicalNormIndex",
     "UserRepository",
     "AnalysisRepository",
     "BiomarkerRepository",
     "RecommendationRepository", 
     "MedicalNormRepository",
+    "StorageUsageRepository",
+    "FileBlobRepository",
 ] 
\ No newline at end of file
@@ -0,0 +1,138 @@
+"""
+Кэш пользователей в памяти процесса
+"""
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+from uuid import UUID
+
+from config.settings import settings
+from src.models import User
+
+# Отметка "пользователь не найден" - кэшируется на короткий срок
+_NOT_FOUND = ()
+
+
+class UserCache:
+    """
+    Read-through кэш пользователей по telegram_id с TTL и вытеснением LRU
+    (и поиском по id пользователя через индекс id -> telegram_id)
+
+    Записи хранятся кортежами значений полей модели, а не объектами User:
+    так запись занимает в несколько раз меньше памяти, и сотни тысяч
+    пользователей помещаются в десятки мегабайт. Объект собирается при
+    попадании через model_construct, без повторной валидации.
+    """
+
+    def __init__(self, max_entries: int = 100000, ttl: float = 300, negative_ttl: float = 30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl  # Для отсутствующих пользователей
+
+        # telegram_id -> (момент истечения, значения полей), в порядке LRU
+        self._entries: "OrderedDict[int, Tuple[float, tuple]]" = OrderedDict()
+        self._fields = tuple(User.model_fields)
+        self._id_position = self._fields.index("id")
+        self._ids: Dict[UUID, int] = {}
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, telegram_id: int) -> Tuple[bool, Optional[User]]:
+        """
+        Найти пользователя
+
+        Returns:
+            (найдена ли запись, пользователь или None, если его нет в БД)
+        """
+        entry = self._entries.get(telegram_id)
+
+        if entry is None:
+            self._misses += 1
+            return False, None
+
+        expires_at, values = entry
+        if expires_at <= time.monotonic():
+            self._drop(telegram_id)
+            self._misses += 1
+            return False, None
+
+        self._entries.move_to_end(telegram_id)
+        self._hits += 1
+
+        if values is _NOT_FOUND:
+            return True, None
+        return True, User.model_construct(**dict(zip(self._fields, values)))
+
+    def get_by_id(self, user_id: UUID) -> Optional[User]:
+        """Найти пользователя по id (только известные пользователи)"""
+        telegram_id = self._ids.get(user_id)
+        if telegram_id is None:
+            self._misses += 1
+            return None
+
+        _, user = self.get(telegram_id)
+        return user
+
+    def put(self, user: User):
+        """Запомнить пользователя (после чтения, создания или обновления)"""
+        values = tuple(getattr(user, name) for name in self._fields)
+        self._store(user.telegram_id, values, self.ttl)
+
+    def put_missing(self, telegram_id: int):
+        """Запомнить, что пользователя нет"""
+        self._store(telegram_id, _NOT_FOUND, self.negative_ttl)
+
+    def invalidate(self, telegram_id: int):
+        """Забыть пользователя"""
+        self._drop(telegram_id)
+
+    def clear(self):
+        """Очистить кэш"""
+        self._entries.clear()
+        self._ids.clear()
+
+    def _store(self, telegram_id: int, values: tuple, ttl: float):
+        """Записать значения и вытеснить самые давние записи сверх лимита"""
+        if self.max_entries <= 0 or ttl <= 0:
+            return
+
+        self._drop(telegram_id)
+        self._entries[telegram_id] = (time.monotonic() + ttl, values)
+        if values is not _NOT_FOUND:
+            self._ids[values[self._id_position]] = telegram_id
+
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+            self._evictions += 1
+
+    def _drop(self, telegram_id: int):
+        """Удалить запись и ее индекс по id"""
+        entry = self._entries.pop(telegram_id, None)
+        if entry and entry[1] is not _NOT_FOUND:
+            self._ids.pop(entry[1][self._id_position], None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика попаданий"""
+        requests = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "hit_rate": round(self._hits / requests, 3) if requests else 0
+        }
+
+
+# Глобальный экземпляр кэша
+_user_cache = UserCache(
+    max_entries=settings.user_cache_size,
+    ttl=settings.user_cache_ttl
+)
+
+
+def get_user_cache() -> UserCache:
+    """Получить глобальный кэш пользователей"""
+    return _user_cache
@@ -1,7 +1,10 @@
 """
 Клиент для работы с Supabase
 """
+import asyncio
 from typing import Optional
+import httpx
+from postgrest import AsyncPostgrestClient
 from supabase import create_client, Client
 from config.settings import settings
 import logging
@@ -44,12 +47,102 @@ class SupabaseClient:
     def get_table(self, table_name: str):
         """Получить таблицу для работы"""
         return self.client.table(table_name)
+    
+    def rpc(self, function_name: str, params: Optional[dict] = None):
+        """Вызвать SQL функцию базы данных"""
+        return self.client.rpc(function_name, params or {})
+
+
+class AsyncSupabaseClient:
+    """
+    Асинхронный доступ к таблицам Supabase (PostgREST)
+    
+    Запросы идут через общий пул HTTP/2 соединений с таймаутами на каждый
+    запрос; число одновременных запросов ограничено семафором, чтобы всплеск
+    нагрузки не исчерпал пул и не перегрузил PostgREST.
+    """
+    
+    def __init__(
+        self, 
+        base_url: str, 
+        service_key: str, 
+        max_connections: int = 20, 
+        max_concurrency: int = 10, 
+        timeout: float = 10.0
+    ):
+        self.base_url = f"{base_url.rstrip('/')}/rest/v1"
+        self.service_key = service_key
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        
+        self._postgrest: Optional[AsyncPostgrestClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+    
+    @property
+    def postgrest(self) -> AsyncPostgrestClient:
+        """Клиент PostgREST с общим пулом соединений (создается лениво)"""
+        if self._postgrest is None:
+            http_client = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=5.0),
+                follow_redirects=True
+            )
+            self._postgrest = AsyncPostgrestClient(
+                self.base_url,
+                headers={
+                    "apikey": self.service_key,
+                    "Authorization": f"Bearer {self.service_key}",
+                    "Accept": "application/json",
+                    "Content-Type": "application/json"
+                },
+                http_client=http_client
+            )
+            logger.info("Async Supabase client initialized")
+        return self._postgrest
+    
+    def get_table(self, table_name: str):
+        """Получить таблицу для построения запроса"""
+        return self.postgrest.table(table_name)
+    
+    def rpc(self, function_name: str, params: Optional[dict] = None):
+        """Построить вызов SQL функции базы данных"""
+        return self.postgrest.rpc(function_name, params or {})
+    
+    async def execute(self, query):
+        """Выполнить построенный запрос с ограничением параллельности"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            return await query.execute()
+    
+    async def aclose(self):
+        """Закрыть пул соединений"""
+        if self._postgrest is not None:
+            await self._postgrest.aclose()
+            self._postgrest = None
 
 
-# Глобальный экземпляр клиента
+# Глобальные экземпляры клиентов
 _supabase_client = SupabaseClient()
+_async_supabase_client = AsyncSupabaseClient(
+    base_url=settings.supabase_url,
+    service_key=settings.supabase_service_role_key,
+    max_connections=settings.database_max_connections,
+    max_concurrency=settings.database_max_concurrency,
+    timeout=settings.database_timeout
+)
 
 
 def get_supabase_client() -> SupabaseClient:
     """Получить экземпляр Supabase клиента"""
-    return _supabase_client 
\ No newline at end of file
+    return _supabase_client
+
+
+def get_async_supabase_client() -> AsyncSupabaseClient:
+    """Получить асинхронный клиент базы данных (общий пул соединений)"""
+    return _async_supabase_client 
\ No newline at end of file
@@ -0,0 +1,178 @@
+"""
+Индекс медицинских норм в памяти процесса
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable, Iterable
+
+from src.models import MedicalNorm
+from src.utils.medical_data import canonical_biomarker_name
+
+logger = logging.getLogger(__name__)
+
+AGE_LIMIT = 150  # Верхняя граница возраста в medical_norms
+GENDERS = ("M", "F")
+
+
+def normalize_gender(gender: Optional[str]) -> str:
+    """Пол пользователя в обозначениях medical_norms (M, F или BOTH)"""
+    value = (gender or "").strip().upper()
+    return value if value in GENDERS else "BOTH"
+
+
+class MedicalNormIndex:
+    """
+    Активные нормы, загруженные целиком: биомаркер -> пол -> возрастные интервалы
+
+    Биомаркер - тот же единый ключ, что и в динамике (canonical_biomarker_name):
+    HGB и Гемоглобин находят одну норму.
+
+    Интервалы каждого пола отсортированы по специфичности (от узкого к
+    широкому), поэтому первый интервал, содержащий возраст, и есть лучшая
+    норма. Норма для пола пользователя предпочтительнее общей (BOTH), при
+    равной ширине интервала - более качественная и свежая. Если возраст
+    неизвестен, берется самый широкий интервал - норма "по умолчанию".
+
+    Индекс перестраивается целиком и подменяется одним присваиванием, так
+    что поиск не блокируется обновлением.
+    """
+
+    def __init__(self, loader: Callable[[], Awaitable[List[MedicalNorm]]]):
+        self.loader = loader  # Загрузка всех активных норм из БД
+
+        # биомаркер -> пол -> [(age_min, age_max, норма)]
+        self._index: Dict[str, Dict[str, List[Tuple[int, int, MedicalNorm]]]] = {}
+        self._loaded_at: Optional[datetime] = None
+        self._norm_count = 0
+        self._lock = asyncio.Lock()
+
+        self._lookups = 0
+        self._found = 0
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    async def refresh(self) -> int:
+        """Перечитать нормы из БД и подменить индекс"""
+        async with self._lock:
+            return await self._load()
+
+    async def ensure_loaded(self):
+        """Загрузить индекс при первом обращении"""
+        if self.is_loaded:
+            return
+
+        async with self._lock:
+            if not self.is_loaded:
+                await self._load()
+
+    async def _load(self) -> int:
+        """Загрузить нормы и построить новый индекс"""
+        started = time.monotonic()
+        norms = await self.loader()
+
+        self._index = self._build(norms)
+        self._norm_count = len(norms)
+        self._loaded_at = datetime.utcnow()
+
+        logger.info(
+            f"Medical norm index loaded: {len(norms)} norms for {len(self._index)} biomarkers "
+            f"in {time.monotonic() - started:.2f}s"
+        )
+        return len(norms)
+
+    def lookup(self, biomarker_name: str, gender: Optional[str] = None, age: Optional[int] = None) -> Optional[MedicalNorm]:
+        """Наиболее специфичная норма для биомаркера, пола и возраста"""
+        self._lookups += 1
+
+        by_gender = self._index.get(canonical_biomarker_name(biomarker_name))
+        if not by_gender:
+            return None
+
+        gender = normalize_gender(gender)
+        buckets = (gender, "BOTH") if gender != "BOTH" else ("BOTH",)
+
+        for key in buckets:
+            intervals = by_gender.get(key)
+            if not intervals:
+                continue
+
+            if age is None:
+                self._found += 1
+                return intervals[-1][2]
+
+            for age_min, age_max, norm in intervals:
+                if age_min <= age <= age_max:
+                    self._found += 1
+                    return norm
+
+        return None
+
+    def lookup_panel(
+        self,
+        biomarker_names: Iterable[str],
+        gender: Optional[str] = None,
+        age: Optional[int] = None
+    ) -> Dict[str, Optional[MedicalNorm]]:
+        """Нормы для всей панели анализа: {название: норма или None}"""
+        return {name: self.lookup(name, gender, age) for name in biomarker_names}
+
+    @staticmethod
+    def _build(norms: List[MedicalNorm]) -> Dict[str, Dict[str, List[Tuple[int, int, MedicalNorm]]]]:
+        """Сгруппировать нормы и упорядочить интервалы по специфичности"""
+        index: Dict[str, Dict[str, List[Tuple[int, int, MedicalNorm]]]] = {}
+
+        for norm in norms:
+            if not norm.is_active:
+                continue
+
+            age_min = norm.age_min if norm.age_min is not None else 0
+            age_max = norm.age_max if norm.age_max is not None else AGE_LIMIT
+            gender = norm.gender.value if hasattr(norm.gender, "value") else str(norm.gender)
+
+            index.setdefault(canonical_biomarker_name(norm.biomarker_name), {}).setdefault(
+                gender, []
+            ).append((age_min, age_max, norm))
+
+        for by_gender in index.values():
+            for intervals in by_gender.values():
+                intervals.sort(key=MedicalNormIndex._specificity)
+
+        return index
+
+    @staticmethod
+    def _specificity(entry: Tuple[int, int, MedicalNorm]) -> tuple:
+        """Ключ сортировки: узкий интервал, затем качество данных и свежесть"""
+        age_min, age_max, norm = entry
+        updated = norm.last_updated or norm.created_at
+        return (
+            age_max - age_min,
+            -(norm.quality_score or 0),
+            -(updated.timestamp() if updated else 0)
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика индекса"""
+        return {
+            "loaded_at": self._loaded_at.isoformat() if self._loaded_at else None,
+            "norms": self._norm_count,
+            "biomarkers": len(self._index),
+            "lookups": self._lookups,
+            "found": self._found
+        }
+
+
+# Глобальный экземпляр индекса
+_medical_norm_index: Optional[MedicalNormIndex] = None
+
+
+def get_medical_norm_index() -> MedicalNormIndex:
+    """Получить глобальный индекс медицинских норм"""
+    global _medical_norm_index
+    if _medical_norm_index is None:
+        from .repositories import MedicalNormRepository
+        _medical_norm_index = MedicalNormIndex(MedicalNormRepository().get_active_norms)
+    return _medical_norm_index
@@ -0,0 +1,65 @@
+"""
+Кодирование больших полей анализа для таблицы analysis_payloads
+"""
+import base64
+import zlib
+from typing import Optional, Dict, Any, Tuple
+
+PLAIN = "plain"
+ZLIB = "zlib"
+
+# Поля анализа, которые хранятся в analysis_payloads, а не в analyses
+PAYLOAD_FIELDS = ("extracted_text", "processing_result")
+
+
+def encode_text(text: str, compress: bool, min_bytes: int = 2048) -> Tuple[str, str]:
+    """
+    Подготовить текст к записи: (значение столбца, text_encoding)
+
+    Короткий текст и текст, который не стал меньше, сохраняются как есть.
+    """
+    if not compress:
+        return text, PLAIN
+
+    raw = text.encode("utf-8")
+    if len(raw) < min_bytes:
+        return text, PLAIN
+
+    encoded = base64.b64encode(zlib.compress(raw, 6)).decode("ascii")
+    if len(encoded) >= len(raw):
+        return text, PLAIN
+
+    return encoded, ZLIB
+
+
+def decode_text(value: Optional[str], encoding: Optional[str]) -> Optional[str]:
+    """Восстановить текст из столбца extracted_text"""
+    if value is None or encoding != ZLIB:
+        return value
+    return zlib.decompress(base64.b64decode(value)).decode("utf-8")
+
+
+def build_payload(fields: Dict[str, Any], compress: bool, min_bytes: int = 2048) -> Dict[str, Any]:
+    """Строка analysis_payloads из переданных полей анализа (только присутствующих)"""
+    payload: Dict[str, Any] = {}
+
+    if fields.get("extracted_text") is not None:
+        payload["extracted_text"], payload["text_encoding"] = encode_text(
+            fields["extracted_text"], compress, min_bytes
+        )
+
+    if fields.get("processing_result") is not None:
+        payload["processing_result"] = fields["processing_result"]
+
+    return payload
+
+
+def read_payload(row: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Поля анализа из строки analysis_payloads"""
+    if not row:
+        return {}
+
+    return {
+        "extracted_text": decode_text(row.get("extracted_text"), row.get("text_encoding")),
+        "processing_result": row.get("processing_result")
+    }
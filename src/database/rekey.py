@@ -0,0 +1,29 @@
+"""
+Перевод динамики показателей на единые ключи справочника
+
+Использование (после supabase_functions.sql и после пополнения синонимов
+в src/utils/medical_data.py):
+    python -m src.database.rekey [--dry-run]
+"""
+import argparse
+import asyncio
+import logging
+
+from .repositories import BiomarkerRepository
+
+
+async def _main():
+    """Запуск из командной строки"""
+    parser = argparse.ArgumentParser(description="Перевод biomarker_series на ключи canonical_biomarker_name")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать изменения")
+    args = parser.parse_args()
+
+    changes = await BiomarkerRepository().rekey_series(dry_run=args.dry_run)
+    for name, key in sorted(changes.items()):
+        print(f"{name} -> {key}")
+    print(f"{len(changes)} names {'to rekey' if args.dry_run else 'rekeyed'}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -1,19 +1,25 @@
 """
 Репозитории для работы с данными
 """
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from uuid import UUID
 import logging
 from datetime import datetime
 
 from src.models import (
     User, UserCreate, UserUpdate,
-    Analysis, AnalysisCreate, AnalysisUpdate,
-    BiomarkerResult, BiomarkerCreate,
+    Analysis, AnalysisCreate, AnalysisUpdate, AnalysisListItem,
+    BiomarkerResult, BiomarkerCreate, BiomarkerPoint, BiomarkerTrendSummary, LatestBiomarker,
     Recommendation, RecommendationCreate,
-    MedicalNorm, MedicalNormCreate
+    MedicalNorm, MedicalNormCreate,
+    StorageUsage, FileReference
 )
-from .client import get_supabase_client
+from config.settings import settings
+from src.utils.medical_data import canonical_biomarker_name
+from .client import get_async_supabase_client
+from .cache import get_user_cache
+from .norm_index import get_medical_norm_index
+from .payloads import PAYLOAD_FIELDS, build_payload, read_payload
 
 logger = logging.getLogger(__name__)
 
@@ -23,12 +29,16 @@ class BaseRepository:
     
     def __init__(self, table_name: str):
         self.table_name = table_name
-        self.client = get_supabase_client()
+        self.client = get_async_supabase_client()
     
     def _handle_error(self, operation: str, error: Exception):
         """Обработка ошибок"""
         logger.error(f"Error in {operation} for table {self.table_name}: {error}")
         raise error
+    
+    async def _execute(self, query):
+        """Выполнить запрос через общий асинхронный пул соединений"""
+        return await self.client.execute(query)
 
 
 class UserRepository(BaseRepository):
@@ -36,47 +46,112 @@ class UserRepository(BaseRepository):
     
     def __init__(self):
         super().__init__("users")
+        self.cache = get_user_cache()
     
     async def create_user(self, user_data: UserCreate) -> User:
         """Создать пользователя"""
         try:
-            result = self.client.get_table(self.table_name).insert(
-                user_data.model_dump()
-            ).execute()
+            result = await self._execute(self.client.get_table(self.table_name).insert(
+                user_data.model_dump(mode="json")
+            ))
             
             if result.data:
-                return User(**result.data[0])
+                user = User(**result.data[0])
+                self.cache.put(user)
+                return user
             raise Exception("Failed to create user")
             
         except Exception as e:
             self._handle_error("create_user", e)
     
+    async def upsert_user(self, user_data: UserCreate) -> User:
+        """
+        Создать пользователя или обновить его данные из Telegram одним запросом
+        
+        Конфликт разрешается по telegram_id: у существующего пользователя
+        обновляются только переданные поля (username, имя, фамилия), профиль
+        (возраст, пол, вес, рост) не затрагивается. Если в кэше уже лежат те
+        же данные, запрос не выполняется.
+        """
+        fields = {"telegram_id", "username", "first_name", "last_name"}
+        
+        found, cached = self.cache.get(user_data.telegram_id)
+        if found and cached and all(
+            getattr(cached, field) == getattr(user_data, field) for field in fields
+        ):
+            return cached
+        
+        try:
+            result = await self._execute(self.client.get_table(self.table_name).upsert(
+                user_data.model_dump(mode="json", include=fields),
+                on_conflict="telegram_id"
+            ))
+            
+            if result.data:
+                user = User(**result.data[0])
+                self.cache.put(user)
+                return user
+            raise Exception("Failed to upsert user")
+            
+        except Exception as e:
+            self._handle_error("upsert_user", e)
+    
     async def get_user_by_telegram_id(self, telegram_id: int) -> Optional[User]:
-        """Получить пользователя по Telegram ID"""
+        """Получить пользователя по Telegram ID (через кэш)"""
+        found, user = self.cache.get(telegram_id)
+        if found:
+            return user
+        
         try:
-            result = self.client.get_table(self.table_name).select("*").eq(
+            result = await self._execute(self.client.get_table(self.table_name).select("*").eq(
                 "telegram_id", telegram_id
-            ).execute()
+            ))
             
             if result.data:
-                return User(**result.data[0])
+                user = User(**result.data[0])
+                self.cache.put(user)
+                return user
+            
+            self.cache.put_missing(telegram_id)
             return None
             
         except Exception as e:
             self._handle_error("get_user_by_telegram_id", e)
     
+    async def get_user_by_id(self, user_id: UUID) -> Optional[User]:
+        """Получить пользователя по ID (через кэш)"""
+        user = self.cache.get_by_id(user_id)
+        if user:
+            return user
+        
+        try:
+            result = await self._execute(self.client.get_table(self.table_name).select("*").eq(
+                "id", str(user_id)
+            ))
+            
+            if result.data:
+                user = User(**result.data[0])
+                self.cache.put(user)
+                return user
+            return None
+            
+        except Exception as e:
+            self._handle_error("get_user_by_id", e)
+    
     async def update_user(self, user_id: UUID, user_data: UserUpdate) -> User:
         """Обновить пользователя"""
         try:
-            update_data = user_data.model_dump(exclude_unset=True)
+            update_data = user_data.model_dump(mode="json", exclude_unset=True)
             update_data["updated_at"] = datetime.utcnow().isoformat()
             
-            result = self.client.get_table(self.table_name).update(
+            result = await self._execute(self.client.get_table(self.table_name).update(
                 update_data
-            ).eq("id", str(user_id)).execute()
+            ).eq("id", str(user_id)))
             
             if result.data:
-                return User(**result.data[0])
+                user = User(**result.data[0])
+                self.cache.put(user)
+                return user
             raise Exception("Failed to update user")
             
         except Exception as e:
@@ -84,17 +159,26 @@ class UserRepository(BaseRepository):
 
 
 class AnalysisRepository(BaseRepository):
-    """Репозиторий для работы с анализами"""
+    """
+    Репозиторий для работы с анализами
+    
+    Большие поля (extracted_text, processing_result) хранятся в таблице
+    analysis_payloads и читаются только по запросу: get_analysis(...,
+    include_payload=True) или get_payload.
+    """
     
     def __init__(self):
         super().__init__("analyses")
+        self.payloads_table = "analysis_payloads"
+        self.compress_payloads = settings.analysis_payload_compression
+        self.compress_min_bytes = settings.analysis_payload_compress_min_bytes
     
     async def create_analysis(self, analysis_data: AnalysisCreate) -> Analysis:
         """Создать анализ"""
         try:
-            result = self.client.get_table(self.table_name).insert(
-                analysis_data.model_dump()
-            ).execute()
+            result = await self._execute(self.client.get_table(self.table_name).insert(
+                analysis_data.model_dump(mode="json")
+            ))
             
             if result.data:
                 return Analysis(**result.data[0])
@@ -103,40 +187,158 @@ class AnalysisRepository(BaseRepository):
         except Exception as e:
             self._handle_error("create_analysis", e)
     
-    async def get_analysis(self, analysis_id: UUID) -> Optional[Analysis]:
-        """Получить анализ по ID"""
+    async def get_analysis(self, analysis_id: UUID, include_payload: bool = False) -> Optional[Analysis]:
+        """
+        Получить анализ по ID
+        
+        Args:
+            include_payload: подгрузить текст OCR и результат обработки
+                (в том же запросе, через связь с analysis_payloads)
+        """
         try:
-            result = self.client.get_table(self.table_name).select("*").eq(
+            columns = "*"
+            if include_payload:
+                columns = f"*,{self.payloads_table}(extracted_text,text_encoding,processing_result)"
+            
+            result = await self._execute(self.client.get_table(self.table_name).select(columns).eq(
                 "id", str(analysis_id)
-            ).execute()
+            ))
             
-            if result.data:
-                return Analysis(**result.data[0])
-            return None
+            if not result.data:
+                return None
+            
+            row = result.data[0]
+            if include_payload:
+                row.update(read_payload(self._embedded_payload(row.pop(self.payloads_table, None))))
+            
+            return Analysis(**row)
             
         except Exception as e:
             self._handle_error("get_analysis", e)
     
+    async def get_payload(self, analysis_id: UUID) -> Dict[str, Any]:
+        """Текст OCR и результат обработки анализа ({} - данных нет)"""
+        try:
+            result = await self._execute(self.client.get_table(self.payloads_table).select(
+                "extracted_text,text_encoding,processing_result"
+            ).eq("analysis_id", str(analysis_id)))
+            
+            return read_payload(result.data[0] if result.data else None)
+            
+        except Exception as e:
+            self._handle_error("get_payload", e)
+    
+    async def save_payload(
+        self, 
+        analysis_id: UUID, 
+        extracted_text: Optional[str] = None, 
+        processing_result: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Сохранить большие поля анализа (переданные поля заменяются, остальные не меняются)"""
+        payload = build_payload(
+            {"extracted_text": extracted_text, "processing_result": processing_result},
+            self.compress_payloads,
+            self.compress_min_bytes
+        )
+        if not payload:
+            return
+        
+        try:
+            await self._execute(self.client.get_table(self.payloads_table).upsert(
+                {"analysis_id": str(analysis_id), **payload, "updated_at": datetime.utcnow().isoformat()},
+                on_conflict="analysis_id"
+            ))
+            
+        except Exception as e:
+            self._handle_error("save_payload", e)
+    
+    @staticmethod
+    def _embedded_payload(embedded) -> Optional[Dict[str, Any]]:
+        """Связанная строка analysis_payloads (объект или список - зависит от версии PostgREST)"""
+        if isinstance(embedded, list):
+            return embedded[0] if embedded else None
+        return embedded
+    
     async def get_user_analyses(self, user_id: UUID, limit: int = 10) -> List[Analysis]:
         """Получить анализы пользователя"""
         try:
-            result = self.client.get_table(self.table_name).select("*").eq(
+            result = await self._execute(self.client.get_table(self.table_name).select("*").eq(
                 "user_id", str(user_id)
-            ).order("uploaded_at", desc=True).limit(limit).execute()
+            ).order("uploaded_at", desc=True).limit(limit))
             
             return [Analysis(**item) for item in result.data]
             
         except Exception as e:
             self._handle_error("get_user_analyses", e)
     
+    async def list_user_analyses(
+        self, 
+        user_id: UUID, 
+        limit: int = 10, 
+        after: Optional[Tuple[datetime, UUID]] = None
+    ) -> Tuple[List[AnalysisListItem], Optional[Tuple[datetime, UUID]]]:
+        """
+        Страница истории анализов: только поля для списка, от новых к старым
+        
+        Пагинация по ключу (uploaded_at, id) вместо offset: стоимость запроса
+        не зависит от номера страницы. Запрашивается limit + 1 строка, чтобы
+        узнать, есть ли следующая страница.
+        
+        Args:
+            after: (uploaded_at, id) последнего анализа предыдущей страницы
+        
+        Returns:
+            (анализы, ключ для следующей страницы или None)
+        """
+        try:
+            query = self.client.get_table(self.table_name).select(
+                "id,original_filename,status,uploaded_at"
+            ).eq("user_id", str(user_id))
+            
+            if after is not None:
+                uploaded_at, analysis_id = after
+                # Кавычки: в ISO-времени есть зарезервированные для фильтров символы
+                timestamp = f'"{uploaded_at.isoformat()}"'
+                # lte задает диапазон по индексу (user_id, uploaded_at DESC, id DESC):
+                # без него OR читается не в порядке индекса, с сортировкой всей истории
+                query = query.lte("uploaded_at", uploaded_at.isoformat()).or_(
+                    f"uploaded_at.lt.{timestamp},"
+                    f"and(uploaded_at.eq.{timestamp},id.lt.{analysis_id})"
+                )
+            
+            result = await self._execute(
+                query.order("uploaded_at", desc=True).order("id", desc=True).limit(limit + 1)
+            )
+            
+            items = [AnalysisListItem(**item) for item in result.data[:limit]]
+            
+            next_key = None
+            if len(result.data) > limit and items:
+                next_key = (items[-1].uploaded_at, items[-1].id)
+            
+            return items, next_key
+            
+        except Exception as e:
+            self._handle_error("list_user_analyses", e)
+    
     async def update_analysis(self, analysis_id: UUID, update_data: AnalysisUpdate) -> Analysis:
-        """Обновить анализ"""
+        """Обновить анализ (большие поля записываются в analysis_payloads)"""
         try:
-            update_dict = update_data.model_dump(exclude_unset=True)
+            update_dict = update_data.model_dump(mode="json", exclude_unset=True)
+            payload = {field: update_dict.pop(field, None) for field in PAYLOAD_FIELDS}
+            
+            if any(value is not None for value in payload.values()):
+                await self.save_payload(analysis_id, **payload)
             
-            result = self.client.get_table(self.table_name).update(
+            if not update_dict:
+                analysis = await self.get_analysis(analysis_id)
+                if analysis:
+                    return analysis
+                raise Exception("Failed to update analysis")
+            
+            result = await self._execute(self.client.get_table(self.table_name).update(
                 update_dict
-            ).eq("id", str(analysis_id)).execute()
+            ).eq("id", str(analysis_id)))
             
             if result.data:
                 return Analysis(**result.data[0])
@@ -144,6 +346,49 @@ class AnalysisRepository(BaseRepository):
             
         except Exception as e:
             self._handle_error("update_analysis", e)
+    
+    async def save_analysis_results(
+        self, 
+        analysis_id: UUID, 
+        update_data: AnalysisUpdate, 
+        biomarkers: List[BiomarkerCreate], 
+        recommendations: List[RecommendationCreate]
+    ) -> Dict[str, Any]:
+        """
+        Сохранить итог анализа одной транзакцией: обновление анализа, большие
+        поля, показатели и рекомендации (SQL функция save_analysis_results)
+        
+        Returns:
+            {"analysis_id", "results": число показателей, "recommendations": число рекомендаций}
+        """
+        try:
+            analysis_data = update_data.model_dump(mode="json", exclude_none=True)
+            payload = build_payload(
+                {field: analysis_data.pop(field, None) for field in PAYLOAD_FIELDS},
+                self.compress_payloads,
+                self.compress_min_bytes
+            )
+            
+            result = await self._execute(self.client.rpc("save_analysis_results", {
+                "p_analysis_id": str(analysis_id),
+                "p_analysis": analysis_data,
+                "p_payload": payload or None,
+                "p_results": [
+                    {
+                        **item.model_dump(mode="json", exclude={"analysis_id"}),
+                        "biomarker_key": canonical_biomarker_name(item.name)
+                    }
+                    for item in biomarkers
+                ],
+                "p_recommendations": [
+                    item.model_dump(mode="json", exclude={"analysis_id"}) for item in recommendations
+                ]
+            }))
+            
+            return result.data
+            
+        except Exception as e:
+            self._handle_error("save_analysis_results", e)
 
 
 class BiomarkerRepository(BaseRepository):
@@ -155,9 +400,9 @@ class BiomarkerRepository(BaseRepository):
     async def create_biomarker(self, biomarker_data: BiomarkerCreate) -> BiomarkerResult:
         """Создать биомаркер"""
         try:
-            result = self.client.get_table(self.table_name).insert(
-                biomarker_data.model_dump()
-            ).execute()
+            result = await self._execute(self.client.get_table(self.table_name).insert(
+                biomarker_data.model_dump(mode="json")
+            ))
             
             if result.data:
                 return BiomarkerResult(**result.data[0])
@@ -169,14 +414,140 @@ class BiomarkerRepository(BaseRepository):
     async def get_analysis_biomarkers(self, analysis_id: UUID) -> List[BiomarkerResult]:
         """Получить биомаркеры анализа"""
         try:
-            result = self.client.get_table(self.table_name).select("*").eq(
+            result = await self._execute(self.client.get_table(self.table_name).select("*").eq(
                 "analysis_id", str(analysis_id)
-            ).execute()
+            ))
             
             return [BiomarkerResult(**item) for item in result.data]
             
         except Exception as e:
             self._handle_error("get_analysis_biomarkers", e)
+    
+    async def get_series(
+        self, 
+        user_id: UUID, 
+        biomarkers: Optional[List[str]] = None, 
+        since: Optional[datetime] = None,
+        page_size: int = 1000
+    ) -> Dict[str, List[BiomarkerPoint]]:
+        """
+        Динамика показателей пользователя из biomarker_series
+        
+        Названия сводятся к единому ключу (HGB и Гемоглобин - один ряд), все
+        запрошенные показатели читаются одним запросом по составному индексу
+        (user_id, biomarker_key, measured_at); постранично - только если точек
+        больше page_size.
+        
+        Args:
+            biomarkers: названия показателей (None - все показатели пользователя)
+            since: только точки не раньше этой даты
+        
+        Returns:
+            {ключ показателя: точки по возрастанию даты}
+        """
+        keys = sorted({canonical_biomarker_name(name) for name in biomarkers}) if biomarkers else None
+        
+        def build_query():
+            # Построитель запроса изменяемый - для каждой страницы новый
+            query = self.client.get_table("biomarker_series").select(
+                "biomarker_key,name,measured_at,value,numeric_value,unit,status,analysis_id"
+            ).eq("user_id", str(user_id))
+            
+            if keys:
+                query = query.in_("biomarker_key", keys)
+            
+            if since is not None:
+                query = query.gte("measured_at", since.isoformat())
+            
+            return query.order("biomarker_key").order("measured_at").order("result_id")
+        
+        try:
+            series: Dict[str, List[BiomarkerPoint]] = {}
+            offset = 0
+            
+            while True:
+                result = await self._execute(build_query().range(offset, offset + page_size - 1))
+                
+                for item in result.data:
+                    point = BiomarkerPoint(**item)
+                    series.setdefault(point.biomarker_key, []).append(point)
+                
+                if len(result.data) < page_size:
+                    return series
+                offset += page_size
+            
+        except Exception as e:
+            self._handle_error("get_series", e)
+    
+    async def get_trend_summary(
+        self, 
+        user_id: UUID, 
+        biomarkers: Optional[List[str]] = None
+    ) -> List[BiomarkerTrendSummary]:
+        """
+        Сводка динамики по показателям пользователя, рассчитанная в БД
+        
+        Последнее и предыдущее значение, изменение и число измерений по
+        каждому показателю (оконные функции в biomarker_trend_summary) - одна
+        строка на показатель вместо всей истории.
+        """
+        try:
+            keys = sorted({canonical_biomarker_name(name) for name in biomarkers}) if biomarkers else None
+            
+            result = await self._execute(self.client.rpc("biomarker_trend_summary", {
+                "p_user_id": str(user_id),
+                "p_keys": keys
+            }))
+            
+            return [BiomarkerTrendSummary(**item) for item in result.data]
+            
+        except Exception as e:
+            self._handle_error("get_trend_summary", e)
+    
+    async def get_latest(self, user_id: UUID) -> List[LatestBiomarker]:
+        """
+        Текущая картина пользователя: последнее значение каждого показателя
+        
+        Читается готовый снимок user_latest_biomarkers (обновляется в БД при
+        сохранении анализа), без обхода истории анализов.
+        """
+        try:
+            result = await self._execute(self.client.get_table("user_latest_biomarkers").select(
+                "biomarker_key,name,value,numeric_value,unit,status,measured_at,analysis_id"
+            ).eq("user_id", str(user_id)).order("biomarker_key"))
+            
+            return [LatestBiomarker(**item) for item in result.data]
+            
+        except Exception as e:
+            self._handle_error("get_latest", e)
+    
+    async def rekey_series(self, dry_run: bool = False) -> Dict[str, str]:
+        """
+        Перевести записанную динамику на текущие ключи canonical_biomarker_name
+        
+        Нужно после первичного заполнения biomarker_series в SQL (синонимы там
+        не сводятся) и после пополнения справочника синонимов: иначе ряд
+        одного показателя разделится на несколько ключей.
+        
+        Returns:
+            {название: новый ключ} для названий, ключ которых изменился
+        """
+        try:
+            result = await self._execute(self.client.rpc("biomarker_series_spellings", {}))
+            
+            changes = {}
+            for item in result.data:
+                key = canonical_biomarker_name(item["name"])
+                if key != item["biomarker_key"]:
+                    changes[item["name"]] = key
+            
+            if changes and not dry_run:
+                await self._execute(self.client.rpc("biomarker_series_rekey", {"p_keys": changes}))
+            
+            return changes
+            
+        except Exception as e:
+            self._handle_error("rekey_series", e)
 
 
 class RecommendationRepository(BaseRepository):
@@ -188,9 +559,9 @@ class RecommendationRepository(BaseRepository):
     async def create_recommendation(self, recommendation_data: RecommendationCreate) -> Recommendation:
         """Создать рекомендацию"""
         try:
-            result = self.client.get_table(self.table_name).insert(
-                recommendation_data.model_dump()
-            ).execute()
+            result = await self._execute(self.client.get_table(self.table_name).insert(
+                recommendation_data.model_dump(mode="json")
+            ))
             
             if result.data:
                 return Recommendation(**result.data[0])
@@ -202,9 +573,9 @@ class RecommendationRepository(BaseRepository):
     async def get_analysis_recommendations(self, analysis_id: UUID) -> List[Recommendation]:
         """Получить рекомендации для анализа"""
         try:
-            result = self.client.get_table(self.table_name).select("*").eq(
+            result = await self._execute(self.client.get_table(self.table_name).select("*").eq(
                 "analysis_id", str(analysis_id)
-            ).order("priority", desc=True).execute()
+            ).order("priority", desc=True))
             
             return [Recommendation(**item) for item in result.data]
             
@@ -218,35 +589,208 @@ class MedicalNormRepository(BaseRepository):
     def __init__(self):
         super().__init__("medical_norms")
     
+    async def get_active_norms(self, page_size: int = 1000) -> List[MedicalNorm]:
+        """Загрузить все активные нормы (постранично - PostgREST ограничивает размер ответа)"""
+        try:
+            norms = []
+            offset = 0
+            
+            while True:
+                result = await self._execute(self.client.get_table(self.table_name).select("*").eq(
+                    "is_active", True
+                ).order("id").range(offset, offset + page_size - 1))
+                
+                norms.extend(MedicalNorm(**item) for item in result.data)
+                
+                if len(result.data) < page_size:
+                    return norms
+                offset += page_size
+            
+        except Exception as e:
+            self._handle_error("get_active_norms", e)
+    
     async def get_norm_for_biomarker(
         self, 
         biomarker_name: str, 
         gender: str = "BOTH", 
         age: Optional[int] = None
     ) -> Optional[MedicalNorm]:
-        """Получить норму для биомаркера"""
+        """Получить наиболее специфичную норму для биомаркера (из индекса в памяти)"""
         try:
-            query = self.client.get_table(self.table_name).select("*").eq(
-                "biomarker_name", biomarker_name
-            ).eq("is_active", True)
+            index = get_medical_norm_index()
+            await index.ensure_loaded()
             
-            # Добавляем фильтры по полу и возрасту
-            if gender != "BOTH":
-                query = query.in_("gender", [gender, "BOTH"])
+            return index.lookup(biomarker_name, gender, age)
             
-            if age is not None:
-                query = query.or_(
-                    f"age_min.is.null,age_min.lte.{age}"
-                ).or_(
-                    f"age_max.is.null,age_max.gte.{age}"
-                )
+        except Exception as e:
+            self._handle_error("get_norm_for_biomarker", e)
+
+
+class StorageUsageRepository(BaseRepository):
+    """Репозиторий счетчиков использования хранилища"""
+    
+    def __init__(self):
+        super().__init__("storage_usage")
+    
+    async def apply_changes(self, changes: List[Dict[str, Any]]) -> None:
+        """
+        Применить изменения счетчиков одним запросом
+        
+        Args:
+            changes: [{"user_key": str, "file_type": str, "files": int, "bytes": int}, ...]
+        """
+        try:
+            await self._execute(self.client.rpc("storage_usage_apply", {"p_changes": changes}))
             
-            result = query.execute()
+        except Exception as e:
+            self._handle_error("apply_changes", e)
+    
+    async def get_usage(self, scope: str, scope_key: Optional[str] = None) -> List[StorageUsage]:
+        """Получить счетчики области (total, user или type)"""
+        try:
+            query = self.client.get_table(self.table_name).select("*").eq("scope", scope)
             
-            if result.data:
-                # Возвращаем наиболее специфичную норму
-                return MedicalNorm(**result.data[0])
-            return None
+            if scope_key is not None:
+                query = query.eq("scope_key", scope_key)
+            
+            result = await self._execute(query)
+            
+            return [StorageUsage(**item) for item in result.data]
+            
+        except Exception as e:
+            self._handle_error("get_usage", e)
+    
+    async def replace_all(self, rows: List[Dict[str, Any]]) -> None:
+        """Заменить все счетчики результатом сверки с хранилищем"""
+        try:
+            await self._execute(self.client.rpc("storage_usage_replace", {"p_rows": rows}))
+            
+        except Exception as e:
+            self._handle_error("replace_all", e)
+
+
+class FileBlobRepository(BaseRepository):
+    """Репозиторий контентно-адресуемых файлов и ссылок на них"""
+    
+    def __init__(self):
+        super().__init__("file_blobs")
+    
+    async def acquire(self, sha256: str, user_key: str, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Добавить ссылку на уже хранящийся файл
+        
+        Returns:
+            {"reference_id", "storage_path", "stored_size"} или None, если файла нет
+        """
+        try:
+            result = await self._execute(self.client.rpc("file_blob_acquire", {
+                "p_sha256": sha256,
+                "p_user_key": user_key,
+                "p_filename": filename
+            }))
+            
+            return result.data or None
+            
+        except Exception as e:
+            self._handle_error("acquire", e)
+    
+    async def register(
+        self, 
+        sha256: str, 
+        storage_path: str, 
+        original_size: int, 
+        stored_size: int, 
+        user_key: str, 
+        filename: str
+    ) -> Dict[str, Any]:
+        """
+        Зарегистрировать загруженный файл и ссылку на него
+        
+        Returns:
+            {"reference_id", "storage_path", "stored_size", "created"} или None,
+            если файл с этим хэшем сейчас удаляется (загрузку нужно повторить)
+        """
+        try:
+            result = await self._execute(self.client.rpc("file_blob_register", {
+                "p_sha256": sha256,
+                "p_storage_path": storage_path,
+                "p_original_size": original_size,
+                "p_stored_size": stored_size,
+                "p_user_key": user_key,
+                "p_filename": filename
+            }))
+            
+            return result.data or None
+            
+        except Exception as e:
+            self._handle_error("register", e)
+    
+    async def release(self, storage_path: str, user_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Удалить ссылку пользователя на файл
+        
+        При remaining = 0 запись файла остается до удаления объекта из
+        хранилища: после удаления нужно вызвать purge.
+        
+        Returns:
+            {"sha256", "stored_size", "remaining"} или None, если ссылки нет
+        """
+        try:
+            result = await self._execute(self.client.rpc("file_blob_release", {
+                "p_storage_path": storage_path,
+                "p_user_key": user_key
+            }))
+            
+            return result.data or None
+            
+        except Exception as e:
+            self._handle_error("release", e)
+    
+    async def expire_references(self, cutoff: datetime, limit: int) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Удалить пачку ссылок старше cutoff
+        
+        Returns:
+            {"references": удаленные ссылки, "purged": файлы без ссылок для удаления
+            из хранилища и затем purge}
+        """
+        try:
+            result = await self._execute(self.client.rpc("file_references_expire", {
+                "p_cutoff": cutoff.isoformat(),
+                "p_limit": limit
+            }))
+            
+            return result.data or {"references": [], "purged": []}
+            
+        except Exception as e:
+            self._handle_error("expire_references", e)
+    
+    async def purge(self, sha256s: List[str]) -> List[Dict[str, Any]]:
+        """
+        Удалить записи файлов без ссылок (после удаления объектов из хранилища)
+        
+        Returns:
+            [{"storage_path", "stored_size"}] - записи, удаленные этим вызовом
+        """
+        try:
+            if not sha256s:
+                return []
+            
+            result = await self._execute(self.client.rpc("file_blob_purge", {"p_sha256": sha256s}))
+            
+            return result.data or []
+            
+        except Exception as e:
+            self._handle_error("purge", e)
+    
+    async def get_user_references(self, user_key: str, limit: int = 100) -> List[FileReference]:
+        """Получить загрузки пользователя"""
+        try:
+            result = await self._execute(self.client.get_table("file_references").select("*").eq(
+                "user_key", user_key
+            ).order("created_at", desc=True).limit(limit))
+            
+            return [FileReference(**item) for item in result.data]
             
         except Exception as e:
-            self._handle_error("get_norm_for_biomarker", e) 
\ No newline at end of file
+            self._handle_error("get_user_references", e)
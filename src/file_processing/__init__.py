@@ -2,12 +2,17 @@
 Модуль обработки файлов
 """
 
-from .processor import FileProcessor
+from .processor import FileProcessor, get_file_processor
 from .ocr import OCRProcessor
-from .storage import StorageManager
+from .storage import StorageManager, get_storage_manager
+from .dedup import DuplicateIndex, get_duplicate_index
 
 __all__ = [
     "FileProcessor",
+    "get_file_processor",
     "OCRProcessor", 
     "StorageManager",
+    "get_storage_manager",
+    "DuplicateIndex",
+    "get_duplicate_index",
 ] 
\ No newline at end of file
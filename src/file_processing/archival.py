@@ -0,0 +1,157 @@
+"""
+Архивное сжатие файлов анализов перед сохранением в хранилище
+"""
+import hashlib
+import io
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Форматы без потерь: их можно пережать в PNG без изменения пикселей
+LOSSLESS_EXTENSIONS = {'.png', '.bmp', '.tiff', '.tif'}
+
+
+@dataclass
+class ArchivedFile:
+    """Результат архивного сжатия"""
+    data: bytes
+    extension: str
+    original_size: int
+    original_sha256: str
+    method: Optional[str] = None  # None - файл сохранен как есть
+
+    @property
+    def stored_size(self) -> int:
+        return len(self.data)
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_size - self.stored_size
+
+
+class ArchivalTranscoder:
+    """
+    Перекодирование файлов для долговременного хранения
+
+    Фотографии пересжимаются в JPEG с качеством, достаточным для повторного
+    OCR, и ограниченным разрешением (3000 px по длинной стороне - около
+    300 dpi для листа A4); сканы без потерь пережимаются в оптимизированный
+    PNG, у PDF сжимаются потоки содержимого. Результат сохраняется, только
+    если он меньше исходного файла.
+    """
+
+    def __init__(self, max_dimension: int = 3000, jpeg_quality: int = 90):
+        self.max_dimension = max_dimension
+        self.jpeg_quality = jpeg_quality
+
+    def transcode(self, file_data: bytes, extension: str, sha256: Optional[str] = None) -> ArchivedFile:
+        """Сжать файл (вызывать в отдельном потоке - операция CPU-bound)"""
+        original = ArchivedFile(
+            data=file_data,
+            extension=extension,
+            original_size=len(file_data),
+            original_sha256=sha256 or hashlib.sha256(file_data).hexdigest()
+        )
+
+        try:
+            if extension == '.pdf':
+                candidate = self._compress_pdf(file_data)
+            elif extension in ('.jpg', '.jpeg'):
+                candidate = self._encode_jpeg(file_data)
+            elif extension in LOSSLESS_EXTENSIONS:
+                candidate = self._encode_png(file_data)
+            else:
+                return original
+        except Exception as e:
+            logger.warning(f"Archival transcoding failed, storing original: {e}")
+            return original
+
+        if candidate is None:
+            return original
+
+        data, new_extension, method = candidate
+        if len(data) >= len(file_data):
+            return original
+
+        return ArchivedFile(
+            data=data,
+            extension=new_extension,
+            original_size=original.original_size,
+            original_sha256=original.original_sha256,
+            method=method
+        )
+
+    def _load_image(self, file_data: bytes) -> Optional[Image.Image]:
+        """
+        Открыть изображение с учетом EXIF-ориентации и ограничить разрешение
+
+        None для многостраничных изображений (TIFF, MPO): сохраняется только
+        первый кадр, поэтому такие файлы хранятся как есть.
+        """
+        image = Image.open(io.BytesIO(file_data))
+        if getattr(image, "n_frames", 1) > 1:
+            return None
+
+        # JPEG декодируется сразу в уменьшенном масштабе, если он сильно больше предела
+        image.draft(image.mode, (self.max_dimension, self.max_dimension))
+        image = ImageOps.exif_transpose(image)
+
+        if max(image.size) > self.max_dimension:
+            image.thumbnail((self.max_dimension, self.max_dimension), Image.Resampling.LANCZOS)
+
+        return image
+
+    def _encode_jpeg(self, file_data: bytes):
+        """Фотография: JPEG с ограниченным разрешением"""
+        image = self._load_image(file_data)
+        if image is None:
+            return None
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        output = io.BytesIO()
+        image.save(
+            output,
+            format='JPEG',
+            quality=self.jpeg_quality,
+            optimize=True,
+            progressive=True
+        )
+        return output.getvalue(), '.jpg', f"jpeg_q{self.jpeg_quality}"
+
+    def _encode_png(self, file_data: bytes):
+        """Скан без потерь: оптимизированный PNG"""
+        image = self._load_image(file_data)
+        if image is None:
+            return None
+        if image.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+            image = image.convert('RGB')
+
+        output = io.BytesIO()
+        image.save(output, format='PNG', optimize=True)
+        return output.getvalue(), '.png', "png_optimize"
+
+    def _compress_pdf(self, file_data: bytes):
+        """PDF: сжатие потоков содержимого страниц (без потерь)"""
+        import PyPDF2
+
+        reader = PyPDF2.PdfReader(io.BytesIO(file_data))
+        if reader.is_encrypted:
+            return None
+
+        writer = PyPDF2.PdfWriter()
+        for page in reader.pages:
+            # Сжимаем до копирования: иначе исходный поток тоже попадет в файл
+            page.compress_content_streams()
+            writer.add_page(page)
+
+        if reader.metadata:
+            writer.add_metadata(reader.metadata)
+
+        output = io.BytesIO()
+        writer.write(output)
+        return output.getvalue(), '.pdf', "pdf_flate"
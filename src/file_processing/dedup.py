@@ -0,0 +1,142 @@
+"""
+Поиск повторно отправленных анализов по перцептивному хэшу изображений
+"""
+import hashlib
+import io
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+class DuplicateIndex:
+    """
+    Индекс уже обработанных файлов пользователя
+
+    Telegram пережимает фотографии, поэтому повторная отправка того же бланка
+    почти никогда не совпадает побайтно. Для изображений храним разностный
+    перцептивный хэш (dHash) и ищем ближайший по расстоянию Хэмминга;
+    для остальных файлов достаточно SHA-256.
+    """
+
+    def __init__(
+        self,
+        max_distance: int = 12,
+        hash_size: int = 16,
+        max_entries_per_user: int = 20,
+        max_users: int = 5000
+    ):
+        self.max_distance = max_distance  # Из hash_size² бит
+        self.hash_size = hash_size
+        self.max_entries_per_user = max_entries_per_user
+        self.max_users = max_users
+
+        # user_id -> список записей (новые в конце), пользователи в порядке LRU
+        self._entries: "OrderedDict[int, List[Dict[str, Any]]]" = OrderedDict()
+
+    def fingerprint(self, file_data: bytes, extension: str) -> Dict[str, Any]:
+        """Посчитать отпечатки файла: SHA-256 и перцептивный хэш для изображений"""
+        fingerprint = {
+            "sha256": hashlib.sha256(file_data).hexdigest(),
+            "phash": None
+        }
+
+        if extension != '.pdf':
+            fingerprint["phash"] = self._perceptual_hash(file_data)
+
+        return fingerprint
+
+    def find(self, user_id: int, fingerprint: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Найти ранее обработанный файл пользователя
+
+        Returns:
+            Запись с полями result, distance, exact или None
+        """
+        entries = self._entries.get(user_id)
+        if not entries:
+            return None
+
+        self._entries.move_to_end(user_id)
+
+        best = None
+        best_distance = self.max_distance + 1
+
+        for entry in reversed(entries):
+            if entry["sha256"] == fingerprint["sha256"]:
+                return {**entry, "distance": 0, "exact": True}
+
+            if fingerprint["phash"] is None or entry["phash"] is None:
+                continue
+
+            distance = (entry["phash"] ^ fingerprint["phash"]).bit_count()
+            if distance < best_distance:
+                best, best_distance = entry, distance
+
+        if best is None:
+            return None
+
+        logger.info(f"Near-duplicate image for user {user_id}: distance {best_distance}")
+        return {**best, "distance": best_distance, "exact": False}
+
+    def add(self, user_id: int, fingerprint: Dict[str, Any], result: Dict[str, Any]):
+        """Запомнить результат обработки файла"""
+        entries = self._entries.setdefault(user_id, [])
+        self._entries.move_to_end(user_id)
+
+        entries.append({
+            "sha256": fingerprint["sha256"],
+            "phash": fingerprint["phash"],
+            "result": result,
+            "added_at": time.time()
+        })
+
+        del entries[:-self.max_entries_per_user]
+
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+
+    def forget(self, user_id: int, file_path: str):
+        """Убрать запись об удаленном файле"""
+        entries = self._entries.get(user_id)
+        if entries:
+            entries[:] = [e for e in entries if e["result"].get("file_path") != file_path]
+
+    def _perceptual_hash(self, file_data: bytes) -> Optional[int]:
+        """Разностный хэш (dHash) размером hash_size × hash_size бит"""
+        try:
+            image = Image.open(io.BytesIO(file_data))
+
+            # Для JPEG декодируем сразу в уменьшенном масштабе (DCT scaling)
+            image.draft('L', (self.hash_size * 8, self.hash_size * 8))
+            image = image.convert('L').resize(
+                (self.hash_size + 1, self.hash_size),
+                Image.Resampling.LANCZOS
+            )
+
+            pixels = list(image.getdata())
+            width = self.hash_size + 1
+
+            value = 0
+            for row in range(self.hash_size):
+                offset = row * width
+                for col in range(self.hash_size):
+                    value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+
+            return value
+
+        except Exception as e:
+            logger.warning(f"Could not compute perceptual hash: {e}")
+            return None
+
+
+# Глобальный индекс (общий для всех обработчиков процесса)
+_duplicate_index = DuplicateIndex()
+
+
+def get_duplicate_index() -> DuplicateIndex:
+    """Получить индекс повторных отправок"""
+    return _duplicate_index
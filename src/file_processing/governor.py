@@ -0,0 +1,192 @@
+"""
+Контроль ресурсов при одновременной обработке файлов
+"""
+import asyncio
+import io
+import logging
+import re
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Any, Deque
+from PIL import Image
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Страница PDF после pdf2image (A4, 200 dpi, RGB)
+PDF_PAGE_BITMAP_BYTES = 1654 * 2339 * 3
+
+# Копии изображения при предобработке (серый, масштаб, контраст, резкость)
+IMAGE_WORKING_COPIES = 3
+
+PDF_PAGE_PATTERN = re.compile(rb'/Type\s*/Page(?!s)')
+
+
+@dataclass
+class _Ticket:
+    """Заявка на обработку файла в очереди"""
+    user_id: int
+    cost: int
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class ResourceGovernor:
+    """
+    Глобальный допуск задач обработки файлов по бюджету памяти и CPU
+
+    Задачи, не помещающиеся в бюджет, ждут в очередях пользователей,
+    которые обслуживаются по кругу, чтобы один пользователь с пачкой
+    файлов не блокировал остальных.
+    """
+
+    def __init__(self, memory_budget_bytes: int, max_concurrency: int):
+        self.memory_budget = memory_budget_bytes
+        self.max_concurrency = max(1, max_concurrency)
+
+        self._memory_in_use = 0
+        self._active = 0
+        self._queues: "OrderedDict[int, Deque[_Ticket]]" = OrderedDict()
+
+        # Статистика ожидания
+        self._admitted = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def estimate_cost(self, file_data: bytes, extension: str) -> int:
+        """Оценить пиковую память обработки файла по размеру и числу страниц"""
+        file_size = len(file_data)
+
+        if extension == '.pdf':
+            pages = max(1, len(PDF_PAGE_PATTERN.findall(file_data)))
+            return file_size + pages * PDF_PAGE_BITMAP_BYTES
+
+        try:
+            # Читается только заголовок, без декодирования пикселей
+            with Image.open(io.BytesIO(file_data)) as image:
+                width, height = image.size
+                bands = len(image.getbands())
+            return file_size + width * height * bands * IMAGE_WORKING_COPIES
+        except Exception:
+            return file_size * 10
+
+    @asynccontextmanager
+    async def admit(self, user_id: int, cost: int):
+        """
+        Дождаться допуска задачи и освободить ресурсы по завершении
+
+        Yields:
+            float: время ожидания в очереди (секунды)
+        """
+        wait = await self._acquire(user_id, cost)
+        try:
+            yield wait
+        finally:
+            self._release(cost)
+
+    async def _acquire(self, user_id: int, cost: int) -> float:
+        """Поставить задачу в очередь пользователя и дождаться допуска"""
+        ticket = _Ticket(
+            user_id=user_id,
+            cost=cost,
+            future=asyncio.get_running_loop().create_future()
+        )
+        self._queues.setdefault(user_id, deque()).append(ticket)
+        self._dispatch()
+
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled():
+                # Допуск уже выдан - возвращаем ресурсы
+                self._release(cost)
+            else:
+                self._remove(ticket)
+            raise
+
+        wait = time.monotonic() - ticket.enqueued_at
+        self._admitted += 1
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+
+        if wait > 1:
+            logger.info(f"File processing for user {user_id} waited {wait:.1f}s in queue")
+
+        return wait
+
+    def _release(self, cost: int):
+        """Освободить ресурсы задачи и допустить следующие"""
+        self._memory_in_use -= cost
+        self._active -= 1
+        self._dispatch()
+
+    def _fits(self, cost: int) -> bool:
+        """Помещается ли задача в текущий бюджет"""
+        if self._active >= self.max_concurrency:
+            return False
+
+        # Слишком большая задача допускается, когда больше ничего не выполняется
+        return self._active == 0 or self._memory_in_use + cost <= self.memory_budget
+
+    def _dispatch(self):
+        """Допустить задачи из очередей пользователей по кругу"""
+        while self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            ticket = queue[0]
+
+            if ticket.future.done():
+                # Заявка отменена до допуска
+                queue.popleft()
+                if not queue:
+                    del self._queues[user_id]
+                continue
+
+            if not self._fits(ticket.cost):
+                break
+
+            queue.popleft()
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+
+            self._memory_in_use += ticket.cost
+            self._active += 1
+            ticket.future.set_result(None)
+
+    def _remove(self, ticket: _Ticket):
+        """Убрать отмененную заявку из очереди"""
+        queue = self._queues.get(ticket.user_id)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.user_id]
+        self._dispatch()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Получить состояние очереди обработки"""
+        return {
+            "active": self._active,
+            "queued": sum(len(queue) for queue in self._queues.values()),
+            "queued_users": len(self._queues),
+            "memory_in_use_mb": round(self._memory_in_use / (1024 * 1024), 1),
+            "memory_budget_mb": round(self.memory_budget / (1024 * 1024), 1),
+            "max_concurrency": self.max_concurrency,
+            "admitted": self._admitted,
+            "avg_wait_seconds": round(self._total_wait / self._admitted, 3) if self._admitted else 0,
+            "max_wait_seconds": round(self._max_wait, 3)
+        }
+
+
+# Глобальный экземпляр (один бюджет на процесс)
+_resource_governor = ResourceGovernor(
+    memory_budget_bytes=settings.processing_memory_budget_mb * 1024 * 1024,
+    max_concurrency=settings.processing_max_concurrency
+)
+
+
+def get_resource_governor() -> ResourceGovernor:
+    """Получить глобальный контроллер ресурсов обработки"""
+    return _resource_governor
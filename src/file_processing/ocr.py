@@ -1,15 +1,49 @@
 """
 OCR процессор для извлечения текста из изображений
 """
+import asyncio
 import logging
+import re
 import tempfile
-from typing import Optional
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
 from PIL import Image
 import pytesseract
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
+# Соответствие письменности (Tesseract OSD) и языковой модели. Кириллические
+# бланки распознаются полным набором языков: на них всегда есть латинские
+# сокращения показателей (WBC, HGB, PLT, ALT), которые модель rus искажает
+# еще до проверки на смешанную письменность
+SCRIPT_LANGUAGES = {
+    'Latin': 'eng',
+}
+
+# Буквы письменности, не покрытой языковой моделью
+FOREIGN_WORD_PATTERNS = {
+    'rus': re.compile(r'[A-Za-z\d]+'),
+    'eng': re.compile(r'[А-Яа-яЁё\d]+'),
+}
+
+# Латинские сокращения показателей - не признак смешанного бланка
+ANALYTE_ABBREVIATIONS = frozenset({
+    'WBC', 'RBC', 'HGB', 'HB', 'HCT', 'MCV', 'MCH', 'MCHC', 'RDW', 'PLT', 'MPV', 'PCT', 'PDW',
+    'NEU', 'LYM', 'MON', 'EOS', 'BAS', 'ESR', 'ALT', 'AST', 'GGT', 'ALP', 'LDH', 'CRP', 'CK',
+    'TSH', 'FT3', 'FT4', 'HBA1C', 'LDL', 'HDL', 'VLDL', 'INR', 'APTT', 'PSA', 'IGE', 'IGG', 'IGM',
+    'BUN', 'EGFR', 'PH', 'SG', 'GLU', 'TG', 'CHOL', 'FE', 'NA', 'CA', 'MG', 'CL',
+})
+
+# Доля слов на другой письменности, начиная с которой бланк смешанный
+MIN_FOREIGN_WORD_SHARE = 0.2
+
+# Кэш выбора языка по шаблону бланка лаборатории (общий для процесса)
+_template_languages: "OrderedDict[str, str]" = OrderedDict()
+_TEMPLATE_CACHE_SIZE = 1000
+_template_lock = threading.Lock()
+
 
 class OCRProcessor:
     """Процессор для распознавания текста с изображений"""
@@ -20,9 +54,24 @@ class OCRProcessor:
         
         # Настройки Tesseract
         self.config = r'--oem 3 --psm 6'
+        
+        # Дополнительные проходы для плохих снимков (только при низкой уверенности)
+        self.fallback_psm_modes = [4, 3, 11]
+        self.line_config = r'--oem 3 --psm 7'
+        self.region_upscale_factor = 2
+        self.region_padding = 4
+        
+        # Автовыбор языка по письменности вместо постоянного rus+eng
+        self.auto_language = settings.ocr_auto_language and '+' in self.language
+        self.min_script_confidence = 2.0
     
     async def extract_text_from_image(self, image_path: str) -> Optional[str]:
         """Извлечь текст из изображения"""
+        # Tesseract блокирует - выполняем в отдельном потоке, не останавливая event loop
+        return await asyncio.to_thread(self._extract_text_from_image_sync, image_path)
+    
+    def _extract_text_from_image_sync(self, image_path: str) -> Optional[str]:
+        """Извлечь текст из изображения (синхронно)"""
         try:
             # Открываем изображение
             image = Image.open(image_path)
@@ -30,18 +79,13 @@ class OCRProcessor:
             # Предобработка изображения для лучшего распознавания
             processed_image = self._preprocess_image(image)
             
-            # Извлекаем текст
-            text = pytesseract.image_to_string(
-                processed_image,
-                lang=self.language,
-                config=self.config
-            )
-            
-            # Проверяем качество распознавания
-            confidence = self._get_ocr_confidence(processed_image)
+            # Быстрый первый проход; дополнительные проходы только при низкой уверенности
+            ocr_result = self._recognize_adaptive(processed_image)
+            text = ocr_result['text']
+            confidence = ocr_result['confidence']
             
             if confidence < self.confidence_threshold:
-                logger.warning(f"Low OCR confidence: {confidence}%")
+                logger.warning(f"Low OCR confidence after {ocr_result['passes']} passes: {confidence:.1f}%")
             
             # Очищаем и нормализуем текст
             clean_text = self._clean_extracted_text(text)
@@ -63,7 +107,7 @@ class OCRProcessor:
             import pdf2image
             
             # Конвертируем PDF в изображения
-            pages = pdf2image.convert_from_path(pdf_path)
+            pages = await asyncio.to_thread(pdf2image.convert_from_path, pdf_path)
             
             all_text = []
             
@@ -131,24 +175,338 @@ class OCRProcessor:
     def _get_ocr_confidence(self, image: Image.Image) -> float:
         """Получить уверенность OCR распознавания"""
         try:
-            data = pytesseract.image_to_data(
-                image,
-                lang=self.language,
-                config=self.config,
-                output_type=pytesseract.Output.DICT
-            )
+            return self._run_ocr_pass(image, self.config)['confidence']
+            
+        except Exception as e:
+            logger.error(f"Error calculating OCR confidence: {e}")
+            return 50.0  # Средняя уверенность по умолчанию
+    
+    def _recognize_adaptive(self, image: Image.Image) -> Dict[str, Any]:
+        """
+        Адаптивное распознавание: дешевый первый проход и эскалация
+        только для документов с низкой уверенностью
+        
+        Returns:
+            Dict с лучшим результатом: text, confidence, lines, image, passes
+        """
+        language, template_key, osd = self._select_language(image)
+        single_script = language != self.language
+        
+        best = self._run_ocr_pass(image, self.config, language)
+        passes = 1
+        
+        if best['confidence'] < self.confidence_threshold:
+            # 1. Исправляем ориентацию (перевернутые и повернутые фото)
+            rotated = self._fix_orientation(image, osd)
+            if rotated is not None:
+                candidate = self._run_ocr_pass(rotated, self.config, language)
+                passes += 1
+                if candidate['confidence'] > best['confidence']:
+                    best = candidate
+            
+            # 2. Альтернативные режимы сегментации страницы
+            for psm in self.fallback_psm_modes:
+                if best['confidence'] >= self.confidence_threshold:
+                    break
+                
+                candidate = self._run_ocr_pass(best['image'], f'--oem 3 --psm {psm}', language)
+                passes += 1
+                if candidate['confidence'] > best['confidence']:
+                    best = candidate
+        
+        # 3. Повторно распознаем только строки с низкой уверенностью полным набором языков
+        #    (при выборе одного языка это также ловит вставки на другой письменности)
+        if best['confidence'] < self.confidence_threshold or single_script:
+            best, region_passes, mixed_script = self._refine_low_confidence_lines(best, language)
+            passes += region_passes
+        else:
+            mixed_script = False
+        
+        if template_key:
+            self._update_template_language(template_key, language, mixed_script, best['confidence'])
+        
+        best['passes'] = passes
+        best['language'] = language
+        logger.info(
+            f"Adaptive OCR finished after {passes} passes, language {language}, "
+            f"confidence {best['confidence']:.1f}%"
+        )
+        return best
+    
+    def _select_language(self, image: Image.Image) -> Tuple[str, Optional[str], Optional[dict]]:
+        """
+        Выбрать языковую модель по письменности страницы
+        
+        Returns:
+            (язык, ключ шаблона, данные OSD если определялись)
+        """
+        if not self.auto_language:
+            return self.language, None, None
+        
+        template_key = self._template_key(image)
+        
+        with _template_lock:
+            cached = _template_languages.get(template_key)
+            if cached:
+                _template_languages.move_to_end(template_key)
+        
+        if cached:
+            return cached, template_key, None
+        
+        osd = self._detect_osd(image)
+        if not osd:
+            return self.language, template_key, None
+        
+        language = SCRIPT_LANGUAGES.get(osd.get('script'))
+        script_confidence = float(osd.get('script_conf', 0))
+        
+        if (
+            not language
+            or language not in self.language.split('+')
+            or script_confidence < self.min_script_confidence
+        ):
+            return self.language, template_key, osd
+        
+        logger.info(f"Detected script {osd.get('script')} ({script_confidence:.1f}), using OCR language {language}")
+        return language, template_key, osd
+    
+    def _template_key(self, image: Image.Image) -> Optional[str]:
+        """Отпечаток шапки бланка (average hash верхней полосы) для кэша выбора языка"""
+        try:
+            band = image.crop((0, 0, image.width, max(1, int(image.height * 0.15))))
+            pixels = list(band.convert('L').resize((16, 4)).getdata())
+            mean = sum(pixels) / len(pixels)
+            bits = ''.join('1' if pixel > mean else '0' for pixel in pixels)
             
-            # Вычисляем среднюю уверенность по всем словам
-            confidences = [int(conf) for conf in data['conf'] if int(conf) > 0]
+            aspect = round(image.width / image.height, 1)
+            return f"{int(bits, 2):016x}:{aspect}"
             
-            if not confidences:
-                return 0.0
+        except Exception as e:
+            logger.warning(f"Could not compute template key: {e}")
+            return None
+    
+    def _update_template_language(self, template_key: str, language: str, mixed_script: bool, confidence: float):
+        """
+        Обновить кэш выбора языка по итогу распознавания
+        
+        Запись не только добавляется, но и исправляется: смешанная письменность
+        переводит шаблон на полный набор языков, а низкая уверенность удаляет
+        запись (в том числе при совпадении отпечатков разных бланков) - следующий
+        документ с этим шаблоном определит письменность заново.
+        """
+        if mixed_script:
+            if _template_languages.get(template_key) != self.language:
+                logger.info(f"Mixed script in template {template_key}, using OCR language {self.language}")
+            self._remember_template_language(template_key, self.language)
+        elif confidence < self.confidence_threshold:
+            with _template_lock:
+                _template_languages.pop(template_key, None)
+        elif template_key not in _template_languages:
+            self._remember_template_language(template_key, language)
+    
+    def _remember_template_language(self, template_key: str, language: str):
+        """Запомнить выбор языка для шаблона бланка"""
+        with _template_lock:
+            _template_languages[template_key] = language
+            _template_languages.move_to_end(template_key)
+            
+            while len(_template_languages) > _TEMPLATE_CACHE_SIZE:
+                _template_languages.popitem(last=False)
+    
+    def _detect_osd(self, image: Image.Image) -> Optional[dict]:
+        """Определить ориентацию и письменность страницы (Tesseract OSD)"""
+        try:
+            return pytesseract.image_to_osd(image, output_type=pytesseract.Output.DICT)
+        except Exception as e:
+            logger.warning(f"Could not detect script/orientation: {e}")
+            return None
+    
+    def _has_foreign_script(self, text: str, language: str) -> bool:
+        """
+        Заметная ли в тексте доля слов на письменности, не покрытой выбранным
+        языком (сокращения показателей не учитываются)
+        """
+        pattern = FOREIGN_WORD_PATTERNS.get(language)
+        if pattern is None:
+            return False
+        
+        words = [word for word in re.findall(r'[^\W_]{2,}', text) if not word.isdigit()]
+        if not words:
+            return False
+        
+        foreign = [
+            word for word in words
+            if pattern.fullmatch(word) and word.upper() not in ANALYTE_ABBREVIATIONS
+        ]
+        return len(foreign) / len(words) >= MIN_FOREIGN_WORD_SHARE
+    
+    def _run_ocr_pass(
+        self, 
+        image: Image.Image, 
+        config: str, 
+        language: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Один проход Tesseract: текст и уверенность из одного вызова image_to_data"""
+        data = pytesseract.image_to_data(
+            image,
+            lang=language or self.language,
+            config=config,
+            output_type=pytesseract.Output.DICT
+        )
+        
+        lines = self._group_lines(data)
+        
+        return {
+            'text': '\n'.join(line['text'] for line in lines),
+            'confidence': self._mean_confidence(lines),
+            'lines': lines,
+            'image': image
+        }
+    
+    def _group_lines(self, data: dict) -> List[Dict[str, Any]]:
+        """Сгруппировать слова из image_to_data в строки с рамками и уверенностью"""
+        lines = {}
+        
+        for i, word in enumerate(data['text']):
+            word = (word or '').strip()
+            conf = float(data['conf'][i])
+            if not word or conf < 0:
+                continue
+            
+            key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            left, top = data['left'][i], data['top'][i]
+            right, bottom = left + data['width'][i], top + data['height'][i]
+            
+            line = lines.get(key)
+            if line is None:
+                lines[key] = {
+                    'words': [word],
+                    'confidences': [conf],
+                    'box': [left, top, right, bottom]
+                }
+            else:
+                line['words'].append(word)
+                line['confidences'].append(conf)
+                box = line['box']
+                box[0], box[1] = min(box[0], left), min(box[1], top)
+                box[2], box[3] = max(box[2], right), max(box[3], bottom)
+        
+        result = []
+        for key in sorted(lines):
+            line = lines[key]
+            result.append({
+                'text': ' '.join(line['words']),
+                'confidences': line['confidences'],
+                'confidence': sum(line['confidences']) / len(line['confidences']),
+                'box': tuple(line['box'])
+            })
+        
+        return result
+    
+    def _mean_confidence(self, lines: List[Dict[str, Any]]) -> float:
+        """Средняя уверенность по всем словам"""
+        confidences = [conf for line in lines for conf in line['confidences'] if conf > 0]
+        
+        if not confidences:
+            return 0.0
+        
+        return sum(confidences) / len(confidences)
+    
+    def _fix_orientation(self, image: Image.Image, osd: Optional[dict] = None) -> Optional[Image.Image]:
+        """Повернуть изображение по данным OSD; None если поворот не нужен"""
+        try:
+            osd = osd or self._detect_osd(image)
+            if not osd:
+                return None
             
-            return sum(confidences) / len(confidences)
+            rotate = int(osd.get('rotate', 0))
+            
+            if rotate == 0:
+                return None
+            
+            logger.info(f"Rotating image by {rotate} degrees for OCR")
+            return image.rotate(-rotate, expand=True)
             
         except Exception as e:
-            logger.error(f"Error calculating OCR confidence: {e}")
-            return 50.0  # Средняя уверенность по умолчанию
+            logger.warning(f"Could not detect image orientation: {e}")
+            return None
+    
+    def _refine_low_confidence_lines(
+        self, 
+        result: Dict[str, Any], 
+        language: Optional[str] = None
+    ) -> Tuple[Dict[str, Any], int, bool]:
+        """
+        Повторно распознать строки с низкой уверенностью
+        (увеличение, режим одной строки и полный набор языков)
+        
+        Returns:
+            (результат, число проходов, найдены ли строки на другой письменности)
+        """
+        image = result['image']
+        lines = []
+        passes = 0
+        refined_lines = 0
+        
+        for line in result['lines']:
+            if line['confidence'] >= self.confidence_threshold:
+                lines.append(line)
+                continue
+            
+            left, top, right, bottom = line['box']
+            pad = self.region_padding
+            region = image.crop((
+                max(left - pad, 0),
+                max(top - pad, 0),
+                min(right + pad, image.width),
+                min(bottom + pad, image.height)
+            ))
+            
+            if region.width < 2 or region.height < 2:
+                lines.append(line)
+                continue
+            
+            region = region.resize(
+                (region.width * self.region_upscale_factor, region.height * self.region_upscale_factor),
+                Image.Resampling.LANCZOS
+            )
+            
+            try:
+                candidate = self._run_ocr_pass(region, self.line_config)
+                passes += 1
+            except Exception as e:
+                logger.warning(f"Region OCR failed: {e}")
+                lines.append(line)
+                continue
+            
+            if candidate['lines'] and candidate['confidence'] > line['confidence']:
+                confidences = [c for l in candidate['lines'] for c in l['confidences']]
+                text = ' '.join(l['text'] for l in candidate['lines'])
+                refined_lines += 1
+                
+                lines.append({
+                    'text': text,
+                    'confidences': confidences,
+                    'confidence': candidate['confidence'],
+                    'box': line['box']
+                })
+            else:
+                lines.append(line)
+        
+        refined = {
+            'text': '\n'.join(line['text'] for line in lines),
+            'confidence': self._mean_confidence(lines),
+            'lines': lines,
+            'image': image
+        }
+        
+        # Долю слов считаем по всей странице: отдельная строка на другой
+        # письменности еще не делает бланк смешанным
+        mixed_script = bool(
+            language and refined_lines and self._has_foreign_script(refined['text'], language)
+        )
+        
+        return refined, passes, mixed_script
     
     def _clean_extracted_text(self, text: str) -> str:
         """Очистить и нормализовать извлеченный текст"""
@@ -4,13 +4,15 @@
 import logging
 import tempfile
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from pathlib import Path
 import asyncio
 
 from .ocr import OCRProcessor
-from .storage import StorageManager
-from src.database.client import get_supabase_client
+from .storage import StorageManager, get_storage_manager
+from .dedup import get_duplicate_index
+from .governor import get_resource_governor
+from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
@@ -18,9 +20,12 @@ logger = logging.getLogger(__name__)
 class FileProcessor:
     """Основной процессор файлов"""
     
-    def __init__(self):
+    def __init__(self, storage_manager: Optional[StorageManager] = None):
         self.ocr_processor = OCRProcessor()
-        self.storage_manager = StorageManager(get_supabase_client())
+        self.storage_manager = storage_manager or get_storage_manager()
+        self.duplicate_index = get_duplicate_index()
+        self.duplicate_policy = settings.duplicate_policy
+        self.governor = get_resource_governor()
         self.supported_formats = {
             '.pdf': self._process_pdf,
             '.jpg': self._process_image,
@@ -35,7 +40,8 @@ class FileProcessor:
         self, 
         file_data: bytes, 
         filename: str, 
-        user_id: int
+        user_id: int,
+        allow_duplicate: bool = False
     ) -> Dict[str, Any]:
         """
         Обработать файл полностью
@@ -44,6 +50,7 @@ class FileProcessor:
             file_data: Данные файла
             filename: Имя файла
             user_id: ID пользователя
+            allow_duplicate: Обработать заново, даже если файл похож на уже загруженный
         
         Returns:
             Dict с результатами обработки:
@@ -52,6 +59,9 @@ class FileProcessor:
                 "file_path": str,           # Путь в хранилище
                 "extracted_text": str,     # Извлеченный текст
                 "file_info": dict,         # Информация о файле
+                "duplicate": bool,         # Файл уже загружался ранее
+                "duplicate_of": dict,      # Предыдущая загрузка (если duplicate)
+                "queue_wait_seconds": float,  # Ожидание в очереди обработки
                 "error": str               # Ошибка если есть
             }
         """
@@ -67,56 +77,23 @@ class FileProcessor:
                     "error": f"Неподдерживаемый формат файла: {file_extension}"
                 }
             
-            # Загружаем файл в хранилище
-            file_path = await self.storage_manager.upload_file(
-                file_data, filename, user_id
-            )
+            # Проверяем, не присылали ли этот анализ раньше (в т.ч. пережатое фото)
+            fingerprint = self.duplicate_index.fingerprint(file_data, file_extension)
             
-            if not file_path:
-                return {
-                    "success": False,
-                    "error": "Ошибка загрузки файла в хранилище"
-                }
+            if not allow_duplicate:
+                duplicate_result = self._handle_duplicate(user_id, fingerprint)
+                if duplicate_result:
+                    return duplicate_result
             
-            # Скачиваем файл во временную директорию для обработки
-            temp_file_path = await self.storage_manager.download_file_to_temp(file_path)
+            result = await self._store_and_extract(
+                file_data, filename, file_extension, user_id
+            )
             
-            if not temp_file_path:
-                return {
-                    "success": False,
-                    "error": "Ошибка скачивания файла для обработки"
-                }
+            if result.get("success") and result.get("extracted_text"):
+                self.duplicate_index.add(user_id, fingerprint, result)
+            
+            return result
             
-            try:
-                # Обрабатываем файл в зависимости от типа
-                processor_func = self.supported_formats[file_extension]
-                extracted_text = await processor_func(temp_file_path)
-                
-                # Информация о файле
-                file_info = {
-                    "filename": filename,
-                    "size": len(file_data),
-                    "type": file_extension,
-                    "storage_path": file_path
-                }
-                
-                result = {
-                    "success": True,
-                    "file_path": file_path,
-                    "extracted_text": extracted_text,
-                    "file_info": file_info
-                }
-                
-                logger.info(f"Successfully processed file: {filename}")
-                return result
-                
-            finally:
-                # Удаляем временный файл
-                try:
-                    os.unlink(temp_file_path)
-                except Exception as e:
-                    logger.warning(f"Could not delete temp file {temp_file_path}: {e}")
-                    
         except Exception as e:
             logger.error(f"Error processing file {filename}: {e}")
             return {
@@ -124,6 +101,121 @@ class FileProcessor:
                 "error": f"Ошибка обработки файла: {str(e)}"
             }
     
+    async def _store_and_extract(
+        self, 
+        file_data: bytes, 
+        filename: str, 
+        file_extension: str, 
+        user_id: int
+    ) -> Dict[str, Any]:
+        """
+        Загрузить файл в хранилище и извлечь из него текст
+        
+        Допуск по глобальному бюджету памяти/CPU берется только на время
+        распознавания: загрузка в хранилище - сетевая операция и слот не
+        занимает (сжатие перед загрузкой допускается в StorageManager).
+        """
+        # Загружаем файл в хранилище
+        upload_info = await self.storage_manager.upload_file_with_info(
+            file_data, filename, user_id
+        )
+        
+        if not upload_info:
+            return {
+                "success": False,
+                "error": "Ошибка загрузки файла в хранилище"
+            }
+        
+        file_path = upload_info["file_path"]
+        
+        # Текст извлекаем из исходного файла, а не из сохраненной (возможно,
+        # пережатой) копии - и без повторного скачивания из хранилища
+        with tempfile.NamedTemporaryFile(suffix=file_extension, delete=False) as temp_file:
+            temp_file_path = temp_file.name
+        await asyncio.to_thread(Path(temp_file_path).write_bytes, file_data)
+        
+        try:
+            # Обрабатываем файл в зависимости от типа
+            processor_func = self.supported_formats[file_extension]
+            cost = self.governor.estimate_cost(file_data, file_extension)
+            
+            async with self.governor.admit(user_id, cost) as queue_wait:
+                extracted_text = await processor_func(temp_file_path)
+            
+            # Информация о файле
+            file_info = {
+                "filename": filename,
+                "size": len(file_data),
+                "type": file_extension,
+                "storage_path": file_path,
+                "sha256": upload_info["sha256"],
+                "stored_size": upload_info["stored_size"],
+                "bytes_saved": upload_info["bytes_saved"],
+                "archival": upload_info["archival"],
+                "deduplicated": upload_info["deduplicated"]
+            }
+            
+            result = {
+                "success": True,
+                "file_path": file_path,
+                "extracted_text": extracted_text,
+                "file_info": file_info,
+                "duplicate": False,
+                "queue_wait_seconds": round(queue_wait, 3)
+            }
+            
+            logger.info(f"Successfully processed file: {filename}")
+            return result
+            
+        finally:
+            # Удаляем временный файл
+            try:
+                os.unlink(temp_file_path)
+            except Exception as e:
+                logger.warning(f"Could not delete temp file {temp_file_path}: {e}")
+    
+    def _handle_duplicate(self, user_id: int, fingerprint: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Обработать повторную отправку файла
+        
+        Прошлый результат переиспользуется только для побайтового дубликата.
+        Похожее изображение может быть тем же бланком с другими значениями,
+        поэтому по умолчанию ("off") оно обрабатывается заново, а при политике
+        "prompt" возвращается отметка о дубликате без результата: вызывающий
+        код спрашивает пользователя и повторяет вызов с allow_duplicate=True.
+        """
+        match = self.duplicate_index.find(user_id, fingerprint)
+        if not match:
+            return None
+        
+        previous = match["result"]
+        duplicate_of = {
+            "file_path": previous.get("file_path"),
+            "filename": previous.get("file_info", {}).get("filename"),
+            "processed_at": match["added_at"],
+            "distance": match["distance"],
+            "exact": match["exact"]
+        }
+        
+        if match["exact"]:
+            logger.info(f"Reusing previous result for duplicate upload: {duplicate_of['file_path']}")
+            return {
+                **previous,
+                "duplicate": True,
+                "duplicate_of": duplicate_of
+            }
+        
+        if self.duplicate_policy != "prompt":
+            logger.info(f"Similar to {duplicate_of['file_path']} (distance {match['distance']}), processing again")
+            return None
+        
+        return {
+            "success": False,
+            "duplicate": True,
+            "duplicate_of": duplicate_of,
+            "error": "Похоже, этот анализ уже загружался. Подтвердите повторную обработку."
+        }
+    
     async def _process_pdf(self, file_path: str) -> Optional[str]:
         """Обработать PDF файл"""
         try:
@@ -209,10 +301,13 @@ class FileProcessor:
             logger.error(f"Error getting file text: {e}")
             return None
     
-    async def delete_file(self, file_path: str) -> bool:
+    async def delete_file(self, file_path: str, user_id: Optional[int] = None) -> bool:
         """Удалить файл из хранилища"""
         try:
-            return await self.storage_manager.delete_file(file_path)
+            if user_id is not None:
+                self.duplicate_index.forget(user_id, file_path)
+            
+            return await self.storage_manager.delete_file(file_path, user_id)
         except Exception as e:
             logger.error(f"Error deleting file: {e}")
             return False
@@ -225,6 +320,14 @@ class FileProcessor:
             logger.error(f"Error getting file URL: {e}")
             return None
     
+    async def get_file_urls(self, file_paths: List[str], expires_in: int = 3600) -> Dict[str, Optional[str]]:
+        """Получить временные ссылки на несколько файлов (для истории анализов)"""
+        try:
+            return await self.storage_manager.get_file_urls(file_paths, expires_in)
+        except Exception as e:
+            logger.error(f"Error getting file URLs: {e}")
+            return {path: None for path in file_paths}
+    
     def validate_file(self, file_data: bytes, filename: str) -> Dict[str, Any]:
         """Валидировать файл перед обработкой"""
         try:
@@ -293,7 +396,7 @@ class FileProcessor:
         try:
             logger.info(f"Processing {len(files_data)} files for user {user_id}")
             
-            # Обрабатываем файлы параллельно
+            # Обрабатываем файлы параллельно (допуск через общий контроллер ресурсов)
             tasks = [
                 self.process_file(file_data, filename, user_id)
                 for file_data, filename in files_data
@@ -351,11 +454,25 @@ class FileProcessor:
                 "storage": storage_stats,
                 "supported_formats": list(self.supported_formats.keys()),
                 "max_file_size_mb": 20,
-                "ocr_language": self.ocr_processor.language
+                "ocr_language": self.ocr_processor.language,
+                "queue": self.governor.get_stats(),
+                "signed_urls": self.storage_manager.url_cache.get_stats()
             }
             
         except Exception as e:
             logger.error(f"Error getting processing stats: {e}")
             return {
                 "error": str(e)
-            } 
\ No newline at end of file
+            }
+
+
+# Глобальный экземпляр (без состояния запроса, общий для всех обработчиков)
+_file_processor: Optional[FileProcessor] = None
+
+
+def get_file_processor() -> FileProcessor:
+    """Получить общий для процесса процессор файлов"""
+    global _file_processor
+    if _file_processor is None:
+        _file_processor = FileProcessor()
+    return _file_processor
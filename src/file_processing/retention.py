@@ -0,0 +1,296 @@
+"""
+Очистка старых файлов в хранилище по сроку хранения
+
+Запуск вручную:
+    python -m src.file_processing.retention --days 30 --dry-run
+"""
+import argparse
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Dict, Any, AsyncIterator, Tuple, Callable, Awaitable, Set
+
+from .storage_backends import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RetentionReport:
+    """Итоги прохода очистки"""
+    cutoff: str
+    scanned_files: int = 0
+    deleted_files: int = 0
+    bytes_reclaimed: int = 0
+    skipped_prefixes: int = 0
+    failed_batches: int = 0
+    duration_seconds: float = 0.0
+    dry_run: bool = False
+    errors: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Отчет в виде словаря"""
+        report = asdict(self)
+        report["mb_reclaimed"] = round(self.bytes_reclaimed / (1024 * 1024), 2)
+        return report
+
+
+class StorageWalker:
+    """Постраничный обход папок хранилища"""
+
+    def __init__(self, backend: StorageBackend, bucket_name: str, page_size: int = 100):
+        self.backend = backend
+        self.bucket_name = bucket_name
+        self.page_size = page_size
+
+    async def iter_files(self, prefix: str = "") -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Рекурсивно выдавать (путь, запись листинга) всех файлов под prefix"""
+        folders, files = await self._list_level(prefix)
+
+        for entry in files:
+            yield (f"{prefix}/{entry['name']}" if prefix else entry["name"]), entry
+
+        for name in folders:
+            async for item in self.iter_files(f"{prefix}/{name}" if prefix else name):
+                yield item
+
+    async def iter_entries(self, prefix: str) -> AsyncIterator[Dict[str, Any]]:
+        """Постранично выдавать содержимое папки"""
+        offset = 0
+
+        while True:
+            page = await self.backend.list(
+                self.bucket_name,
+                prefix=prefix,
+                limit=self.page_size,
+                offset=offset
+            )
+
+            for entry in page:
+                yield entry
+
+            if len(page) < self.page_size:
+                break
+            offset += len(page)
+
+    async def _list_level(self, prefix: str) -> Tuple[List[str], List[Dict[str, Any]]]:
+        """
+        Прочитать уровень папки целиком: (имена подпапок, файлы)
+
+        Уровень дочитывается до удаления, иначе удаление (и исчезновение
+        опустевших виртуальных папок) сдвинет offset следующих страниц.
+        """
+        folders, files = [], []
+
+        async for entry in self.iter_entries(prefix):
+            if self._is_folder(entry):
+                folders.append(entry["name"])
+            else:
+                files.append(entry)
+
+        return folders, files
+
+    @staticmethod
+    def _is_folder(entry: Dict[str, Any]) -> bool:
+        """Папки в листинге Supabase Storage не имеют id"""
+        return entry.get("id") is None
+
+    @staticmethod
+    def entry_size(entry: Dict[str, Any]) -> int:
+        """Размер файла из листинга"""
+        return (entry.get("metadata") or {}).get("size", 0) or 0
+
+
+class RetentionSweeper(StorageWalker):
+    """
+    Обход хранилища по структуре user_id/year/month/ с постраничным листингом
+
+    Папки годов и месяцев новее даты отсечения пропускаются целиком, без листинга;
+    удаление идет пачками ограниченного размера с паузой между ними.
+    """
+
+    def __init__(
+        self,
+        backend: StorageBackend,
+        bucket_name: str,
+        page_size: int = 100,
+        batch_size: int = 100,
+        batch_delay: float = 0.5,
+        on_deleted: Optional[Callable[[List[Tuple[str, int]]], Awaitable[None]]] = None,
+        exclude_prefixes: Optional[Set[str]] = None
+    ):
+        super().__init__(backend, bucket_name, page_size)
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.on_deleted = on_deleted  # Получает удаленную пачку (путь, размер)
+        self.exclude_prefixes = exclude_prefixes or set()  # Папки верхнего уровня вне user_id/year/month
+
+    async def sweep(self, days: int, dry_run: bool = False) -> RetentionReport:
+        """Удалить файлы старше указанного количества дней"""
+        started = time.monotonic()
+        cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+        report = RetentionReport(cutoff=cutoff.isoformat(), dry_run=dry_run)
+
+        logger.info(f"Retention sweep started: cutoff {cutoff.isoformat()}, dry_run={dry_run}")
+
+        batch: List[Tuple[str, int]] = []
+
+        async for path, size in self.iter_expired(cutoff, report):
+            batch.append((path, size))
+
+            if len(batch) >= self.batch_size:
+                await self._delete_batch(batch, report, dry_run)
+                batch = []
+
+        if batch:
+            await self._delete_batch(batch, report, dry_run)
+
+        report.duration_seconds = round(time.monotonic() - started, 2)
+        logger.info(
+            f"Retention sweep finished: deleted {report.deleted_files} of "
+            f"{report.scanned_files} scanned files, reclaimed "
+            f"{report.bytes_reclaimed / (1024 * 1024):.1f} MB in {report.duration_seconds}s"
+        )
+        return report
+
+    async def iter_expired(
+        self,
+        cutoff: datetime,
+        report: Optional[RetentionReport] = None
+    ) -> AsyncIterator[Tuple[str, int]]:
+        """Потоково выдавать (путь, размер) файлов старше cutoff"""
+        cutoff_month = (cutoff.year, cutoff.month)
+
+        users, root_files = await self._list_level("")
+        for item in self._expired_in("", root_files, cutoff, report):
+            yield item
+
+        for user_prefix in users:
+            if user_prefix in self.exclude_prefixes:
+                self._count_skipped(report)
+                continue
+
+            years, user_files = await self._list_level(user_prefix)
+            for item in self._expired_in(user_prefix, user_files, cutoff, report):
+                yield item
+
+            for year_name in years:
+                year = self._as_int(year_name)
+                if year is None or year > cutoff.year:
+                    self._count_skipped(report)
+                    continue
+
+                year_prefix = f"{user_prefix}/{year_name}"
+                months, _ = await self._list_level(year_prefix)
+
+                for month_name in months:
+                    month = self._as_int(month_name)
+                    if month is None or (year, month) > cutoff_month:
+                        self._count_skipped(report)
+                        continue
+
+                    month_prefix = f"{year_prefix}/{month_name}"
+                    _, files = await self._list_level(month_prefix)
+                    for item in self._expired_in(month_prefix, files, cutoff, report):
+                        yield item
+
+    def _expired_in(
+        self,
+        prefix: str,
+        entries: List[Dict[str, Any]],
+        cutoff: datetime,
+        report: Optional[RetentionReport]
+    ):
+        """Отобрать устаревшие файлы из листинга папки"""
+        for entry in entries:
+            if report:
+                report.scanned_files += 1
+
+            created_at = self._parse_time(entry.get("created_at"))
+            if created_at is None or created_at >= cutoff:
+                continue
+
+            path = f"{prefix}/{entry['name']}" if prefix else entry["name"]
+            yield path, self.entry_size(entry)
+
+    @staticmethod
+    def _count_skipped(report: Optional[RetentionReport]):
+        """Учесть папку, пропущенную без листинга"""
+        if report:
+            report.skipped_prefixes += 1
+
+    async def _delete_batch(
+        self,
+        batch: List[Tuple[str, int]],
+        report: RetentionReport,
+        dry_run: bool
+    ):
+        """Удалить пачку файлов и выдержать паузу"""
+        if not dry_run:
+            try:
+                await self.backend.remove(self.bucket_name, [path for path, _ in batch])
+            except Exception as e:
+                report.failed_batches += 1
+                report.errors.append(str(e))
+                logger.error(f"Error deleting retention batch of {len(batch)} files: {e}")
+                return
+
+        report.deleted_files += len(batch)
+        report.bytes_reclaimed += sum(size for _, size in batch)
+
+        if not dry_run and self.on_deleted:
+            try:
+                await self.on_deleted(batch)
+            except Exception as e:
+                logger.error(f"Error handling deleted retention batch: {e}")
+
+        logger.info(
+            f"Retention progress: {report.deleted_files} files deleted, "
+            f"{report.bytes_reclaimed / (1024 * 1024):.1f} MB reclaimed"
+        )
+
+        if not dry_run and self.batch_delay:
+            await asyncio.sleep(self.batch_delay)
+
+    @staticmethod
+    def _as_int(value: str) -> Optional[int]:
+        """Имя папки года/месяца как число"""
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _parse_time(value: Optional[str]) -> Optional[datetime]:
+        """Разобрать время из листинга"""
+        if not value:
+            return None
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+        except ValueError:
+            return None
+
+
+async def _main():
+    """Запуск очистки из командной строки"""
+    from .storage import get_storage_manager
+
+    parser = argparse.ArgumentParser(description="Очистка старых файлов в хранилище")
+    parser.add_argument("--days", type=int, default=30, help="Срок хранения в днях")
+    parser.add_argument("--dry-run", action="store_true", help="Только посчитать, не удалять")
+    args = parser.parse_args()
+
+    storage_manager = get_storage_manager()
+    try:
+        report = await storage_manager.run_retention(args.days, dry_run=args.dry_run)
+        print(report)
+    finally:
+        await storage_manager.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
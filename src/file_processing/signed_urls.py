@@ -0,0 +1,97 @@
+"""
+Кэш подписанных ссылок на файлы хранилища
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class SignedUrlCache:
+    """
+    Подписанные ссылки с учетом срока жизни
+
+    Запрошенное время жизни округляется вверх до класса (5 минут, час, сутки,
+    неделя), ключ кэша - (путь, класс). Ссылка выдается повторно, пока у нее
+    остается не меньше reuse_fraction срока; когда прошло больше refresh_after
+    срока, ее следует заранее переподписать в фоне.
+    """
+
+    def __init__(
+        self,
+        lifetime_classes: Sequence[int] = (300, 3600, 86400, 604800),
+        reuse_fraction: float = 0.5,
+        refresh_after: float = 0.35,
+        max_entries: int = 10000
+    ):
+        self.lifetime_classes = sorted(lifetime_classes)
+        self.reuse_fraction = reuse_fraction
+        self.refresh_after = refresh_after
+        self.max_entries = max_entries
+
+        # (путь, класс) -> (ссылка, время выдачи), в порядке LRU
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[str, float]]" = OrderedDict()
+        self._lifetimes = set(self.lifetime_classes)
+
+        self._hits = 0
+        self._misses = 0
+
+    def lifetime_for(self, expires_in: int) -> int:
+        """Класс времени жизни для запрошенного срока"""
+        for lifetime in self.lifetime_classes:
+            if expires_in <= lifetime:
+                return lifetime
+        return expires_in
+
+    def get(self, path: str, lifetime: int) -> Tuple[Optional[str], bool]:
+        """
+        Найти пригодную ссылку
+
+        Returns:
+            (ссылка или None, нужно ли переподписать заранее)
+        """
+        key = (path, lifetime)
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self._misses += 1
+            return None, False
+
+        url, issued_at = entry
+        age = time.time() - issued_at
+
+        if age > lifetime * (1 - self.reuse_fraction):
+            del self._entries[key]
+            self._misses += 1
+            return None, False
+
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return url, age > lifetime * self.refresh_after
+
+    def put(self, path: str, lifetime: int, url: str, issued_at: Optional[float] = None):
+        """Запомнить выданную ссылку"""
+        key = (path, lifetime)
+        self._lifetimes.add(lifetime)
+        self._entries[key] = (url, issued_at if issued_at is not None else time.time())
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, path: str):
+        """Забыть ссылки на файл (после удаления)"""
+        for lifetime in self._lifetimes:
+            self._entries.pop((path, lifetime), None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика попаданий"""
+        requests = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / requests, 3) if requests else 0
+        }
@@ -1,59 +1,120 @@
 """
-Менеджер хранения файлов в Supabase Storage
+Менеджер хранения файлов (Supabase Storage или локальный диск)
 """
+import asyncio
+import hashlib
 import logging
+import os
 import tempfile
+import time
 import uuid
-from datetime import datetime, timedelta
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Optional, Tuple
-from supabase import Client
+from typing import Optional, Tuple, List, Dict, Set
 from config.settings import settings
+from src.database import StorageUsageRepository, FileBlobRepository
+from .storage_backends import StorageBackend, StorageError, create_storage_backend
+from .retention import RetentionSweeper, StorageWalker
+from .signed_urls import SignedUrlCache
+from .archival import ArchivalTranscoder, ArchivedFile
+from .governor import get_resource_governor
 
 logger = logging.getLogger(__name__)
 
+# Папка контентно-адресуемых объектов: objects/ab/cd/<sha256>.<ext>
+BLOB_PREFIX = "objects"
+
+# Повторы загрузки, пока удаляется прежняя копия того же файла
+BLOB_UPLOAD_ATTEMPTS = 3
+BLOB_RETRY_DELAY = 1.0  # секунд, растет с каждой попыткой
+
 
 class StorageManager:
     """Менеджер для работы с файлами в Supabase Storage"""
     
-    def __init__(self, supabase_client: Client):
-        self.supabase = supabase_client
+    def __init__(self, backend: Optional[StorageBackend] = None):
+        self.backend = backend or create_storage_backend()
         self.bucket_name = "medical-files"
         self.max_file_size = 20 * 1024 * 1024  # 20MB
         self.allowed_extensions = {'.pdf', '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff'}
         
-        # Создаем bucket если его нет
-        self._ensure_bucket_exists()
+        # Bucket проверяется лениво при первой загрузке и затем раз в интервал
+        self.bucket_check_interval = settings.storage_bucket_check_interval
+        self._bucket_verified_at: Optional[float] = None
+        
+        # Счетчики файлов и байт ведутся в БД инкрементально
+        self.usage_repository = StorageUsageRepository()
+        
+        # Подписанные ссылки переиспользуются, пока у них остается половина срока
+        self.url_cache = SignedUrlCache()
+        self.sign_batch_size = 100
+        self._refreshing: Set[Tuple[str, int]] = set()
+        self._refresh_tasks: Set[asyncio.Task] = set()
+        
+        # Необязательное архивное сжатие перед сохранением
+        self.archival = ArchivalTranscoder(
+            max_dimension=settings.storage_archival_max_dimension,
+            jpeg_quality=settings.storage_archival_jpeg_quality
+        ) if settings.storage_archival_enabled else None
+        self._archived_files = 0
+        self._archival_bytes_saved = 0
+        self.governor = get_resource_governor()
+        
+        # Одинаковые файлы хранятся один раз, загрузки - ссылки на них
+        self.content_addressed = settings.storage_content_addressed
+        self.blob_repository = FileBlobRepository()
     
-    def _ensure_bucket_exists(self):
-        """Убедиться что bucket существует"""
+    async def _ensure_bucket_exists(self, force: bool = False) -> bool:
+        """Убедиться что bucket существует (не чаще раза в bucket_check_interval)"""
+        now = time.monotonic()
+        if (
+            not force
+            and self._bucket_verified_at is not None
+            and now - self._bucket_verified_at < self.bucket_check_interval
+        ):
+            return True
+        
         try:
             # Проверяем существование bucket
-            buckets = self.supabase.storage.list_buckets()
-            bucket_exists = any(bucket.name == self.bucket_name for bucket in buckets)
+            buckets = await self.backend.list_buckets()
+            bucket_exists = any(bucket.get("name") == self.bucket_name for bucket in buckets)
             
             if not bucket_exists:
                 # Создаем bucket
-                self.supabase.storage.create_bucket(
+                await self.backend.create_bucket(
                     self.bucket_name,
-                    options={
-                        "public": False,  # Приватные файлы
-                        "allowedMimeTypes": [
-                            "application/pdf",
-                            "image/jpeg", 
-                            "image/jpg",
-                            "image/png",
-                            "image/gif",
-                            "image/bmp",
-                            "image/tiff"
-                        ],
-                        "fileSizeLimit": self.max_file_size
-                    }
+                    public=False,  # Приватные файлы
+                    allowed_mime_types=[
+                        "application/pdf",
+                        "image/jpeg", 
+                        "image/jpg",
+                        "image/png",
+                        "image/gif",
+                        "image/bmp",
+                        "image/tiff"
+                    ],
+                    file_size_limit=self.max_file_size
                 )
                 logger.info(f"Created storage bucket: {self.bucket_name}")
             
+            self._bucket_verified_at = now
+            return True
+            
         except Exception as e:
             logger.error(f"Error ensuring bucket exists: {e}")
+            self._bucket_verified_at = None
+            return False
+    
+    async def verify_bucket(self) -> bool:
+        """Принудительно проверить bucket (при старте приложения)"""
+        return await self._ensure_bucket_exists(force=True)
+    
+    async def close(self):
+        """Закрыть соединения с хранилищем"""
+        for task in list(self._refresh_tasks):
+            task.cancel()
+        await self.backend.aclose()
     
     async def upload_file(self, file_data: bytes, filename: str, user_id: int) -> Optional[str]:
         """
@@ -62,39 +123,219 @@ class StorageManager:
         Returns:
             str: Путь к файлу в хранилище или None при ошибке
         """
+        info = await self.upload_file_with_info(file_data, filename, user_id)
+        return info["file_path"] if info else None
+    
+    async def upload_file_with_info(self, file_data: bytes, filename: str, user_id: int) -> Optional[dict]:
+        """
+        Загрузить файл в хранилище (с архивным сжатием, если оно включено)
+        
+        При контентно-адресуемом хранении повторная загрузка того же файла
+        только добавляет ссылку на уже сохраненный объект.
+        
+        Returns:
+            dict: file_path, sha256 исходного файла, original_size, stored_size,
+                  bytes_saved, archival (метод сжатия или None), deduplicated
+                  или None при ошибке
+        """
         try:
             # Валидация файла
             if not self._validate_file(file_data, filename):
                 return None
             
-            # Генерируем уникальное имя файла
-            file_path = self._generate_file_path(filename, user_id)
+            # Проверяем bucket (сетевой запрос только при первой загрузке и по интервалу)
+            await self._ensure_bucket_exists()
+            
+            sha256 = hashlib.sha256(file_data).hexdigest()
+            
+            if self.content_addressed:
+                info = await self._upload_blob(file_data, filename, user_id, sha256)
+                if info is None:
+                    self._bucket_verified_at = None
+                return info
+            
+            archived = await self._archive(file_data, Path(filename).suffix.lower(), sha256, user_id)
+            
+            # Уникальный путь (расширение - по сохраняемому формату)
+            file_path = self._generate_file_path(Path(filename).stem + archived.extension, user_id)
             
             # Загружаем файл
-            result = self.supabase.storage.from_(self.bucket_name).upload(
-                path=file_path,
-                file=file_data,
-                file_options={
-                    "cache-control": "3600",
-                    "upsert": "false"  # Не перезаписывать существующие файлы
-                }
+            result = await self.backend.upload(
+                self.bucket_name,
+                file_path,
+                archived.data,
+                cache_control="3600",
+                upsert=False  # Не перезаписывать существующие файлы
             )
             
             if result:
                 logger.info(f"Successfully uploaded file: {file_path}")
-                return file_path
+                await self._record_usage([self._usage_change(file_path, 1, archived.stored_size)])
+                return self._upload_info(
+                    file_path, sha256, archived.original_size, archived.stored_size, archived.method, False
+                )
             else:
                 logger.error("Failed to upload file")
+                self._bucket_verified_at = None  # Перепроверить bucket при следующей загрузке
                 return None
                 
         except Exception as e:
             logger.error(f"Error uploading file: {e}")
+            self._bucket_verified_at = None
             return None
     
+    async def _upload_blob(self, file_data: bytes, filename: str, user_id: int, sha256: str) -> Optional[dict]:
+        """
+        Сослаться на уже хранящийся объект или загрузить новый
+        
+        Объект без ссылок остается в file_blobs, пока не удален из хранилища:
+        зарегистрировать его нельзя, загрузка повторяется после удаления.
+        Если объект по пути уже есть (параллельная загрузка), после
+        регистрации проверяется, что он не успел удалиться.
+        """
+        archived = None
+        
+        for attempt in range(BLOB_UPLOAD_ATTEMPTS):
+            reference = await self.blob_repository.acquire(sha256, str(user_id), filename)
+            if reference:
+                # Файл уже хранится: ни сжатия, ни загрузки
+                file_path = reference["storage_path"]
+                logger.info(f"Reused stored file {file_path} for user {user_id}")
+                await self._record_usage([self._usage_change(
+                    file_path, 1, reference["stored_size"], user_key=str(user_id), physical=False
+                )])
+                return self._upload_info(file_path, sha256, len(file_data), reference["stored_size"], None, True)
+            
+            if archived is None:
+                archived = await self._archive(file_data, Path(filename).suffix.lower(), sha256, user_id)
+            file_path = self._blob_path(sha256, archived.extension)
+            
+            existed = False
+            try:
+                result = await self.backend.upload(
+                    self.bucket_name,
+                    file_path,
+                    archived.data,
+                    cache_control="3600",
+                    upsert=False
+                )
+            except StorageError as e:
+                if e.status_code not in (400, 409):
+                    raise
+                # Объект уже загружен параллельным запросом или еще не удален
+                result, existed = {"Key": file_path}, True
+            
+            if not result:
+                logger.error("Failed to upload file")
+                return None
+            
+            registered = await self.blob_repository.register(
+                sha256, file_path, archived.original_size, archived.stored_size, str(user_id), filename
+            )
+            if registered is None:
+                logger.info(f"Stored file {file_path} is being deleted, retrying upload")
+                await asyncio.sleep(BLOB_RETRY_DELAY * (attempt + 1))
+                continue
+            
+            if existed and registered["storage_path"] == file_path:
+                await self._ensure_blob_stored(file_path, archived)
+            
+            logger.info(f"Successfully uploaded file: {file_path}")
+            return await self._registered_upload_info(registered, file_path, sha256, archived, user_id)
+        
+        logger.error(f"Failed to upload file {filename}: stored copy {sha256} is still being deleted")
+        return None
+    
+    async def _ensure_blob_stored(self, file_path: str, archived: ArchivedFile):
+        """Загрузить объект заново, если существовавшая копия успела удалиться"""
+        if await self.backend.object_size(self.bucket_name, file_path) is None:
+            logger.warning(f"Stored file {file_path} was deleted before registration, uploading again")
+            await self.backend.upload(
+                self.bucket_name,
+                file_path,
+                archived.data,
+                cache_control="3600",
+                upsert=True
+            )
+    
+    async def _registered_upload_info(
+        self, 
+        registered: dict, 
+        file_path: str, 
+        sha256: str, 
+        archived: ArchivedFile, 
+        user_id: int
+    ) -> dict:
+        """Счетчики и сведения о загрузке после регистрации объекта и ссылки"""
+        stored_path = registered["storage_path"]
+        if stored_path != file_path:
+            # Параллельный запрос сохранил этот файл в другом формате - наша копия лишняя
+            await self.backend.remove(self.bucket_name, [file_path])
+        
+        changes = [self._usage_change(
+            stored_path, 1, registered["stored_size"], user_key=str(user_id), physical=False
+        )]
+        if registered["created"]:
+            changes.append(self._usage_change(stored_path, 1, registered["stored_size"]))
+        await self._record_usage(changes)
+        
+        return self._upload_info(
+            stored_path, 
+            sha256, 
+            archived.original_size, 
+            registered["stored_size"], 
+            archived.method if stored_path == file_path else None, 
+            not registered["created"]
+        )
+    
+    @staticmethod
+    def _upload_info(
+        file_path: str, 
+        sha256: str, 
+        original_size: int, 
+        stored_size: int, 
+        archival: Optional[str], 
+        deduplicated: bool
+    ) -> dict:
+        """Результат загрузки"""
+        return {
+            "file_path": file_path,
+            "sha256": sha256,
+            "original_size": original_size,
+            "stored_size": stored_size,
+            "bytes_saved": original_size - stored_size,
+            "archival": archival,
+            "deduplicated": deduplicated
+        }
+    
+    async def _archive(self, file_data: bytes, extension: str, sha256: str, user_id: int) -> ArchivedFile:
+        """Сжать файл для хранения в отдельном потоке (с допуском по бюджету памяти/CPU)"""
+        if self.archival is None:
+            return ArchivedFile(
+                data=file_data,
+                extension=extension,
+                original_size=len(file_data),
+                original_sha256=sha256
+            )
+        
+        cost = self.governor.estimate_cost(file_data, extension)
+        async with self.governor.admit(user_id, cost):
+            archived = await asyncio.to_thread(self.archival.transcode, file_data, extension, sha256)
+        
+        if archived.method:
+            self._archived_files += 1
+            self._archival_bytes_saved += archived.bytes_saved
+            logger.info(
+                f"Archived upload with {archived.method}: {archived.original_size} -> "
+                f"{archived.stored_size} bytes"
+            )
+        
+        return archived
+    
     async def download_file(self, file_path: str) -> Optional[bytes]:
         """Скачать файл из хранилища"""
         try:
-            result = self.supabase.storage.from_(self.bucket_name).download(file_path)
+            result = await self.backend.download(self.bucket_name, file_path)
             
             if result:
                 logger.info(f"Successfully downloaded file: {file_path}")
@@ -114,12 +355,8 @@ class StorageManager:
         Returns:
             str: Путь к временному файлу или None при ошибке
         """
+        temp_path = None
         try:
-            # Скачиваем файл
-            file_data = await self.download_file(file_path)
-            if not file_data:
-                return None
-            
             # Получаем расширение файла
             original_filename = Path(file_path).name
             extension = Path(original_filename).suffix
@@ -129,23 +366,47 @@ class StorageManager:
                 suffix=extension, 
                 delete=False
             ) as temp_file:
-                temp_file.write(file_data)
                 temp_path = temp_file.name
             
+            # Скачиваем файл потоком, не держа его целиком в памяти
+            size = await self.backend.download_to_file(self.bucket_name, file_path, temp_path)
+            if not size:
+                os.unlink(temp_path)
+                return None
+            
             logger.info(f"Downloaded file to temp path: {temp_path}")
             return temp_path
             
         except Exception as e:
             logger.error(f"Error downloading file to temp: {e}")
+            if temp_path:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
             return None
     
-    async def delete_file(self, file_path: str) -> bool:
-        """Удалить файл из хранилища"""
+    async def delete_file(self, file_path: str, user_id: Optional[int] = None) -> bool:
+        """
+        Удалить файл из хранилища
+        
+        Для контентно-адресуемого объекта удаляется ссылка пользователя,
+        сам объект - когда на него не осталось ссылок.
+        """
+        if self._is_blob_path(file_path):
+            return await self._release_blob(file_path, user_id)
+        
         try:
-            result = self.supabase.storage.from_(self.bucket_name).remove([file_path])
+            # Размер нужен для счетчиков: после удаления его уже не узнать
+            size = await self.backend.object_size(self.bucket_name, file_path)
+            
+            result = await self.backend.remove(self.bucket_name, [file_path])
             
             if result:
                 logger.info(f"Successfully deleted file: {file_path}")
+                self.url_cache.invalidate(file_path)
+                if size is not None:
+                    await self._record_usage([self._usage_change(file_path, -1, -size)])
                 return True
             else:
                 logger.error(f"Failed to delete file: {file_path}")
@@ -155,6 +416,37 @@ class StorageManager:
             logger.error(f"Error deleting file: {e}")
             return False
     
+    async def _release_blob(self, file_path: str, user_id: Optional[int]) -> bool:
+        """Удалить ссылку пользователя на объект и сам объект без ссылок"""
+        if user_id is None:
+            logger.error(f"User is required to delete shared file: {file_path}")
+            return False
+        
+        try:
+            released = await self.blob_repository.release(file_path, str(user_id))
+            if not released:
+                logger.error(f"No reference to {file_path} for user {user_id}")
+                return False
+            
+            size = released["stored_size"]
+            changes = [self._usage_change(file_path, -1, -size, user_key=str(user_id), physical=False)]
+            
+            if released["remaining"] == 0:
+                # Запись объекта удаляется только после файла: до этого параллельная
+                # загрузка того же файла не зарегистрирует удаляемый объект
+                await self.backend.remove(self.bucket_name, [file_path])
+                self.url_cache.invalidate(file_path)
+                if await self.blob_repository.purge([released["sha256"]]):
+                    changes.append(self._usage_change(file_path, -1, -size))
+                logger.info(f"Successfully deleted file: {file_path}")
+            
+            await self._record_usage(changes)
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error deleting file: {e}")
+            return False
+    
     async def get_file_url(self, file_path: str, expires_in: int = 3600) -> Optional[str]:
         """
         Получить временную ссылку на файл
@@ -162,16 +454,28 @@ class StorageManager:
         Args:
             file_path: Путь к файлу в хранилище
             expires_in: Время жизни ссылки в секундах (по умолчанию 1 час)
+        
+        Ссылка из кэша живет не меньше половины класса срока, в который
+        попадает expires_in (см. SignedUrlCache).
         """
         try:
-            result = self.supabase.storage.from_(self.bucket_name).create_signed_url(
-                path=file_path,
-                expires_in=expires_in
+            lifetime = self.url_cache.lifetime_for(expires_in)
+            
+            cached, needs_refresh = self.url_cache.get(file_path, lifetime)
+            if cached:
+                if needs_refresh:
+                    self._refresh_ahead([file_path], lifetime)
+                return cached
+            
+            issued_at = time.time()
+            result = await self.backend.create_signed_url(
+                self.bucket_name, file_path, lifetime
             )
             
-            if result and 'signedURL' in result:
+            if result:
                 logger.info(f"Generated signed URL for file: {file_path}")
-                return result['signedURL']
+                self.url_cache.put(file_path, lifetime, result, issued_at)
+                return result
             else:
                 logger.error(f"Failed to generate signed URL for file: {file_path}")
                 return None
@@ -180,6 +484,77 @@ class StorageManager:
             logger.error(f"Error generating signed URL: {e}")
             return None
     
+    async def get_file_urls(self, file_paths: List[str], expires_in: int = 3600) -> Dict[str, Optional[str]]:
+        """
+        Получить временные ссылки на несколько файлов
+        
+        Отсутствующие в кэше ссылки подписываются пачками одним запросом на пачку.
+        
+        Returns:
+            dict: {путь: ссылка или None}
+        """
+        lifetime = self.url_cache.lifetime_for(expires_in)
+        urls: Dict[str, Optional[str]] = {}
+        missing, stale = [], []
+        
+        for path in dict.fromkeys(file_paths):
+            cached, needs_refresh = self.url_cache.get(path, lifetime)
+            if cached:
+                urls[path] = cached
+                if needs_refresh:
+                    stale.append(path)
+            else:
+                missing.append(path)
+        
+        if missing:
+            try:
+                urls.update(await self._sign_many(missing, lifetime))
+            except Exception as e:
+                logger.error(f"Error generating signed URLs: {e}")
+        
+        if stale:
+            self._refresh_ahead(stale, lifetime)
+        
+        return {path: urls.get(path) for path in file_paths}
+    
+    async def _sign_many(self, file_paths: List[str], lifetime: int) -> Dict[str, Optional[str]]:
+        """Подписать файлы пачками и положить ссылки в кэш"""
+        signed: Dict[str, Optional[str]] = {}
+        
+        for start in range(0, len(file_paths), self.sign_batch_size):
+            batch = file_paths[start:start + self.sign_batch_size]
+            issued_at = time.time()
+            
+            result = await self.backend.create_signed_urls(self.bucket_name, batch, lifetime)
+            
+            for path, url in result.items():
+                if url:
+                    self.url_cache.put(path, lifetime, url, issued_at)
+                signed[path] = url
+        
+        return signed
+    
+    def _refresh_ahead(self, file_paths: List[str], lifetime: int):
+        """Переподписать устаревающие ссылки в фоне, не задерживая ответ"""
+        paths = [path for path in file_paths if (path, lifetime) not in self._refreshing]
+        if not paths:
+            return
+        
+        keys = {(path, lifetime) for path in paths}
+        self._refreshing.update(keys)
+        
+        async def refresh():
+            try:
+                await self._sign_many(paths, lifetime)
+            except Exception as e:
+                logger.warning(f"Error refreshing signed URLs: {e}")
+            finally:
+                self._refreshing.difference_update(keys)
+        
+        task = asyncio.create_task(refresh())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+    
     async def cleanup_old_files(self, days: int = 30) -> int:
         """
         Очистить старые файлы (старше указанного количества дней)
@@ -187,40 +562,41 @@ class StorageManager:
         Returns:
             int: Количество удаленных файлов
         """
+        report = await self.run_retention(days)
+        return report.get("deleted_files", 0)
+    
+    async def run_retention(self, days: int = 30, dry_run: bool = False) -> dict:
+        """
+        Обойти хранилище и удалить файлы старше срока хранения
+        
+        Returns:
+            dict: Отчет (просмотрено, удалено, освобождено байт, пропущено папок)
+        """
         try:
-            # Получаем список всех файлов
-            result = self.supabase.storage.from_(self.bucket_name).list()
-            
-            if not result:
-                return 0
+            sweeper = RetentionSweeper(
+                self.backend,
+                self.bucket_name,
+                batch_size=settings.storage_retention_batch_size,
+                batch_delay=settings.storage_retention_batch_delay,
+                on_deleted=self._record_deleted,
+                exclude_prefixes={BLOB_PREFIX}
+            )
+            report = (await sweeper.sweep(days, dry_run=dry_run)).to_dict()
             
-            cutoff_date = datetime.now() - timedelta(days=days)
-            files_to_delete = []
+            # Контентно-адресуемые объекты живут, пока на них есть ссылки
+            if not dry_run:
+                cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+                report.update(await self._expire_references(cutoff))
             
-            for file_info in result:
-                # Проверяем дату создания файла
-                created_at = datetime.fromisoformat(
-                    file_info['created_at'].replace('Z', '+00:00')
-                )
-                
-                if created_at < cutoff_date:
-                    files_to_delete.append(file_info['name'])
-            
-            # Удаляем старые файлы
-            if files_to_delete:
-                delete_result = self.supabase.storage.from_(self.bucket_name).remove(
-                    files_to_delete
-                )
-                
-                if delete_result:
-                    logger.info(f"Cleaned up {len(files_to_delete)} old files")
-                    return len(files_to_delete)
-            
-            return 0
+            return report
             
         except Exception as e:
             logger.error(f"Error cleaning up old files: {e}")
-            return 0
+            return {
+                'deleted_files': 0,
+                'bytes_reclaimed': 0,
+                'error': str(e)
+            }
     
     def _validate_file(self, file_data: bytes, filename: str) -> bool:
         """Валидация файла"""
@@ -289,6 +665,68 @@ class StorageManager:
             logger.error(f"Error checking file format: {e}")
             return True  # При ошибке считаем валидным
     
+    async def _expire_references(self, cutoff: datetime) -> dict:
+        """Удалить пачками ссылки старше cutoff и объекты, оставшиеся без ссылок"""
+        batch_size = settings.storage_retention_batch_size
+        expired_references = 0
+        purged_files = 0
+        purged_bytes = 0
+        
+        while True:
+            expired = await self.blob_repository.expire_references(cutoff, batch_size)
+            references, purged = expired["references"], expired["purged"]
+            
+            changes = [
+                self._usage_change(
+                    ref["storage_path"], -1, -ref["stored_size"], user_key=ref["user_key"], physical=False
+                )
+                for ref in references
+            ]
+            
+            if purged:
+                paths = [blob["storage_path"] for blob in purged]
+                await self.backend.remove(self.bucket_name, paths)
+                for path in paths:
+                    self.url_cache.invalidate(path)
+                # Счетчики уменьшаются только по записям, удаленным этим вызовом
+                purged = await self.blob_repository.purge([blob["sha256"] for blob in purged])
+                changes.extend(
+                    self._usage_change(blob["storage_path"], -1, -blob["stored_size"])
+                    for blob in purged
+                )
+            
+            if changes:
+                await self._record_usage(changes)
+            
+            expired_references += len(references)
+            purged_files += len(purged)
+            purged_bytes += sum(blob["stored_size"] for blob in purged)
+            
+            if len(references) < batch_size:
+                break
+            await asyncio.sleep(settings.storage_retention_batch_delay)
+        
+        if expired_references:
+            logger.info(
+                f"Expired {expired_references} file references, deleted {purged_files} "
+                f"unreferenced files ({purged_bytes / (1024 * 1024):.1f} MB)"
+            )
+        return {
+            'expired_references': expired_references,
+            'purged_files': purged_files,
+            'purged_bytes': purged_bytes
+        }
+    
+    @staticmethod
+    def _blob_path(sha256: str, extension: str) -> str:
+        """Путь контентно-адресуемого объекта"""
+        return f"{BLOB_PREFIX}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+    
+    @staticmethod
+    def _is_blob_path(file_path: str) -> bool:
+        """Путь ведет к контентно-адресуемому объекту"""
+        return file_path.startswith(f"{BLOB_PREFIX}/")
+    
     def _generate_file_path(self, filename: str, user_id: int) -> str:
         """Генерировать уникальный путь к файлу"""
         try:
@@ -313,9 +751,14 @@ class StorageManager:
     async def get_user_files(self, user_id: int, limit: int = 100) -> list:
         """Получить список файлов пользователя"""
         try:
+            if self.content_addressed:
+                references = await self.blob_repository.get_user_references(str(user_id), limit)
+                return [reference.model_dump() for reference in references]
+            
             # Ищем файлы в папке пользователя
-            result = self.supabase.storage.from_(self.bucket_name).list(
-                path=str(user_id),
+            result = await self.backend.list(
+                self.bucket_name,
+                prefix=str(user_id),
                 limit=limit
             )
             
@@ -329,34 +772,161 @@ class StorageManager:
             return []
     
     async def get_storage_stats(self) -> dict:
-        """Получить статистику хранилища"""
+        """Получить статистику хранилища (из счетчиков, без листинга bucket)"""
         try:
-            # Получаем список всех файлов
-            result = self.supabase.storage.from_(self.bucket_name).list()
-            
-            if not result:
-                return {
-                    'total_files': 0,
-                    'total_size': 0,
-                    'avg_file_size': 0
+            totals = await self.usage_repository.get_usage("total", "all")
+            by_type = await self.usage_repository.get_usage("type")
+            
+            stats = self._usage_stats(totals[0] if totals else None)
+            stats['by_type'] = {
+                usage.scope_key: {
+                    'files': usage.file_count,
+                    'size': usage.total_bytes
                 }
+                for usage in by_type
+            }
+            stats['archival'] = {
+                'enabled': self.archival is not None,
+                'archived_files': self._archived_files,
+                'bytes_saved': self._archival_bytes_saved
+            }
+            return stats
             
-            total_files = len(result)
-            total_size = sum(file_info.get('metadata', {}).get('size', 0) for file_info in result)
-            avg_file_size = total_size / total_files if total_files > 0 else 0
-            
+        except Exception as e:
+            logger.error(f"Error getting storage stats: {e}")
             return {
-                'total_files': total_files,
-                'total_size': total_size,
-                'avg_file_size': avg_file_size,
-                'total_size_mb': round(total_size / (1024 * 1024), 2)
+                'total_files': 0,
+                'total_size': 0,
+                'avg_file_size': 0,
+                'error': str(e)
             }
+    
+    async def get_user_storage_stats(self, user_id: int) -> dict:
+        """Получить статистику файлов пользователя"""
+        try:
+            usage = await self.usage_repository.get_usage("user", str(user_id))
+            return self._usage_stats(usage[0] if usage else None)
             
         except Exception as e:
-            logger.error(f"Error getting storage stats: {e}")
+            logger.error(f"Error getting user storage stats: {e}")
             return {
                 'total_files': 0,
                 'total_size': 0,
                 'avg_file_size': 0,
                 'error': str(e)
-            } 
\ No newline at end of file
+            }
+    
+    async def reconcile_usage(self) -> dict:
+        """
+        Пересчитать счетчики полным обходом хранилища
+        
+        Исправляет расхождения после сбоев записи счетчиков и удалений в обход приложения.
+        """
+        started = time.monotonic()
+        totals: Dict[Tuple[str, str], List[int]] = defaultdict(lambda: [0, 0])
+        
+        walker = StorageWalker(self.backend, self.bucket_name)
+        async for path, entry in walker.iter_files():
+            user_key, file_type = self._usage_keys(path)
+            size = walker.entry_size(entry)
+            
+            # Счетчики пользователей для общих объектов считаются в БД по ссылкам
+            keys = [("total", "all"), ("type", file_type)]
+            if user_key is not None:
+                keys.append(("user", user_key))
+            
+            for key in keys:
+                totals[key][0] += 1
+                totals[key][1] += size
+        
+        rows = [
+            {"scope": scope, "scope_key": scope_key, "file_count": files, "total_bytes": size}
+            for (scope, scope_key), (files, size) in totals.items()
+        ]
+        await self.usage_repository.replace_all(rows)
+        
+        total_files, total_size = totals.get(("total", "all"), (0, 0))
+        duration = round(time.monotonic() - started, 2)
+        logger.info(
+            f"Storage usage reconciled: {total_files} files, "
+            f"{total_size / (1024 * 1024):.1f} MB in {duration}s"
+        )
+        return {
+            'total_files': total_files,
+            'total_size': total_size,
+            'rows': len(rows),
+            'duration_seconds': duration
+        }
+    
+    async def _record_deleted(self, batch: List[Tuple[str, int]]):
+        """Учесть в счетчиках пачку файлов, удаленных очисткой"""
+        for path, _ in batch:
+            self.url_cache.invalidate(path)
+        await self._record_usage([self._usage_change(path, -1, -size) for path, size in batch])
+    
+    async def _record_usage(self, changes: List[dict]):
+        """Применить изменения счетчиков (см. _usage_change)"""
+        try:
+            await self.usage_repository.apply_changes(changes)
+            
+        except Exception as e:
+            # Расхождение исправит периодическая сверка
+            logger.error(f"Error recording storage usage: {e}")
+    
+    def _usage_change(
+        self, 
+        file_path: str, 
+        files: int, 
+        size: int, 
+        user_key: Optional[str] = None, 
+        physical: bool = True
+    ) -> dict:
+        """
+        Изменение счетчиков для файла
+        
+        Args:
+            user_key: владелец ссылки (по умолчанию - из пути файла; у общих объектов его нет)
+            physical: меняется ли число хранящихся объектов (False - только ссылка пользователя)
+        """
+        path_user_key, file_type = self._usage_keys(file_path)
+        return {
+            "user_key": user_key or path_user_key,
+            "file_type": file_type,
+            "files": files,
+            "bytes": size,
+            "physical": physical
+        }
+    
+    @classmethod
+    def _usage_keys(cls, file_path: str) -> Tuple[Optional[str], str]:
+        """Ключи счетчиков по пути файла: (пользователь или None для общих объектов, тип файла)"""
+        file_type = Path(file_path).suffix.lower().lstrip('.') or "unknown"
+        if cls._is_blob_path(file_path):
+            return None, file_type
+        user_key = file_path.split('/', 1)[0] if '/' in file_path else "unknown"
+        return user_key, file_type
+    
+    @staticmethod
+    def _usage_stats(usage) -> dict:
+        """Статистика в прежнем формате по строке счетчика"""
+        total_files = usage.file_count if usage else 0
+        total_size = usage.total_bytes if usage else 0
+        
+        return {
+            'total_files': total_files,
+            'total_size': total_size,
+            'avg_file_size': total_size / total_files if total_files > 0 else 0,
+            'total_size_mb': round(total_size / (1024 * 1024), 2)
+        }
+
+
+# Глобальный экземпляр (создается при первом обращении)
+_storage_manager: Optional[StorageManager] = None
+
+
+def get_storage_manager() -> StorageManager:
+    """Получить общий для процесса менеджер хранилища"""
+    global _storage_manager
+    if _storage_manager is None:
+        _storage_manager = StorageManager()
+    return _storage_manager
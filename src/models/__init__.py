@@ -3,10 +3,11 @@
 """
 
 from .user import User, UserCreate, UserUpdate
-from .analysis import Analysis, AnalysisCreate, AnalysisUpdate, AnalysisStatus
-from .biomarker import Biomarker, BiomarkerCreate, BiomarkerResult, BiomarkerStatus
+from .analysis import Analysis, AnalysisCreate, AnalysisUpdate, AnalysisStatus, AnalysisListItem
+from .biomarker import Biomarker, BiomarkerCreate, BiomarkerResult, BiomarkerStatus, BiomarkerPoint, BiomarkerTrendSummary, LatestBiomarker
 from .recommendation import Recommendation, RecommendationCreate, RecommendationType, RecommendationPriority
 from .medical_norm import MedicalNorm, MedicalNormCreate
+from .storage import StorageUsage, FileReference
 
 __all__ = [
     "User",
@@ -16,14 +17,20 @@ __all__ = [
     "AnalysisCreate",
     "AnalysisUpdate", 
     "AnalysisStatus",
+    "AnalysisListItem",
     "Biomarker",
     "BiomarkerCreate",
     "BiomarkerResult",
     "BiomarkerStatus",
+    "BiomarkerPoint",
+    "BiomarkerTrendSummary",
+    "LatestBiomarker",
     "Recommendation",
     "RecommendationCreate",
     "RecommendationType",
     "RecommendationPriority",
     "MedicalNorm",
     "MedicalNormCreate",
+    "StorageUsage",
+    "FileReference",
 ] 
\ No newline at end of file
@@ -37,6 +37,7 @@ class AnalysisUpdate(BaseModel):
     """Модель для обновления анализа"""
     status: Optional[AnalysisStatus] = None
     error_message: Optional[str] = None
+    extracted_text: Optional[str] = None
     processing_result: Optional[Dict[str, Any]] = None
     analysis_summary: Optional[str] = None
 
@@ -48,7 +49,8 @@ class Analysis(AnalysisBase):
     uploaded_at: datetime = Field(..., description="Дата загрузки")
     processed_at: Optional[datetime] = Field(None, description="Дата завершения обработки")
     
-    # Результаты обработки
+    # Результаты обработки (extracted_text и processing_result хранятся в
+    # analysis_payloads и заполнены, только если были загружены явно)
     extracted_text: Optional[str] = Field(None, description="Извлеченный текст из файла")
     ocr_confidence: Optional[float] = Field(None, description="Уверенность OCR (0-1)")
     processing_result: Optional[Dict[str, Any]] = Field(None, description="Результат обработки")
@@ -64,4 +66,12 @@ class Analysis(AnalysisBase):
         json_encoders = {
             datetime: lambda v: v.isoformat(),
             UUID: str
-        } 
\ No newline at end of file
+        } 
+
+
+class AnalysisListItem(BaseModel):
+    """Анализ в списке истории - только отображаемые поля"""
+    id: UUID = Field(..., description="UUID анализа")
+    original_filename: str = Field(..., description="Оригинальное имя файла")
+    status: AnalysisStatus = Field(..., description="Статус обработки")
+    uploaded_at: datetime = Field(..., description="Дата загрузки")
@@ -29,7 +29,14 @@ class BiomarkerBase(BaseModel):
 
 class BiomarkerCreate(BiomarkerBase):
     """Модель для создания биомаркера"""
-    pass
+    # Интерпретация сохраняется вместе с показателем
+    status: BiomarkerStatus = Field(default=BiomarkerStatus.UNKNOWN, description="Статус относительно нормы")
+    interpretation: Optional[str] = Field(None, description="Интерпретация показателя")
+    numeric_value: Optional[float] = Field(None, description="Числовое значение (если применимо)")
+    normal_min: Optional[float] = Field(None, description="Минимальная норма")
+    normal_max: Optional[float] = Field(None, description="Максимальная норма")
+    clinical_significance: Optional[str] = Field(None, description="Клиническое значение")
+    recommendations: Optional[str] = Field(None, description="Первичные рекомендации")
 
 
 class BiomarkerResult(BiomarkerBase):
@@ -59,4 +66,44 @@ class BiomarkerResult(BiomarkerBase):
 
 class Biomarker(BiomarkerResult):
     """Полная модель биомаркера (алиас для совместимости)"""
-    pass 
\ No newline at end of file
+    pass 
+
+
+class BiomarkerPoint(BaseModel):
+    """Точка динамики показателя пользователя"""
+    biomarker_key: str = Field(..., description="Единый ключ показателя")
+    name: str = Field(..., description="Название показателя в анализе")
+    measured_at: datetime = Field(..., description="Дата анализа")
+    value: str = Field(..., description="Значение показателя")
+    numeric_value: Optional[float] = Field(None, description="Числовое значение (если применимо)")
+    unit: Optional[str] = Field(None, description="Единица измерения")
+    status: BiomarkerStatus = Field(default=BiomarkerStatus.UNKNOWN, description="Статус относительно нормы")
+    analysis_id: UUID = Field(..., description="ID анализа")
+
+
+class BiomarkerTrendSummary(BaseModel):
+    """Сводка динамики показателя (SQL функция biomarker_trend_summary)"""
+    biomarker_key: str = Field(..., description="Единый ключ показателя")
+    name: str = Field(..., description="Название показателя в последнем анализе")
+    unit: Optional[str] = Field(None, description="Единица измерения")
+    points: int = Field(..., description="Число измерений")
+    latest_value: str = Field(..., description="Последнее значение")
+    latest_numeric: Optional[float] = Field(None, description="Последнее числовое значение")
+    latest_status: BiomarkerStatus = Field(default=BiomarkerStatus.UNKNOWN, description="Последний статус")
+    latest_at: datetime = Field(..., description="Дата последнего измерения")
+    previous_numeric: Optional[float] = Field(None, description="Предыдущее числовое значение")
+    previous_at: Optional[datetime] = Field(None, description="Дата предыдущего измерения")
+    delta: Optional[float] = Field(None, description="Изменение относительно предыдущего")
+    first_at: datetime = Field(..., description="Дата первого измерения")
+
+
+class LatestBiomarker(BaseModel):
+    """Последнее значение показателя пользователя (таблица user_latest_biomarkers)"""
+    biomarker_key: str = Field(..., description="Единый ключ показателя")
+    name: str = Field(..., description="Название показателя в анализе")
+    value: str = Field(..., description="Значение показателя")
+    numeric_value: Optional[float] = Field(None, description="Числовое значение (если применимо)")
+    unit: Optional[str] = Field(None, description="Единица измерения")
+    status: BiomarkerStatus = Field(default=BiomarkerStatus.UNKNOWN, description="Статус относительно нормы")
+    measured_at: datetime = Field(..., description="Дата анализа")
+    analysis_id: UUID = Field(..., description="ID анализа")
@@ -41,6 +41,12 @@ class RecommendationCreate(RecommendationBase):
     biomarker_name: Optional[str] = Field(None, description="Связанный биомаркер")
     target_value: Optional[str] = Field(None, description="Целевое значение")
     timeline: Optional[str] = Field(None, description="Временные рамки")
+    action_items: Optional[Dict[str, Any]] = Field(None, description="Конкретные действия")
+    resources: Optional[Dict[str, Any]] = Field(None, description="Полезные ресурсы")
+    confidence_score: Optional[float] = Field(None, ge=0, le=1, description="Уверенность в рекомендации")
+    scientific_basis: Optional[str] = Field(None, description="Научное обоснование")
+    contraindications: Optional[str] = Field(None, description="Противопоказания")
+    is_personalized: bool = Field(default=True, description="Персонализированная ли рекомендация")
 
 
 class Recommendation(RecommendationBase):
@@ -0,0 +1,26 @@
+"""
+Модели служебных данных хранилища
+"""
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+from pydantic import BaseModel, Field
+
+
+class StorageUsage(BaseModel):
+    """Счетчик файлов и байт в хранилище"""
+    scope: str = Field(..., description="Область: total, user или type")
+    scope_key: str = Field(..., description="Ключ области (all, Telegram ID или тип файла)")
+    file_count: int = Field(0, description="Количество файлов")
+    total_bytes: int = Field(0, description="Суммарный размер в байтах")
+    updated_at: Optional[datetime] = Field(None, description="Дата последнего обновления")
+
+
+class FileReference(BaseModel):
+    """Ссылка пользователя на файл в контентно-адресуемом хранилище"""
+    id: UUID = Field(..., description="UUID ссылки")
+    blob_sha256: str = Field(..., description="SHA-256 исходного файла")
+    user_key: str = Field(..., description="Telegram ID владельца")
+    analysis_id: Optional[UUID] = Field(None, description="ID анализа")
+    filename: Optional[str] = Field(None, description="Имя загруженного файла")
+    created_at: Optional[datetime] = Field(None, description="Дата загрузки")
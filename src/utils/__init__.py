@@ -3,6 +3,6 @@
 """
 
 from .logging_config import setup_logging
-from .medical_data import MedicalDataHelper
+from .medical_data import MedicalDataHelper, canonical_biomarker_name
 
-__all__ = ['setup_logging', 'MedicalDataHelper'] 
\ No newline at end of file
+__all__ = ['setup_logging', 'MedicalDataHelper', 'canonical_biomarker_name'] 
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""
+Периодические фоновые задачи приложения
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """Периодический запуск корутины в фоне текущего event loop"""
+    
+    def __init__(
+        self, 
+        name: str, 
+        func: Callable[[], Awaitable], 
+        interval: float, 
+        initial_delay: float = 0
+    ):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.initial_delay = initial_delay
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """Запустить задачу"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name=self.name)
+            logger.info(f"Periodic task '{self.name}' started (every {self.interval}s)")
+    
+    async def stop(self):
+        """Остановить задачу"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self):
+        """Цикл выполнения"""
+        await asyncio.sleep(self.initial_delay)
+        
+        while True:
+            try:
+                await self.func()
+            except Exception as e:
+                logger.error(f"Periodic task '{self.name}' failed: {e}")
+            
+            await asyncio.sleep(self.interval)
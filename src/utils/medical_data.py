@@ -9,6 +9,11 @@ from enum import Enum
 logger = logging.getLogger(__name__)
 
 
+def _normalize_name(name: str) -> str:
+    """Название без регистра и лишних пробелов"""
+    return " ".join(name.split()).casefold()
+
+
 class AnalysisCategory(Enum):
     """Категории медицинских анализов"""
     BLOOD_GENERAL = "blood_general"
@@ -57,6 +62,7 @@ class MedicalDataHelper:
     def __init__(self):
         self.biomarkers = self._load_biomarkers()
         self.interpretation_rules = self._load_interpretation_rules()
+        self.canonical_keys = self._build_canonical_keys()
     
     def _load_biomarkers(self) -> Dict[str, Biomarker]:
         """Загрузить справочник биомаркеров"""
@@ -377,6 +383,26 @@ class MedicalDataHelper:
             }
         }
     
+    def _build_canonical_keys(self) -> Dict[str, str]:
+        """Точные написания (ключ, название, синонимы) -> ключ справочника"""
+        keys = {}
+        for key, biomarker in self.biomarkers.items():
+            for spelling in [key, biomarker.name, *biomarker.synonyms]:
+                keys.setdefault(_normalize_name(spelling), key)
+        return keys
+    
+    def canonical_key(self, name: str) -> str:
+        """
+        Единый ключ показателя для хранения динамики
+        
+        Известные написания сводятся к ключу справочника (Hb, HGB, Гемоглобин -
+        hemoglobin), остальные - к названию без регистра и лишних пробелов.
+        В отличие от find_biomarker, совпадение только точное: "Гемоглобин
+        гликированный" не должен попасть в ряд гемоглобина.
+        """
+        normalized = _normalize_name(name)
+        return self.canonical_keys.get(normalized, normalized)
+    
     def find_biomarker(self, name: str) -> Optional[Biomarker]:
         """Найти биомаркер по названию или синониму"""
         name_lower = name.lower().strip()
@@ -563,4 +589,16 @@ class MedicalDataHelper:
                 }
                 for r in biomarker.reference_ranges
             ]
-        } 
\ No newline at end of file
+        } 
+
+
+# Справочник неизменяем - один экземпляр на процесс
+_medical_data_helper: Optional[MedicalDataHelper] = None
+
+
+def canonical_biomarker_name(name: str) -> str:
+    """Единый ключ показателя (см. MedicalDataHelper.canonical_key)"""
+    global _medical_data_helper
+    if _medical_data_helper is None:
+        _medical_data_helper = MedicalDataHelper()
+    return _medical_data_helper.canonical_key(name)
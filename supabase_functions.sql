@@ -0,0 +1,686 @@
+-- ============================================
+-- ФУНКЦИИ И СЛУЖЕБНЫЕ ТАБЛИЦЫ
+-- Выполните ПОСЛЕ создания таблиц и индексов
+-- ============================================
+
+-- 1. СЧЕТЧИКИ ИСПОЛЬЗОВАНИЯ ХРАНИЛИЩА
+-- Обновляются приложением при загрузке/удалении файлов,
+-- периодически сверяются с фактическим содержимым bucket'а
+CREATE TABLE IF NOT EXISTS storage_usage (
+    scope VARCHAR(10) NOT NULL CHECK (scope IN ('total', 'user', 'type')),
+    scope_key VARCHAR(255) NOT NULL,
+    file_count BIGINT NOT NULL DEFAULT 0,
+    total_bytes BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (scope, scope_key)
+);
+
+-- Применить пачку изменений:
+-- [{"user_key": "123", "file_type": "pdf", "files": 1, "bytes": 1024, "physical": true}, ...]
+CREATE OR REPLACE FUNCTION storage_usage_apply(p_changes JSONB)
+RETURNS VOID AS $$
+    -- physical = false: только ссылка пользователя на уже хранящийся объект,
+    -- общие счетчики и счетчики типов не меняются
+    WITH changes AS (
+        SELECT * FROM jsonb_to_recordset(p_changes)
+            AS c(user_key TEXT, file_type TEXT, files BIGINT, bytes BIGINT, physical BOOLEAN)
+    ),
+    deltas AS (
+        SELECT 'total' AS scope, 'all' AS scope_key, files, bytes FROM changes
+        WHERE COALESCE(physical, TRUE)
+        UNION ALL
+        SELECT 'user', user_key, files, bytes FROM changes WHERE user_key IS NOT NULL
+        UNION ALL
+        SELECT 'type', file_type, files, bytes FROM changes
+        WHERE file_type IS NOT NULL AND COALESCE(physical, TRUE)
+    ),
+    sums AS (
+        SELECT scope, scope_key, SUM(files) AS files, SUM(bytes) AS bytes
+        FROM deltas
+        GROUP BY scope, scope_key
+    )
+    -- Новая строка начинается с нуля - ее значение ограничивается сразу.
+    -- Для существующей строки берется исходная (в том числе отрицательная)
+    -- сумма из sums: EXCLUDED хранит уже ограниченное значение
+    INSERT INTO storage_usage AS u (scope, scope_key, file_count, total_bytes, updated_at)
+    SELECT scope, scope_key, GREATEST(files, 0), GREATEST(bytes, 0), NOW()
+    FROM sums
+    ON CONFLICT (scope, scope_key) DO UPDATE SET
+        file_count = GREATEST(u.file_count + (
+            SELECT s.files FROM sums s WHERE s.scope = EXCLUDED.scope AND s.scope_key = EXCLUDED.scope_key
+        ), 0),
+        total_bytes = GREATEST(u.total_bytes + (
+            SELECT s.bytes FROM sums s WHERE s.scope = EXCLUDED.scope AND s.scope_key = EXCLUDED.scope_key
+        ), 0),
+        updated_at = NOW();
+$$ LANGUAGE sql;
+
+
+-- 2. КОНТЕНТНО-АДРЕСУЕМОЕ ХРАНЕНИЕ ФАЙЛОВ
+-- Объект хранится один раз по пути objects/ab/cd/<sha256>.<ext>,
+-- загрузки пользователей - ссылки на него со счетчиком ссылок
+CREATE TABLE IF NOT EXISTS file_blobs (
+    sha256 CHAR(64) PRIMARY KEY,  -- SHA-256 исходного (до сжатия) файла
+    storage_path VARCHAR(1000) UNIQUE NOT NULL,
+    original_size BIGINT NOT NULL,
+    stored_size BIGINT NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    -- ref_count = 0: ссылок нет, объект удаляется из хранилища. Строка
+    -- остается до удаления объекта (file_blob_purge), чтобы параллельная
+    -- загрузка того же файла не зарегистрировала удаляемый объект
+    released_at TIMESTAMP WITH TIME ZONE
+);
+
+ALTER TABLE file_blobs ADD COLUMN IF NOT EXISTS released_at TIMESTAMP WITH TIME ZONE;
+-- Объекты без ссылок, не удаленные из хранилища (file_references_expire)
+CREATE INDEX IF NOT EXISTS idx_file_blobs_released ON file_blobs(released_at)
+    WHERE ref_count <= 0;
+
+CREATE TABLE IF NOT EXISTS file_references (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    blob_sha256 CHAR(64) NOT NULL REFERENCES file_blobs(sha256) ON DELETE CASCADE,
+    user_key VARCHAR(64) NOT NULL,  -- Telegram ID, как в путях хранилища
+    analysis_id UUID REFERENCES analyses(id) ON DELETE SET NULL,
+    filename VARCHAR(255),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_file_references_blob_user ON file_references(blob_sha256, user_key);
+CREATE INDEX IF NOT EXISTS idx_file_references_user_key ON file_references(user_key, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_file_references_created_at ON file_references(created_at);
+-- Для ON DELETE SET NULL при удалении анализа
+CREATE INDEX IF NOT EXISTS idx_file_references_analysis_id ON file_references(analysis_id)
+    WHERE analysis_id IS NOT NULL;
+
+-- Сослаться на уже хранящийся объект. NULL - объекта нет (или он удаляется),
+-- его нужно загрузить и зарегистрировать через file_blob_register
+CREATE OR REPLACE FUNCTION file_blob_acquire(p_sha256 TEXT, p_user_key TEXT, p_filename TEXT)
+RETURNS JSONB AS $$
+DECLARE
+    v_blob file_blobs;
+    v_reference_id UUID;
+BEGIN
+    -- sha256 - CHAR(64): без приведения параметра TEXT первичный ключ не используется
+    UPDATE file_blobs SET ref_count = ref_count + 1
+    WHERE sha256 = p_sha256::CHAR(64) AND ref_count > 0
+    RETURNING * INTO v_blob;
+
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO file_references (blob_sha256, user_key, filename)
+    VALUES (p_sha256, p_user_key, p_filename)
+    RETURNING id INTO v_reference_id;
+
+    RETURN jsonb_build_object(
+        'reference_id', v_reference_id,
+        'storage_path', v_blob.storage_path,
+        'stored_size', v_blob.stored_size
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Зарегистрировать загруженный объект и ссылку на него.
+-- created = false: объект успел зарегистрировать параллельный запрос.
+-- NULL - объект с этим хэшем сейчас удаляется, загрузку нужно повторить
+CREATE OR REPLACE FUNCTION file_blob_register(
+    p_sha256 TEXT,
+    p_storage_path TEXT,
+    p_original_size BIGINT,
+    p_stored_size BIGINT,
+    p_user_key TEXT,
+    p_filename TEXT
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_storage_path VARCHAR;
+    v_stored_size BIGINT;
+    v_created BOOLEAN;
+    v_reference_id UUID;
+BEGIN
+    INSERT INTO file_blobs (sha256, storage_path, original_size, stored_size, ref_count)
+    VALUES (p_sha256, p_storage_path, p_original_size, p_stored_size, 1)
+    ON CONFLICT (sha256) DO UPDATE SET ref_count = file_blobs.ref_count + 1
+        WHERE file_blobs.ref_count > 0
+    RETURNING storage_path, stored_size, (xmax = 0)
+    INTO v_storage_path, v_stored_size, v_created;
+
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO file_references (blob_sha256, user_key, filename)
+    VALUES (p_sha256, p_user_key, p_filename)
+    RETURNING id INTO v_reference_id;
+
+    RETURN jsonb_build_object(
+        'reference_id', v_reference_id,
+        'storage_path', v_storage_path,
+        'stored_size', v_stored_size,
+        'created', v_created
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Удалить последнюю ссылку пользователя на объект.
+-- remaining = 0: ссылок не осталось, файл нужно удалить из хранилища
+-- и затем вызвать file_blob_purge
+CREATE OR REPLACE FUNCTION file_blob_release(p_storage_path TEXT, p_user_key TEXT)
+RETURNS JSONB AS $$
+DECLARE
+    v_blob file_blobs;
+    v_reference_id UUID;
+BEGIN
+    SELECT * INTO v_blob FROM file_blobs WHERE storage_path = p_storage_path FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT id INTO v_reference_id FROM file_references
+    WHERE blob_sha256 = v_blob.sha256 AND user_key = p_user_key
+    ORDER BY created_at DESC
+    LIMIT 1;
+
+    IF v_reference_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    DELETE FROM file_references WHERE id = v_reference_id;
+
+    UPDATE file_blobs SET
+        ref_count = GREATEST(ref_count - 1, 0),
+        released_at = CASE WHEN ref_count <= 1 THEN NOW() END
+    WHERE sha256 = v_blob.sha256;
+
+    RETURN jsonb_build_object(
+        'sha256', v_blob.sha256,
+        'stored_size', v_blob.stored_size,
+        'remaining', GREATEST(v_blob.ref_count - 1, 0)
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Удалить пачку ссылок старше p_cutoff. Объекты без ссылок возвращаются в purged
+-- для удаления из хранилища (затем file_blob_purge) - и оставшиеся без ссылок
+-- раньше, но не удаленные дольше p_stale_after (процесс прервался)
+DROP FUNCTION IF EXISTS file_references_expire(TIMESTAMP WITH TIME ZONE, INTEGER);
+CREATE OR REPLACE FUNCTION file_references_expire(
+    p_cutoff TIMESTAMP WITH TIME ZONE,
+    p_limit INTEGER,
+    p_stale_after INTERVAL DEFAULT INTERVAL '1 hour'
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_references JSONB;
+    v_purged JSONB;
+BEGIN
+    WITH expired AS (
+        DELETE FROM file_references
+        WHERE id IN (
+            SELECT id FROM file_references
+            WHERE created_at < p_cutoff
+            ORDER BY created_at
+            LIMIT p_limit
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING blob_sha256, user_key
+    )
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+        'blob_sha256', e.blob_sha256,
+        'user_key', e.user_key,
+        'storage_path', b.storage_path,
+        'stored_size', b.stored_size
+    )), '[]'::jsonb)
+    INTO v_references
+    FROM expired e JOIN file_blobs b ON b.sha256 = e.blob_sha256;
+
+    UPDATE file_blobs b SET
+        ref_count = GREATEST(b.ref_count - c.released, 0),
+        released_at = CASE WHEN b.ref_count - c.released <= 0 THEN NOW() END
+    FROM (
+        SELECT (r->>'blob_sha256')::CHAR(64) AS sha256, COUNT(*) AS released
+        FROM jsonb_array_elements(v_references) r
+        GROUP BY 1
+    ) c
+    WHERE b.sha256 = c.sha256;
+
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+        'sha256', sha256,
+        'storage_path', storage_path,
+        'stored_size', stored_size
+    )), '[]'::jsonb)
+    INTO v_purged
+    FROM (
+        SELECT sha256, storage_path, stored_size FROM file_blobs
+        WHERE ref_count <= 0
+          AND sha256 IN (SELECT (r->>'blob_sha256')::CHAR(64) FROM jsonb_array_elements(v_references) r)
+        UNION
+        (
+            SELECT sha256, storage_path, stored_size FROM file_blobs
+            WHERE ref_count <= 0 AND released_at < NOW() - p_stale_after
+            ORDER BY released_at
+            LIMIT p_limit
+        )
+    ) released;
+
+    RETURN jsonb_build_object('references', v_references, 'purged', v_purged);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Удалить записи объектов без ссылок после удаления файлов из хранилища.
+-- Возвращает удаленные записи: если запись уже удалил другой процесс,
+-- ее нет в ответе и счетчики хранилища повторно не уменьшаются
+CREATE OR REPLACE FUNCTION file_blob_purge(p_sha256 TEXT[])
+RETURNS JSONB AS $$
+    WITH purged AS (
+        DELETE FROM file_blobs
+        WHERE sha256 = ANY(p_sha256::CHAR(64)[]) AND ref_count <= 0
+        RETURNING storage_path, stored_size
+    )
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+        'storage_path', storage_path,
+        'stored_size', stored_size
+    )), '[]'::jsonb)
+    FROM purged;
+$$ LANGUAGE sql;
+
+-- Заменить все счетчики результатом сверки (в одной транзакции).
+-- p_rows - физические объекты по обходу bucket'а; счетчики пользователей
+-- для контентно-адресуемых объектов пересчитываются по file_references
+CREATE OR REPLACE FUNCTION storage_usage_replace(p_rows JSONB)
+RETURNS VOID AS $$
+BEGIN
+    -- WHERE обязателен при включенном pg-safeupdate
+    DELETE FROM storage_usage WHERE TRUE;
+
+    INSERT INTO storage_usage (scope, scope_key, file_count, total_bytes, updated_at)
+    SELECT scope, scope_key, file_count, total_bytes, NOW()
+    FROM jsonb_to_recordset(p_rows)
+        AS r(scope TEXT, scope_key TEXT, file_count BIGINT, total_bytes BIGINT);
+
+    INSERT INTO storage_usage AS u (scope, scope_key, file_count, total_bytes, updated_at)
+    SELECT 'user', r.user_key, COUNT(*), SUM(b.stored_size), NOW()
+    FROM file_references r JOIN file_blobs b ON b.sha256 = r.blob_sha256
+    GROUP BY r.user_key
+    ON CONFLICT (scope, scope_key) DO UPDATE SET
+        file_count = u.file_count + EXCLUDED.file_count,
+        total_bytes = u.total_bytes + EXCLUDED.total_bytes;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE storage_usage ENABLE ROW LEVEL SECURITY;
+ALTER TABLE file_blobs ENABLE ROW LEVEL SECURITY;
+ALTER TABLE file_references ENABLE ROW LEVEL SECURITY;
+
+
+-- 3. СОХРАНЕНИЕ РЕЗУЛЬТАТОВ АНАЛИЗА
+-- Большие поля анализа (текст OCR, результат обработки) хранятся отдельно
+-- от analyses: обновления статуса и списки истории не переписывают и не
+-- читают их. text_encoding = 'zlib' - extracted_text сжат приложением (base64).
+-- Для существующей базы см. supabase_migration_analysis_payloads.sql
+CREATE TABLE IF NOT EXISTS analysis_payloads (
+    analysis_id UUID PRIMARY KEY REFERENCES analyses(id) ON DELETE CASCADE,
+    extracted_text TEXT,
+    text_encoding VARCHAR(10) NOT NULL DEFAULT 'plain' CHECK (text_encoding IN ('plain', 'zlib')),
+    processing_result JSONB,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE analysis_payloads ENABLE ROW LEVEL SECURITY;
+
+-- Ключ показателя без справочника синонимов: та же нормализация, что у
+-- canonical_biomarker_name в приложении (без регистра и лишних пробелов)
+CREATE OR REPLACE FUNCTION biomarker_name_key(p_name TEXT)
+RETURNS TEXT AS $$
+    SELECT lower(regexp_replace(btrim(p_name), '\s+', ' ', 'g'));
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Обновление анализа, большие поля, показатели и рекомендации - одним вызовом
+-- и одной транзакцией. Повторный вызов для того же анализа заменяет прежние
+-- показатели и рекомендации.
+-- p_payload: {"extracted_text": ..., "text_encoding": ..., "processing_result": ...}
+DROP FUNCTION IF EXISTS save_analysis_results(UUID, JSONB, JSONB, JSONB);
+CREATE OR REPLACE FUNCTION save_analysis_results(
+    p_analysis_id UUID,
+    p_analysis JSONB,
+    p_results JSONB,
+    p_recommendations JSONB,
+    p_payload JSONB DEFAULT NULL
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_results INTEGER;
+    v_recommendations INTEGER;
+BEGIN
+    UPDATE analyses SET
+        status = COALESCE(p_analysis->>'status', status),
+        error_message = COALESCE(p_analysis->>'error_message', error_message),
+        analysis_summary = COALESCE(p_analysis->>'analysis_summary', analysis_summary),
+        processed_at = NOW()
+    WHERE id = p_analysis_id;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Analysis % not found', p_analysis_id USING ERRCODE = 'no_data_found';
+    END IF;
+
+    IF p_payload IS NOT NULL THEN
+        INSERT INTO analysis_payloads AS p (analysis_id, extracted_text, text_encoding, processing_result)
+        VALUES (
+            p_analysis_id,
+            p_payload->>'extracted_text',
+            COALESCE(p_payload->>'text_encoding', 'plain'),
+            p_payload->'processing_result'
+        )
+        ON CONFLICT (analysis_id) DO UPDATE SET
+            extracted_text = CASE WHEN p_payload ? 'extracted_text'
+                THEN EXCLUDED.extracted_text ELSE p.extracted_text END,
+            text_encoding = CASE WHEN p_payload ? 'extracted_text'
+                THEN EXCLUDED.text_encoding ELSE p.text_encoding END,
+            processing_result = COALESCE(EXCLUDED.processing_result, p.processing_result),
+            updated_at = NOW();
+    END IF;
+
+    DELETE FROM results WHERE analysis_id = p_analysis_id;
+    DELETE FROM recommendations WHERE analysis_id = p_analysis_id;
+
+    INSERT INTO results (
+        analysis_id, name, value, unit, reference_range, status, interpretation,
+        numeric_value, normal_min, normal_max, clinical_significance, recommendations
+    )
+    SELECT
+        p_analysis_id, r.name, r.value, r.unit, r.reference_range, COALESCE(r.status, 'unknown'),
+        r.interpretation, r.numeric_value, r.normal_min, r.normal_max,
+        r.clinical_significance, r.recommendations
+    FROM jsonb_to_recordset(COALESCE(p_results, '[]'::jsonb)) AS r(
+        name VARCHAR, value VARCHAR, unit VARCHAR, reference_range VARCHAR, status VARCHAR,
+        interpretation TEXT, numeric_value FLOAT, normal_min FLOAT, normal_max FLOAT,
+        clinical_significance TEXT, recommendations TEXT
+    );
+    GET DIAGNOSTICS v_results = ROW_COUNT;
+
+    -- Точки динамики показателей (прежние удалены каскадом вместе с results)
+    INSERT INTO biomarker_series (
+        user_id, biomarker_key, measured_at, analysis_id, result_id,
+        name, value, numeric_value, unit, status
+    )
+    SELECT
+        a.user_id, COALESCE(k.biomarker_key, biomarker_name_key(res.name)), COALESCE(a.uploaded_at, NOW()),
+        res.analysis_id, res.id, res.name, res.value, res.numeric_value, res.unit, res.status
+    FROM results res
+    JOIN analyses a ON a.id = res.analysis_id
+    LEFT JOIN (
+        SELECT DISTINCT r.name, r.biomarker_key
+        FROM jsonb_to_recordset(COALESCE(p_results, '[]'::jsonb)) AS r(name VARCHAR, biomarker_key VARCHAR)
+    ) k ON k.name = res.name
+    WHERE res.analysis_id = p_analysis_id AND a.user_id IS NOT NULL;
+
+    INSERT INTO recommendations (
+        analysis_id, recommendation_text, category, priority, biomarker_name, target_value,
+        timeline, action_items, resources, confidence_score, scientific_basis,
+        contraindications, is_personalized
+    )
+    SELECT
+        p_analysis_id, r.recommendation_text, r.category, COALESCE(r.priority, 'medium'),
+        r.biomarker_name, r.target_value, r.timeline, r.action_items, r.resources,
+        r.confidence_score, r.scientific_basis, r.contraindications,
+        COALESCE(r.is_personalized, TRUE)
+    FROM jsonb_to_recordset(COALESCE(p_recommendations, '[]'::jsonb)) AS r(
+        recommendation_text TEXT, category VARCHAR, priority VARCHAR, biomarker_name VARCHAR,
+        target_value VARCHAR, timeline VARCHAR, action_items JSONB, resources JSONB,
+        confidence_score FLOAT, scientific_basis TEXT, contraindications TEXT,
+        is_personalized BOOLEAN
+    );
+    GET DIAGNOSTICS v_recommendations = ROW_COUNT;
+
+    RETURN jsonb_build_object(
+        'analysis_id', p_analysis_id,
+        'results', v_results,
+        'recommendations', v_recommendations
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- 4. ДИНАМИКА ПОКАЗАТЕЛЕЙ
+-- Точка ряда - показатель из results с пользователем и временем анализа.
+-- biomarker_key - единый ключ показателя (Hb, HGB, Гемоглобин -> hemoglobin),
+-- вычисляется приложением и передается в save_analysis_results
+CREATE TABLE IF NOT EXISTS biomarker_series (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    biomarker_key VARCHAR(255) NOT NULL,
+    measured_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    analysis_id UUID NOT NULL REFERENCES analyses(id) ON DELETE CASCADE,
+    result_id UUID PRIMARY KEY REFERENCES results(id) ON DELETE CASCADE,
+    name VARCHAR(255) NOT NULL,
+    value VARCHAR(255) NOT NULL,
+    numeric_value FLOAT,
+    unit VARCHAR(50),
+    status VARCHAR(20)
+);
+
+-- Ряд пользователя по одному или нескольким показателям в порядке времени
+CREATE INDEX IF NOT EXISTS idx_biomarker_series_user_key_time
+    ON biomarker_series(user_id, biomarker_key, measured_at DESC);
+
+-- Для ON DELETE CASCADE при удалении анализа
+CREATE INDEX IF NOT EXISTS idx_biomarker_series_analysis_id ON biomarker_series(analysis_id);
+
+ALTER TABLE biomarker_series ENABLE ROW LEVEL SECURITY;
+
+-- Сводка динамики: последнее и предыдущее значение, изменение и число
+-- измерений по каждому показателю пользователя - одним небольшим ответом.
+-- p_keys - ключи показателей (NULL - все показатели пользователя)
+CREATE OR REPLACE FUNCTION biomarker_trend_summary(p_user_id UUID, p_keys TEXT[] DEFAULT NULL)
+RETURNS TABLE (
+    biomarker_key VARCHAR,
+    name VARCHAR,
+    unit VARCHAR,
+    points BIGINT,
+    latest_value VARCHAR,
+    latest_numeric FLOAT,
+    latest_status VARCHAR,
+    latest_at TIMESTAMP WITH TIME ZONE,
+    previous_numeric FLOAT,
+    previous_at TIMESTAMP WITH TIME ZONE,
+    delta FLOAT,
+    first_at TIMESTAMP WITH TIME ZONE
+) AS $$
+    SELECT
+        t.biomarker_key, t.name, t.unit, t.points,
+        t.value, t.numeric_value, t.status, t.measured_at,
+        t.previous_numeric, t.previous_at,
+        t.numeric_value - t.previous_numeric,
+        t.first_at
+    FROM (
+        SELECT
+            s.*,
+            ROW_NUMBER() OVER w AS position,
+            LEAD(s.numeric_value) OVER w AS previous_numeric,
+            LEAD(s.measured_at) OVER w AS previous_at,
+            COUNT(*) OVER (PARTITION BY s.biomarker_key) AS points,
+            MIN(s.measured_at) OVER (PARTITION BY s.biomarker_key) AS first_at
+        FROM biomarker_series s
+        WHERE s.user_id = p_user_id
+          AND (p_keys IS NULL OR s.biomarker_key = ANY(p_keys))
+        WINDOW w AS (PARTITION BY s.biomarker_key ORDER BY s.measured_at DESC, s.result_id DESC)
+    ) t
+    WHERE t.position = 1
+    ORDER BY t.biomarker_key;
+$$ LANGUAGE sql STABLE;
+
+-- Названия показателей, записанные в ряд, с их ключами (для перевода на
+-- ключи справочника: python -m src.database.rekey)
+CREATE OR REPLACE FUNCTION biomarker_series_spellings()
+RETURNS TABLE (name VARCHAR, biomarker_key VARCHAR) AS $$
+    SELECT DISTINCT s.name, s.biomarker_key FROM biomarker_series s;
+$$ LANGUAGE sql STABLE;
+
+-- Сменить ключи показателей: p_keys - {название: ключ}, ключи вычисляет
+-- приложение (canonical_biomarker_name). Снимок последних значений
+-- обновляют триггеры на UPDATE
+CREATE OR REPLACE FUNCTION biomarker_series_rekey(p_keys JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+    v_count INTEGER;
+BEGIN
+    UPDATE biomarker_series s
+    SET biomarker_key = k.value
+    FROM jsonb_each_text(p_keys) k
+    WHERE s.name = k.key
+      AND s.biomarker_key <> k.value;
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Заполнение по уже сохраненным результатам. Нормализация та же, что у
+-- canonical_biomarker_name (без регистра и лишних пробелов), но синонимы
+-- справочника здесь не сводятся - после заполнения выполните
+-- python -m src.database.rekey
+INSERT INTO biomarker_series (
+    user_id, biomarker_key, measured_at, analysis_id, result_id,
+    name, value, numeric_value, unit, status
+)
+SELECT
+    a.user_id, biomarker_name_key(res.name), COALESCE(a.uploaded_at, NOW()),
+    res.analysis_id, res.id, res.name, res.value, res.numeric_value, res.unit, res.status
+FROM results res
+JOIN analyses a ON a.id = res.analysis_id
+WHERE a.user_id IS NOT NULL
+ON CONFLICT (result_id) DO NOTHING;
+
+
+-- 5. ПОСЛЕДНИЕ ЗНАЧЕНИЯ ПОКАЗАТЕЛЕЙ ПОЛЬЗОВАТЕЛЯ
+-- Снимок "текущей картины": последнее измерение каждого показателя.
+-- Поддерживается триггерами biomarker_series: после каждого оператора
+-- обновляются только затронутые пары (пользователь, показатель)
+CREATE TABLE IF NOT EXISTS user_latest_biomarkers (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    biomarker_key VARCHAR(255) NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    value VARCHAR(255) NOT NULL,
+    numeric_value FLOAT,
+    unit VARCHAR(50),
+    status VARCHAR(20),
+    measured_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    analysis_id UUID NOT NULL,
+    result_id UUID NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (user_id, biomarker_key)
+);
+
+ALTER TABLE user_latest_biomarkers ENABLE ROW LEVEL SECURITY;
+
+-- Вставка: последнее из добавленных измерений пары заменяет снимок,
+-- только если оно новее. Без этого параллельное сохранение или повторная
+-- обработка старого анализа перезаписали бы более новое значение
+CREATE OR REPLACE FUNCTION user_latest_biomarkers_sync()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO user_latest_biomarkers AS u (
+        user_id, biomarker_key, name, value, numeric_value, unit, status,
+        measured_at, analysis_id, result_id, updated_at
+    )
+    SELECT DISTINCT ON (c.user_id, c.biomarker_key)
+        c.user_id, c.biomarker_key, c.name, c.value, c.numeric_value, c.unit, c.status,
+        c.measured_at, c.analysis_id, c.result_id, NOW()
+    FROM changed_rows c
+    ORDER BY c.user_id, c.biomarker_key, c.measured_at DESC, c.result_id DESC
+    ON CONFLICT (user_id, biomarker_key) DO UPDATE SET
+        name = EXCLUDED.name,
+        value = EXCLUDED.value,
+        numeric_value = EXCLUDED.numeric_value,
+        unit = EXCLUDED.unit,
+        status = EXCLUDED.status,
+        measured_at = EXCLUDED.measured_at,
+        analysis_id = EXCLUDED.analysis_id,
+        result_id = EXCLUDED.result_id,
+        updated_at = NOW()
+    WHERE (EXCLUDED.measured_at, EXCLUDED.result_id) > (u.measured_at, u.result_id);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Удаление (и прежняя версия измененной строки): если это измерение из
+-- снимка, пара пересчитывается по оставшемуся ряду (одна строка из
+-- составного индекса), а без измерений удаляется
+CREATE OR REPLACE FUNCTION user_latest_biomarkers_resync()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE user_latest_biomarkers u SET
+        name = l.name,
+        value = l.value,
+        numeric_value = l.numeric_value,
+        unit = l.unit,
+        status = l.status,
+        measured_at = l.measured_at,
+        analysis_id = l.analysis_id,
+        result_id = l.result_id,
+        updated_at = NOW()
+    FROM changed_rows c
+    CROSS JOIN LATERAL (
+        SELECT s.*
+        FROM biomarker_series s
+        WHERE s.user_id = c.user_id AND s.biomarker_key = c.biomarker_key
+        ORDER BY s.measured_at DESC, s.result_id DESC
+        LIMIT 1
+    ) l
+    WHERE u.user_id = c.user_id
+      AND u.biomarker_key = c.biomarker_key
+      AND u.result_id = c.result_id;
+
+    -- Пары, у которых не осталось измерений
+    DELETE FROM user_latest_biomarkers u
+    USING changed_rows c
+    WHERE u.user_id = c.user_id
+      AND u.biomarker_key = c.biomarker_key
+      AND u.result_id = c.result_id
+      AND NOT EXISTS (
+          SELECT 1 FROM biomarker_series s
+          WHERE s.user_id = c.user_id AND s.biomarker_key = c.biomarker_key
+      );
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS biomarker_series_latest_insert ON biomarker_series;
+CREATE TRIGGER biomarker_series_latest_insert
+    AFTER INSERT ON biomarker_series
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_latest_biomarkers_sync();
+
+DROP TRIGGER IF EXISTS biomarker_series_latest_delete ON biomarker_series;
+CREATE TRIGGER biomarker_series_latest_delete
+    AFTER DELETE ON biomarker_series
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_latest_biomarkers_resync();
+
+-- Изменение строки (смена ключа показателя) - удаление прежней и вставка новой
+DROP TRIGGER IF EXISTS biomarker_series_latest_update_old ON biomarker_series;
+CREATE TRIGGER biomarker_series_latest_update_old
+    AFTER UPDATE ON biomarker_series
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_latest_biomarkers_resync();
+
+DROP TRIGGER IF EXISTS biomarker_series_latest_update_new ON biomarker_series;
+CREATE TRIGGER biomarker_series_latest_update_new
+    AFTER UPDATE ON biomarker_series
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_latest_biomarkers_sync();
+
+-- Заполнение по уже сохраненной динамике
+INSERT INTO user_latest_biomarkers (
+    user_id, biomarker_key, name, value, numeric_value, unit, status,
+    measured_at, analysis_id, result_id
+)
+SELECT DISTINCT ON (user_id, biomarker_key)
+    user_id, biomarker_key, name, value, numeric_value, unit, status,
+    measured_at, analysis_id, result_id
+FROM biomarker_series
+ORDER BY user_id, biomarker_key, measured_at DESC, result_id DESC
+ON CONFLICT (user_id, biomarker_key) DO NOTHING;
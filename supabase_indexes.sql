@@ -4,13 +4,13 @@
 -- ============================================
 
 -- Индексы для пользователей
-CREATE INDEX idx_users_telegram_id ON users(telegram_id);
+-- (поиск по telegram_id обслуживает индекс ограничения UNIQUE)
 CREATE INDEX idx_users_active ON users(is_active);
 
 -- Индексы для анализов
-CREATE INDEX idx_analyses_user_id ON analyses(user_id);
+-- История пользователя: user_id = ? ORDER BY uploaded_at DESC, id DESC (пагинация по ключу)
+CREATE INDEX idx_analyses_user_uploaded ON analyses(user_id, uploaded_at DESC, id DESC);
 CREATE INDEX idx_analyses_status ON analyses(status);
-CREATE INDEX idx_analyses_uploaded_at ON analyses(uploaded_at);
 
 -- Индексы для результатов
 CREATE INDEX idx_results_analysis_id ON results(analysis_id);
@@ -23,6 +23,7 @@ CREATE INDEX idx_recommendations_category ON recommendations(category);
 CREATE INDEX idx_recommendations_priority ON recommendations(priority);
 
 -- Индексы для медицинских норм
-CREATE INDEX idx_medical_norms_biomarker ON medical_norms(biomarker_name);
-CREATE INDEX idx_medical_norms_active ON medical_norms(is_active);
+-- Поиск нормы: только активные нормы по биомаркеру и полу
+CREATE INDEX idx_medical_norms_active_biomarker ON medical_norms(biomarker_name, gender)
+    WHERE is_active;
 CREATE INDEX idx_medical_norms_gender_age ON medical_norms(gender, age_min, age_max); 
\ No newline at end of file
@@ -0,0 +1,28 @@
+-- ============================================
+-- ПЕРЕНОС БОЛЬШИХ ПОЛЕЙ АНАЛИЗА В analysis_payloads
+-- Для базы, созданной до разделения таблиц.
+-- Выполните ПОСЛЕ supabase_functions.sql (таблица analysis_payloads уже создана)
+-- ============================================
+
+BEGIN;
+
+-- Перенос данных: текст переносится как есть (text_encoding = 'plain'),
+-- сжатие применяется приложением к новым записям
+INSERT INTO analysis_payloads (analysis_id, extracted_text, text_encoding, processing_result)
+SELECT id, extracted_text, 'plain', processing_result
+FROM analyses
+WHERE extracted_text IS NOT NULL OR processing_result IS NOT NULL
+ON CONFLICT (analysis_id) DO NOTHING;
+
+ALTER TABLE analyses
+    DROP COLUMN IF EXISTS extracted_text,
+    DROP COLUMN IF EXISTS processing_result;
+
+COMMIT;
+
+-- Проверка: большие поля остались только в analysis_payloads
+SELECT COUNT(*) AS payloads FROM analysis_payloads;
+
+-- DROP COLUMN не переписывает таблицу: место освобождается по мере
+-- обновления строк. Сжать таблицу сразу (блокирует ее на время выполнения):
+-- VACUUM FULL ANALYZE analyses;
@@ -0,0 +1,44 @@
+-- ============================================
+-- СОСТАВНЫЕ И ЧАСТИЧНЫЕ ИНДЕКСЫ ПОД ЗАПРОСЫ ПРИЛОЖЕНИЯ
+-- Для базы, созданной с прежним supabase_indexes.sql / supabase_schema.sql.
+-- Выполните ПОСЛЕ supabase_functions.sql
+-- ============================================
+
+-- Построение индекса блокирует запись в таблицу. Для большой таблицы
+-- выполните команды по одной через psql с CREATE INDEX CONCURRENTLY
+-- (вне транзакции).
+
+-- История пользователя: user_id = ? ORDER BY uploaded_at DESC, id DESC
+CREATE INDEX IF NOT EXISTS idx_analyses_user_uploaded ON analyses(user_id, uploaded_at DESC, id DESC);
+
+-- Поиск нормы: только активные нормы по биомаркеру и полу
+CREATE INDEX IF NOT EXISTS idx_medical_norms_active_biomarker ON medical_norms(biomarker_name, gender)
+    WHERE is_active;
+
+-- Внешние ключи на analyses: удаление анализа без просмотра всей таблицы
+CREATE INDEX IF NOT EXISTS idx_biomarker_series_analysis_id ON biomarker_series(analysis_id);
+CREATE INDEX IF NOT EXISTS idx_file_references_analysis_id ON file_references(analysis_id)
+    WHERE analysis_id IS NOT NULL;
+
+-- Объекты без ссылок, не удаленные из хранилища (file_references_expire)
+CREATE INDEX IF NOT EXISTS idx_file_blobs_released ON file_blobs(released_at)
+    WHERE ref_count <= 0;
+
+-- Индексы, которые покрываются новыми (совпадающий префикс) или
+-- индексом ограничения UNIQUE(telegram_id)
+DROP INDEX IF EXISTS idx_analyses_user_id;
+-- Все запросы по uploaded_at фильтруют по user_id. Общий индекс не нужен
+-- и уводит планировщик в обратный проход по всей таблице с фильтром
+-- вместо чтения истории пользователя
+DROP INDEX IF EXISTS idx_analyses_uploaded_at;
+DROP INDEX IF EXISTS idx_medical_norms_biomarker;
+DROP INDEX IF EXISTS idx_medical_norms_active;
+DROP INDEX IF EXISTS idx_users_telegram_id;
+
+ANALYZE analyses;
+ANALYZE medical_norms;
+ANALYZE biomarker_series;
+ANALYZE file_references;
+ANALYZE file_blobs;
+
+-- Проверка планов: supabase_plan_check.sql
@@ -0,0 +1,258 @@
+-- ============================================
+-- ПРОВЕРКА ПЛАНОВ ЗАПРОСОВ ПРИЛОЖЕНИЯ
+-- Выполняйте на локальной или тестовой базе со схемой (после supabase_functions.sql):
+--     psql -v ON_ERROR_STOP=1 -f supabase_plan_check.sql
+--
+-- Скрипт в одной транзакции заполняет таблицы данными реалистичного объема,
+-- собирает статистику и для каждого запроса репозиториев проверяет EXPLAIN:
+-- запрос читает таблицу через ожидаемый индекс, без Seq Scan, а запросы с
+-- ORDER BY, которые индекс отдает в нужном порядке, - без отдельной сортировки.
+-- Расхождение прерывает скрипт с ошибкой, в конце все изменения откатываются.
+-- ============================================
+
+BEGIN;
+
+-- 1. ДАННЫЕ
+-- 5 000 пользователей по 10 анализов и один постоянный пользователь (telegram_id = -1)
+-- с 2 000 анализов; на анализ 8 показателей и 4 рекомендации
+INSERT INTO users (id, telegram_id, first_name)
+SELECT gen_random_uuid(), -g, 'Plan check ' || g
+FROM generate_series(1, 5000) AS g;
+
+INSERT INTO analyses (id, user_id, file_path, original_filename, file_type, file_size, status, uploaded_at)
+SELECT
+    gen_random_uuid(), u.id, 'plan-check/' || u.telegram_id || '/' || n || '.pdf', n || '.pdf', 'pdf', 1024,
+    CASE WHEN n % 10 = 0 THEN 'failed' ELSE 'completed' END,
+    -- Анализы каждого пользователя равномерно за последние три года
+    NOW() - make_interval(secs => n * CASE WHEN u.telegram_id = -1 THEN 47304 ELSE 9460800 END
+        + abs(u.telegram_id) % 86400)
+FROM users u
+CROSS JOIN generate_series(1, 2000) AS n
+WHERE u.telegram_id < 0 AND (n <= 10 OR u.telegram_id = -1);
+
+INSERT INTO results (id, analysis_id, name, value, unit, status, numeric_value)
+SELECT gen_random_uuid(), a.id, 'Показатель ' || k, (4 + k % 3)::TEXT, 'ед.', 'normal', 4 + k % 3
+FROM analyses a
+JOIN users u ON u.id = a.user_id AND u.telegram_id < 0
+CROSS JOIN generate_series(1, 8) AS k;
+
+INSERT INTO recommendations (analysis_id, recommendation_text, category, priority)
+SELECT a.id, 'Рекомендация ' || k, 'general', (ARRAY['low', 'medium', 'high', 'critical'])[k]
+FROM analyses a
+JOIN users u ON u.id = a.user_id AND u.telegram_id < 0
+CROSS JOIN generate_series(1, 4) AS k;
+
+INSERT INTO biomarker_series (
+    user_id, biomarker_key, measured_at, analysis_id, result_id, name, value, numeric_value, unit, status
+)
+SELECT a.user_id, biomarker_name_key(res.name), a.uploaded_at, a.id, res.id, res.name, res.value, res.numeric_value, res.unit, res.status
+FROM results res
+JOIN analyses a ON a.id = res.analysis_id
+JOIN users u ON u.id = a.user_id AND u.telegram_id < 0;
+
+-- 500 биомаркеров по 8 норм (пол x возраст), каждая четвертая - прежняя версия
+INSERT INTO medical_norms (biomarker_name, unit, min_value, max_value, gender, age_min, age_max, is_active)
+SELECT
+    'Plan check ' || b, 'ед.', 1, 10,
+    (ARRAY['M', 'F'])[1 + v % 2], (v / 2) * 30, (v / 2) * 30 + 29, v % 4 <> 3
+FROM generate_series(1, 500) AS b
+CROSS JOIN generate_series(0, 7) AS v;
+
+INSERT INTO file_blobs (sha256, storage_path, original_size, stored_size, ref_count)
+SELECT lpad(to_hex(g), 64, '0'), 'plan-check/' || g, 1024, 1024, 1
+FROM generate_series(1, 50000) AS g;
+
+-- Объекты без ссылок, которые еще предстоит удалить из хранилища
+INSERT INTO file_blobs (sha256, storage_path, original_size, stored_size, ref_count, released_at)
+SELECT lpad(to_hex(g), 64, '0'), 'plan-check/' || g, 1024, 1024, 0, NOW() - make_interval(mins => g - 50000)
+FROM generate_series(50001, 50500) AS g;
+
+-- Ссылки на файлы: половина привязана к анализам
+INSERT INTO file_references (blob_sha256, user_key, analysis_id, created_at)
+SELECT
+    lpad(to_hex(g), 64, '0'), (g % 5000)::TEXT,
+    CASE WHEN g % 2 = 0 THEN a.id END,
+    NOW() - make_interval(hours => g)
+FROM generate_series(1, 50000) AS g
+JOIN (SELECT id, row_number() OVER (ORDER BY id) AS n FROM analyses) AS a ON a.n = g;
+
+ANALYZE users;
+ANALYZE analyses;
+ANALYZE results;
+ANALYZE recommendations;
+ANALYZE biomarker_series;
+ANALYZE user_latest_biomarkers;
+ANALYZE medical_norms;
+ANALYZE file_blobs;
+ANALYZE file_references;
+
+
+-- 2. ПРОВЕРКА
+-- План запроса должен читать таблицу через p_index, без Seq Scan, а если
+-- p_ordered - еще и без узлов сортировки (порядок дает индекс)
+CREATE FUNCTION pg_temp.plan_check(p_name TEXT, p_query TEXT, p_index TEXT, p_ordered BOOLEAN DEFAULT FALSE)
+RETURNS VOID AS $$
+DECLARE
+    v_line TEXT;
+    v_plan TEXT := '';
+BEGIN
+    FOR v_line IN EXECUTE 'EXPLAIN ' || p_query LOOP
+        v_plan := v_plan || v_line || E'\n';
+    END LOOP;
+
+    IF v_plan LIKE '%Seq Scan%' THEN
+        RAISE EXCEPTION 'Plan check "%": sequential scan%', p_name, E'\n' || v_plan;
+    END IF;
+
+    IF v_plan NOT LIKE '%' || p_index || '%' THEN
+        RAISE EXCEPTION 'Plan check "%": index % not used%', p_name, p_index, E'\n' || v_plan;
+    END IF;
+
+    IF p_ordered AND v_plan LIKE '%Sort%' THEN
+        RAISE EXCEPTION 'Plan check "%": unexpected sort%', p_name, E'\n' || v_plan;
+    END IF;
+
+    RAISE NOTICE 'Plan check "%": ok (%)', p_name, p_index;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    v_user users%ROWTYPE;
+    v_analysis analyses%ROWTYPE;
+BEGIN
+    -- Постоянный пользователь: для него порядок из индекса важнее всего
+    SELECT * INTO v_user FROM users WHERE telegram_id = -1;
+    SELECT * INTO v_analysis FROM analyses WHERE user_id = v_user.id ORDER BY uploaded_at DESC LIMIT 1 OFFSET 100;
+
+    -- UserRepository
+    PERFORM pg_temp.plan_check(
+        'user by telegram_id',
+        format('SELECT * FROM users WHERE telegram_id = %s', v_user.telegram_id),
+        'users_telegram_id_key'
+    );
+
+    -- AnalysisRepository: история (первая и следующая страница) и последние анализы
+    PERFORM pg_temp.plan_check(
+        'history first page',
+        format(
+            'SELECT id, original_filename, status, uploaded_at FROM analyses WHERE user_id = %L '
+            'ORDER BY uploaded_at DESC, id DESC LIMIT 11',
+            v_user.id
+        ),
+        'idx_analyses_user_uploaded', TRUE
+    );
+    PERFORM pg_temp.plan_check(
+        'history next page',
+        format(
+            'SELECT id, original_filename, status, uploaded_at FROM analyses WHERE user_id = %L '
+            'AND uploaded_at <= %L AND (uploaded_at < %L OR (uploaded_at = %L AND id < %L)) '
+            'ORDER BY uploaded_at DESC, id DESC LIMIT 11',
+            v_user.id, v_analysis.uploaded_at, v_analysis.uploaded_at, v_analysis.uploaded_at, v_analysis.id
+        ),
+        'idx_analyses_user_uploaded', TRUE
+    );
+    PERFORM pg_temp.plan_check(
+        'user analyses',
+        format('SELECT * FROM analyses WHERE user_id = %L ORDER BY uploaded_at DESC LIMIT 10', v_user.id),
+        'idx_analyses_user_uploaded', TRUE
+    );
+
+    -- BiomarkerRepository и RecommendationRepository
+    PERFORM pg_temp.plan_check(
+        'analysis biomarkers',
+        format('SELECT * FROM results WHERE analysis_id = %L', v_analysis.id),
+        'idx_results_analysis_id'
+    );
+    PERFORM pg_temp.plan_check(
+        'analysis recommendations',
+        format('SELECT * FROM recommendations WHERE analysis_id = %L ORDER BY priority DESC', v_analysis.id),
+        'idx_recommendations_analysis_id'
+    );
+    PERFORM pg_temp.plan_check(
+        'biomarker series',
+        format(
+            'SELECT * FROM biomarker_series WHERE user_id = %L AND biomarker_key IN (%L, %L) '
+            'ORDER BY biomarker_key, measured_at, result_id',
+            v_user.id, 'показатель 1', 'показатель 2'
+        ),
+        'idx_biomarker_series_user_key_time'
+    );
+    PERFORM pg_temp.plan_check(
+        'latest biomarkers',
+        format('SELECT * FROM user_latest_biomarkers WHERE user_id = %L ORDER BY biomarker_key', v_user.id),
+        'user_latest_biomarkers_pkey', TRUE
+    );
+
+    -- MedicalNormRepository
+    PERFORM pg_temp.plan_check(
+        'active norm by biomarker',
+        'SELECT * FROM medical_norms WHERE biomarker_name = ''Plan check 42'' AND is_active '
+        'AND gender IN (''M'', ''BOTH'')',
+        'idx_medical_norms_active_biomarker'
+    );
+
+    -- FileBlobRepository
+    PERFORM pg_temp.plan_check(
+        'user file references',
+        format('SELECT * FROM file_references WHERE user_key = %L ORDER BY created_at DESC LIMIT 20', '42'),
+        'idx_file_references_user_key'
+    );
+    PERFORM pg_temp.plan_check(
+        'acquire blob',
+        format(
+            'UPDATE file_blobs SET ref_count = ref_count + 1 WHERE sha256 = %L::TEXT::CHAR(64) AND ref_count > 0',
+            lpad(to_hex(42), 64, '0')
+        ),
+        'file_blobs_pkey'
+    );
+    PERFORM pg_temp.plan_check(
+        'release blob',
+        format('SELECT * FROM file_blobs WHERE storage_path = %L::TEXT FOR UPDATE', 'plan-check/42'),
+        'file_blobs_storage_path_key'
+    );
+    PERFORM pg_temp.plan_check(
+        'purge blobs',
+        format(
+            'DELETE FROM file_blobs WHERE sha256 = ANY(ARRAY[%L, %L]::TEXT[]::CHAR(64)[]) AND ref_count <= 0',
+            lpad(to_hex(50001), 64, '0'), lpad(to_hex(50002), 64, '0')
+        ),
+        'file_blobs_pkey'
+    );
+
+    -- file_references_expire: пачка старых ссылок и объекты без ссылок
+    PERFORM pg_temp.plan_check(
+        'expired file references',
+        format(
+            'SELECT id FROM file_references WHERE created_at < %L ORDER BY created_at LIMIT 500 FOR UPDATE SKIP LOCKED',
+            NOW() - INTERVAL '30 days'
+        ),
+        'idx_file_references_created_at', TRUE
+    );
+    PERFORM pg_temp.plan_check(
+        'stale released blobs',
+        'SELECT sha256, storage_path, stored_size FROM file_blobs '
+        'WHERE ref_count <= 0 AND released_at < NOW() - INTERVAL ''1 hour'' ORDER BY released_at LIMIT 500',
+        'idx_file_blobs_released', TRUE
+    );
+
+    -- save_analysis_results и удаление анализа (внешние ключи)
+    PERFORM pg_temp.plan_check(
+        'replace recommendations',
+        format('DELETE FROM recommendations WHERE analysis_id = %L', v_analysis.id),
+        'idx_recommendations_analysis_id'
+    );
+    PERFORM pg_temp.plan_check(
+        'cascade to biomarker series',
+        format('DELETE FROM biomarker_series WHERE analysis_id = %L', v_analysis.id),
+        'idx_biomarker_series_analysis_id'
+    );
+    PERFORM pg_temp.plan_check(
+        'detach file references',
+        format('UPDATE file_references SET analysis_id = NULL WHERE analysis_id = %L', v_analysis.id),
+        'idx_file_references_analysis_id'
+    );
+END;
+$$;
+
+ROLLBACK;
@@ -20,7 +20,7 @@ CREATE TABLE IF NOT EXISTS users (
 );
 
 -- Индексы для пользователей
-CREATE INDEX IF NOT EXISTS idx_users_telegram_id ON users(telegram_id);
+-- (поиск по telegram_id обслуживает индекс ограничения UNIQUE)
 CREATE INDEX IF NOT EXISTS idx_users_active ON users(is_active);
 
 -- 2. ТАБЛИЦА АНАЛИЗОВ
@@ -34,9 +34,7 @@ CREATE TABLE IF NOT EXISTS analyses (
     status VARCHAR(20) DEFAULT 'pending' CHECK (status IN ('pending', 'uploading', 'processing', 'analyzing', 'completed', 'failed', 'error')),
     uploaded_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     processed_at TIMESTAMP WITH TIME ZONE,
-    extracted_text TEXT,
     ocr_confidence FLOAT CHECK (ocr_confidence >= 0 AND ocr_confidence <= 1),
-    processing_result JSONB,
     analysis_summary TEXT,
     processing_time_seconds FLOAT CHECK (processing_time_seconds >= 0),
     ai_tokens_used INTEGER CHECK (ai_tokens_used >= 0),
@@ -44,9 +42,9 @@ CREATE TABLE IF NOT EXISTS analyses (
 );
 
 -- Индексы для анализов
-CREATE INDEX IF NOT EXISTS idx_analyses_user_id ON analyses(user_id);
+-- История пользователя: user_id = ? ORDER BY uploaded_at DESC, id DESC (пагинация по ключу)
+CREATE INDEX IF NOT EXISTS idx_analyses_user_uploaded ON analyses(user_id, uploaded_at DESC, id DESC);
 CREATE INDEX IF NOT EXISTS idx_analyses_status ON analyses(status);
-CREATE INDEX IF NOT EXISTS idx_analyses_uploaded_at ON analyses(uploaded_at);
 
 -- 3. ТАБЛИЦА РЕЗУЛЬТАТОВ БИОМАРКЕРОВ
 CREATE TABLE IF NOT EXISTS results (
@@ -114,8 +112,9 @@ CREATE TABLE IF NOT EXISTS medical_norms (
 );
 
 -- Индексы для медицинских норм
-CREATE INDEX IF NOT EXISTS idx_medical_norms_biomarker ON medical_norms(biomarker_name);
-CREATE INDEX IF NOT EXISTS idx_medical_norms_active ON medical_norms(is_active);
+-- Поиск нормы: только активные нормы по биомаркеру и полу
+CREATE INDEX IF NOT EXISTS idx_medical_norms_active_biomarker ON medical_norms(biomarker_name, gender)
+    WHERE is_active;
 CREATE INDEX IF NOT EXISTS idx_medical_norms_gender_age ON medical_norms(gender, age_min, age_max);
 
 -- ============================================
@@ -30,9 +30,7 @@ CREATE TABLE analyses (
     status VARCHAR(20) DEFAULT 'pending' CHECK (status IN ('pending', 'uploading', 'processing', 'analyzing', 'completed', 'failed', 'error')),
     uploaded_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     processed_at TIMESTAMP WITH TIME ZONE,
-    extracted_text TEXT,
     ocr_confidence FLOAT CHECK (ocr_confidence >= 0 AND ocr_confidence <= 1),
-    processing_result JSONB,
     analysis_summary TEXT,
     processing_time_seconds FLOAT CHECK (processing_time_seconds >= 0),
     ai_tokens_used INTEGER CHECK (ai_tokens_used >= 0),
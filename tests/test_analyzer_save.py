@@ -0,0 +1,94 @@
+"""
+Тесты сохранения итога анализа (MedicalAnalyzer.analyze_results)
+"""
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+from src.ai.analyzer import MedicalAnalyzer
+from src.models import (
+    AnalysisStatus, BiomarkerResult, Recommendation, RecommendationType, RecommendationPriority
+)
+
+
+class FakeAnalysisRepository:
+    """Репозиторий анализов в памяти; save_analysis_results может падать"""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.saved = []
+        self.updates = []
+
+    async def save_analysis_results(self, analysis_id, update_data, biomarkers, recommendations):
+        if self.fail:
+            raise RuntimeError("save_analysis_results: connection reset")
+        self.saved.append((analysis_id, update_data, biomarkers, recommendations))
+        return {"analysis_id": str(analysis_id), "results": len(biomarkers), "recommendations": len(recommendations)}
+
+    async def update_analysis(self, analysis_id, update_data):
+        self.updates.append((analysis_id, update_data))
+
+
+def _analyzer(repository: FakeAnalysisRepository) -> MedicalAnalyzer:
+    """Анализатор без LLM: извлечение и рекомендации подставлены"""
+    analyzer = MedicalAnalyzer.__new__(MedicalAnalyzer)
+    analyzer.analysis_repository = repository
+
+    async def extract_biomarkers(text):
+        return [{"name": "Гемоглобин", "value": "140", "unit": "г/л"}]
+
+    async def interpret_biomarkers(biomarkers_data, user=None):
+        return [
+            BiomarkerResult.model_construct(
+                id=None, analysis_id=None, name="Гемоглобин", value="140", unit="г/л",
+                status="normal", numeric_value=140.0
+            )
+        ]
+
+    async def generate_recommendations(biomarkers, user=None, analysis=None):
+        return [
+            Recommendation.model_construct(
+                id=None, analysis_id=None, recommendation_text="Пить воду",
+                category=RecommendationType.GENERAL, priority=RecommendationPriority.LOW,
+                confidence_score=0.8, is_personalized=True
+            )
+        ]
+
+    async def get_user(user_id):
+        return None
+
+    analyzer.extract_biomarkers = extract_biomarkers
+    analyzer.interpret_biomarkers = interpret_biomarkers
+    analyzer.generate_recommendations = generate_recommendations
+    analyzer._get_user = get_user
+    return analyzer
+
+
+def _analysis():
+    return SimpleNamespace(id=uuid.uuid4(), user_id=uuid.uuid4(), extracted_text="Гемоглобин 140 г/л")
+
+
+def test_failed_save_marks_analysis_failed_and_returns_nothing():
+    repository = FakeAnalysisRepository(fail=True)
+    analysis = _analysis()
+
+    recommendations = asyncio.run(_analyzer(repository).analyze_results(analysis))
+
+    assert recommendations == []
+    assert len(repository.updates) == 1
+    analysis_id, update = repository.updates[0]
+    assert analysis_id == analysis.id
+    assert update.status == AnalysisStatus.FAILED
+    assert update.error_message
+
+
+def test_successful_save_returns_recommendations():
+    repository = FakeAnalysisRepository()
+    analysis = _analysis()
+
+    recommendations = asyncio.run(_analyzer(repository).analyze_results(analysis))
+
+    assert [r.recommendation_text for r in recommendations] == ["Пить воду"]
+    assert repository.updates == []
+    assert len(repository.saved) == 1
+    assert repository.saved[0][1].status == AnalysisStatus.COMPLETED
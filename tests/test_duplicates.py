@@ -0,0 +1,105 @@
+"""
+Тесты повторной отправки анализов (DuplicateIndex и FileProcessor._handle_duplicate)
+"""
+import asyncio
+import io
+
+from PIL import Image, ImageDraw
+
+from src.file_processing.dedup import DuplicateIndex
+from src.file_processing.processor import FileProcessor
+
+
+def _lab_form(values) -> bytes:
+    """Бланк анализа одного шаблона с заданными значениями"""
+    image = Image.new("L", (600, 800), 255)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((20, 20, 580, 90), outline=0, width=3)
+    draw.text((40, 45), "CLINICAL LABORATORY - COMPLETE BLOOD COUNT", fill=0)
+    for row, (name, value) in enumerate(zip(("WBC", "RBC", "HGB", "PLT", "ALT"), values)):
+        y = 130 + row * 50
+        draw.line((20, y + 30, 580, y + 30), fill=0)
+        draw.text((40, y), name, fill=0)
+        draw.text((400, y), value, fill=0)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _processor(policy: str = "off") -> FileProcessor:
+    """Процессор без хранилища и OCR: обработка только отмечает вызов"""
+    processor = FileProcessor.__new__(FileProcessor)
+    processor.duplicate_index = DuplicateIndex()
+    processor.duplicate_policy = policy
+    processor.supported_formats = {".png": None}
+    processor.calls = []
+
+    async def store_and_extract(file_data, filename, file_extension, user_id):
+        processor.calls.append(filename)
+        return {
+            "success": True,
+            "file_path": f"{user_id}/{filename}",
+            "extracted_text": f"text of {filename}",
+            "file_info": {"filename": filename},
+            "duplicate": False
+        }
+
+    processor._store_and_extract = store_and_extract
+    return processor
+
+
+FIRST = _lab_form(["6.1", "4.52", "138", "250", "21"])
+SECOND = _lab_form(["9.8", "3.97", "112", "184", "64"])
+
+
+def test_same_template_forms_are_near_duplicates():
+    """Бланки одного шаблона неотличимы по dHash - иначе тесты ниже ничего не проверяют"""
+    index = DuplicateIndex()
+    index.add(1, index.fingerprint(FIRST, ".png"), {"file_path": "first"})
+
+    match = index.find(1, index.fingerprint(SECOND, ".png"))
+
+    assert match is not None
+    assert not match["exact"]
+
+
+def test_same_template_with_other_values_is_processed_again():
+    processor = _processor()
+
+    first = asyncio.run(processor.process_file(FIRST, "first.png", 1))
+    second = asyncio.run(processor.process_file(SECOND, "second.png", 1))
+
+    assert processor.calls == ["first.png", "second.png"]
+    assert second["extracted_text"] == "text of second.png"
+    assert not second["duplicate"]
+    assert first["file_path"] != second["file_path"]
+
+
+def test_prompt_policy_asks_before_processing_similar_image():
+    processor = _processor("prompt")
+
+    asyncio.run(processor.process_file(FIRST, "first.png", 1))
+    second = asyncio.run(processor.process_file(SECOND, "second.png", 1))
+
+    assert not second["success"]
+    assert second["duplicate"]
+    assert "extracted_text" not in second
+    assert processor.calls == ["first.png"]
+
+    confirmed = asyncio.run(processor.process_file(SECOND, "second.png", 1, allow_duplicate=True))
+
+    assert confirmed["extracted_text"] == "text of second.png"
+    assert processor.calls == ["first.png", "second.png"]
+
+
+def test_identical_file_reuses_previous_result():
+    processor = _processor()
+
+    asyncio.run(processor.process_file(FIRST, "first.png", 1))
+    again = asyncio.run(processor.process_file(FIRST, "again.png", 1))
+
+    assert processor.calls == ["first.png"]
+    assert again["duplicate"]
+    assert again["duplicate_of"]["exact"]
+    assert again["extracted_text"] == "text of first.png"